@@ -5,6 +5,7 @@ file management, and project documentation.
 
 from .comment_extractor import CommentProcessor, main as comment_extractor_main
 from .merger import SmartFileMerger, main as merger_main
+from .splitter import MergedFileSplitter, main as splitter_main
 from .tree_generater import ProjectTreeGenerator, main as tree_generator_main
 
 __version__ = "1.0.0"
@@ -14,8 +15,10 @@ __email__ = "NoN"
 __all__ = [
     "CommentProcessor",
     "SmartFileMerger",
+    "MergedFileSplitter",
     "ProjectTreeGenerator",
     "comment_extractor_main",
     "merger_main",
+    "splitter_main",
     "tree_generator_main",
 ]
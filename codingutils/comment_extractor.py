@@ -14,13 +14,14 @@ from __future__ import annotations
 import argparse
 import json
 import logging
+import os
 import re
 import shutil
 import sys
 import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 from codingutils.common_utils import (
     FilterConfig,
@@ -28,6 +29,7 @@ from codingutils.common_utils import (
     FileSystemWalker,
     FileType,
     GitIgnoreParser,
+    ScopedGitIgnoreParser,
     ProgressReporter,
     get_relative_path,
     safe_write,
@@ -70,6 +72,7 @@ class CommentExtractorConfig(FilterConfig):
 
     use_cache: bool = True
     min_langdetect_len: int = 20
+    stream_files: bool = False
 
 
     keep_backups: bool = False
@@ -489,10 +492,12 @@ class CommentProcessor:
         parser: Optional[GitIgnoreParser] = None
         if config.use_gitignore or config.custom_gitignore:
             root_dir = Path(config.directories[0]).resolve() if config.directories else Path.cwd().resolve()
-            parser = GitIgnoreParser(root_dir=root_dir)
             if config.custom_gitignore:
+                parser = GitIgnoreParser(root_dir=root_dir)
                 parser.load_from_file(config.custom_gitignore)
             else:
+                # Auto-discovery also honours nested .gitignore files, read lazily during the walk
+                parser = ScopedGitIgnoreParser(root_dir=root_dir)
                 parser.load_from_file()
         return FileSystemWalker(config, parser)
 
@@ -509,20 +514,40 @@ class CommentProcessor:
         )
         return files
 
+    def iter_files(self) -> Iterator[Path]:
+        """Stream files to process while the walk is running (per-directory sorted order)."""
+        roots = [Path(d).resolve() for d in (self.config.directories or ["."])]
+        yield from self.file_walker.iter_files(roots, recursive=self.config.recursive, ordered=True)
+
+        stats = self.file_walker.stats
+        logger.info(
+            "Excluded %d files and %d directories",
+            stats.get("files_excluded", 0),
+            stats.get("directories_excluded", 0),
+        )
+
     def process_files(self) -> Dict[str, Any]:
-        files = self.find_files()
-        if not files:
-            logger.warning("No files found matching criteria")
-            return {"total_files": 0, "total_comments": 0, "removed_comments": 0, "comments": []}
+        if self.config.stream_files:
+            # Total is unknown while streaming, so progress output is disabled.
+            files: Iterable[Path] = self.iter_files()
+            progress_total = 0
+        else:
+            files = self.find_files()
+            if not files:
+                logger.warning("No files found matching criteria")
+                return {"total_files": 0, "total_comments": 0, "removed_comments": 0, "comments": []}
+            progress_total = len(files)
 
         self._log_configuration()
 
+        total_files = 0
         total_removed = 0
         total_comments = 0
         all_comments: List[Dict[str, Any]] = []
 
-        with ProgressReporter(total=len(files), description="Extracting comments") as progress:
+        with ProgressReporter(total=progress_total, description="Extracting comments") as progress:
             for p in files:
+                total_files += 1
                 try:
                     removed, matches = self.process_file(p)
                     total_removed += removed
@@ -549,35 +574,43 @@ class CommentProcessor:
 
                 progress.update(1)
 
-        self._log_summary(total_removed, total_comments, len(files))
+        if total_files == 0:
+            logger.warning("No files found matching criteria")
+            return {"total_files": 0, "total_comments": 0, "removed_comments": 0, "comments": []}
+
+        self._log_summary(total_removed, total_comments, total_files)
 
         if self.config.export_file and all_comments:
             self._export_comments(all_comments, Path(self.config.export_file))
 
         return {
-            "total_files": len(files),
+            "total_files": total_files,
             "total_comments": total_comments,
             "removed_comments": total_removed,
             "comments": all_comments,
         }
 
     def process_file(self, file_path: Path) -> Tuple[int, List[CommentMatch]]:
-        if FileContentDetector.detect_file_type(file_path) != FileType.TEXT:
+        try:
+            st: Optional[os.stat_result] = file_path.stat()
+            mtime = st.st_mtime
+        except Exception:
+            st = None
+            mtime = -1.0
+
+        probe = FileContentDetector.probe(file_path, st)
+        if probe.file_type != FileType.TEXT:
             logger.debug("Skipping non-text file: %s", file_path)
             return 0, []
 
         cache_key = str(file_path)
-        try:
-            mtime = file_path.stat().st_mtime
-        except Exception:
-            mtime = -1.0
 
         if self._cache is not None and cache_key in self._cache:
             cached_mtime, cached_result = self._cache[cache_key]
             if cached_mtime == mtime:
                 return cached_result
 
-        encoding = FileContentDetector.detect_encoding(file_path)
+        encoding = probe.encoding
         try:
             with open(file_path, "r", encoding=encoding, errors="strict") as f:
                 lines = f.readlines()
@@ -886,6 +919,10 @@ def parse_arguments(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
     parser.add_argument("-en", "--exclude-name", action="append", dest="exclude_names", help="Exclude file wildcard")
     parser.add_argument("-ep", "--exclude-pattern", action="append", dest="exclude_patterns", help="Exclude path wildcard")
     parser.add_argument("--max-depth", type=int, help="Maximum recursion depth")
+    parser.add_argument("--walk-workers", type=int, default=1, help="Threads listing directories concurrently (default: 1)")
+    parser.add_argument("--walk-snapshot", type=Path, help="Snapshot file for incremental re-scans of unchanged directories")
+    parser.add_argument("--git-index", action="store_const", const="git-index", default="filesystem", dest="file_source", help="Take tracked files from .git/index instead of walking directories")
+    parser.add_argument("--include-untracked", action="store_true", help="With --git-index: also include untracked files")
 
 
     parser.add_argument("-ig", "--use-gitignore", action="store_true", help="Auto-discover and use .gitignore")
@@ -899,6 +936,7 @@ def parse_arguments(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
 
 
     parser.add_argument("--no-cache", action="store_true", help="Disable caching")
+    parser.add_argument("--stream", action="store_true", dest="stream_files", help="Process files while the walk is running (no progress bar)")
     parser.add_argument("--min-langdetect-len", type=int, default=20, help="Min length for language detection")
 
 
@@ -928,6 +966,10 @@ def create_config_from_args(args: argparse.Namespace) -> CommentExtractorConfig:
         exclude_names=set(args.exclude_names or []),
         exclude_patterns=set(args.exclude_patterns or []),
         max_depth=args.max_depth,
+        walk_workers=args.walk_workers,
+        walk_snapshot=args.walk_snapshot,
+        file_source=args.file_source,
+        include_untracked=bool(args.include_untracked),
         use_gitignore=use_gitignore,
         custom_gitignore=custom_gitignore,
         comment_symbols=args.comment_symbols,
@@ -939,6 +981,7 @@ def create_config_from_args(args: argparse.Namespace) -> CommentExtractorConfig:
         log_file=args.output,
         use_cache=not args.no_cache,
         min_langdetect_len=int(args.min_langdetect_len),
+        stream_files=bool(args.stream_files),
         keep_backups=bool(args.keep_backups) or bool(args.backup_dir),
         backup_dir=args.backup_dir,
         overwrite_backups=bool(args.overwrite_backups),
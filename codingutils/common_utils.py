@@ -13,22 +13,43 @@ Includes:
 
 from __future__ import annotations
 
+import bisect
+import bz2
+import codecs
 import fnmatch
+import hashlib
+import io
+import json
 import logging
+import lzma
+import os
+import re
 import shutil
+import stat as stat_module
+import struct
 import sys
+import tarfile
+import threading
 import time
-from dataclasses import dataclass, field
+import zipfile
+import zlib
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, fields
 from enum import Enum
 from functools import wraps
 from pathlib import Path
-from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 
 
 # ============================================================================
 # Configuration Classes
 # ============================================================================
 
+WALK_ENGINES: Tuple[str, ...] = ("scandir", "pathlib")
+FILE_SOURCES: Tuple[str, ...] = ("filesystem", "git-index")
+
+
 @dataclass(slots=True)
 class FilterConfig:
     """Configuration for file filtering across scripts."""
@@ -51,9 +72,51 @@ class FilterConfig:
 
     recursive: bool = True
 
+    # Directory listing backend: "scandir" (default) or legacy "pathlib"
+    walk_engine: str = "scandir"
+    # Threads listing directories concurrently (1 = sequential walk)
+    walk_workers: int = 1
+    # On-disk snapshot of the last walk for incremental re-scans (see WalkSnapshot)
+    walk_snapshot: Optional[Path] = None
+    # File discovery: "filesystem" walk, or tracked files read from .git/index ("git-index")
+    file_source: str = "filesystem"
+    # With file_source="git-index": also walk the tree for untracked files
+    include_untracked: bool = False
+
     def __post_init__(self) -> None:
         if self.max_depth is not None and self.max_depth < 0:
             raise ValueError("max_depth must be non-negative")
+        if self.walk_engine not in WALK_ENGINES:
+            raise ValueError(f"Unsupported walk_engine: {self.walk_engine}")
+        if self.walk_workers < 1:
+            raise ValueError("walk_workers must be at least 1")
+        if self.file_source not in FILE_SOURCES:
+            raise ValueError(f"Unsupported file_source: {self.file_source}")
+
+    def fingerprint(self, *extra: object) -> str:
+        """
+        Stable hash of the filter settings (plus `extra` values, e.g. roots).
+
+        Only FilterConfig fields that affect which paths are selected are
+        included; tool-specific fields of subclasses are not.
+        """
+        ignored = {"directories", "walk_workers", "walk_snapshot"}
+        values: Dict[str, Any] = {}
+        for f in fields(FilterConfig):
+            if f.name in ignored:
+                continue
+            value = getattr(self, f.name)
+            if isinstance(value, (set, frozenset)):
+                value = sorted(value)
+            elif isinstance(value, Path):
+                value = str(value)
+            values[f.name] = value
+        payload = json.dumps([values, [str(x) for x in extra]], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def compile_matcher(self, *, dir_probe: bool = False) -> "FilterMatcher":
+        """Compile exclude/include rules into a `FilterMatcher` (see there for `dir_probe`)."""
+        return FilterMatcher(self, dir_probe=dir_probe)
 
 
 class FileType(Enum):
@@ -63,10 +126,140 @@ class FileType(Enum):
     UNKNOWN = "unknown"
 
 
+# ============================================================================
+# Filter Matcher
+# ============================================================================
+
+class _GlobSet:
+    """fnmatchcase() against several patterns: literals via a set, globs via one regex."""
+
+    __slots__ = ("_literals", "_regex")
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        globs = []
+        self._literals: Set[str] = set()
+        for pat in patterns:
+            if any(c in pat for c in "*?["):
+                globs.append(fnmatch.translate(pat))
+            else:
+                self._literals.add(pat)
+        self._regex = re.compile("|".join(globs)).match if globs else None
+
+    def __bool__(self) -> bool:
+        return bool(self._literals) or self._regex is not None
+
+    def match(self, text: str) -> bool:
+        if text in self._literals:
+            return True
+        return self._regex is not None and self._regex(text) is not None
+
+
+class FilterMatcher:
+    """
+    FilterConfig exclude/include rules compiled once for per-path checks.
+
+    - exclude_dirs: set lookup on the segments of the root-relative path
+    - exclude_names: matched against the basename
+    - exclude_patterns: matched against the basename or the root-relative path
+    - include_pattern: files only, matched against the basename
+
+    Literal names are set lookups, globs are folded into a single regex per
+    rule kind; results equal fnmatch.fnmatchcase() over each pattern.
+
+    Callers pass the root-relative POSIX path (see `relative_posix`) so no
+    resolve() is needed per path; `needs_rel` tells whether it is used at all.
+    With `dir_probe`, a directory is also excluded when a pattern matches a
+    path inside it ("docs/*" excludes docs/ itself).
+    """
+
+    __slots__ = ("_dirs", "_names", "_patterns", "_include", "_include_all", "dir_probe", "needs_rel")
+
+    def __init__(self, config: FilterConfig, *, dir_probe: bool = False) -> None:
+        self._dirs: Set[str] = {d for d in config.exclude_dirs if d}
+        self._names = _GlobSet(config.exclude_names)
+        self._patterns = _GlobSet(config.exclude_patterns)
+        self._include = _GlobSet([config.include_pattern])
+        self._include_all = config.include_pattern == "*"
+        self.dir_probe = dir_probe
+        self.needs_rel = bool(self._dirs) or bool(self._patterns)
+
+    @staticmethod
+    def relative_posix(path: Path, root: Path) -> Optional[str]:
+        """
+        Lexical `path.relative_to(root).as_posix()` for paths built from `root`
+        during a walk ("." for the root itself); None if path is not below root.
+        """
+        p, r = str(path), str(root)
+        if p == r:
+            return "."
+        prefix = r if r.endswith(os.sep) else r + os.sep
+        if not p.startswith(prefix):
+            return None
+        rel = p[len(prefix):]
+        return rel.replace(os.sep, "/") if os.sep != "/" else rel
+
+    def excludes(self, name: str, rel: Optional[str], *, is_dir: bool) -> bool:
+        """True if a path with basename `name` and root-relative path `rel` is excluded."""
+        if is_dir and self._dirs and rel is not None and rel != ".":
+            if not self._dirs.isdisjoint(rel.split("/")):
+                return True
+
+        if self._names and self._names.match(name):
+            return True
+
+        if self._patterns:
+            if self._patterns.match(name):
+                return True
+            if rel is not None:
+                if self._patterns.match(rel):
+                    return True
+                if is_dir and self.dir_probe and self._patterns.match(rel.rstrip("/") + "/__x__"):
+                    return True
+
+        if not is_dir and not self._include_all and not self._include.match(name):
+            return True
+
+        return False
+
+
 # ============================================================================
 # GitIgnore Parser (simplified semantics)
 # ============================================================================
 
+class _DecisionCache(OrderedDict):
+    """
+    LRU mapping (ignore decisions, content probes) with hit/miss/eviction counters.
+
+    Behaves like a plain dict for lookups and `in`; `maxsize=None` means unbounded.
+    """
+
+    def __init__(self, maxsize: Optional[int]) -> None:
+        super().__init__()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key: Any) -> Any:
+        """Return the cached value (marking it recently used) or None."""
+        try:
+            value = self[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def store(self, key: Any, value: Any) -> None:
+        self[key] = value
+        self.move_to_end(key)
+        if self.maxsize is not None:
+            while len(self) > self.maxsize:
+                self.popitem(last=False)
+                self.evictions += 1
+
+
 class GitIgnoreParser:
     """
     Simplified .gitignore parser.
@@ -76,13 +269,35 @@ class GitIgnoreParser:
     - Supports glob tokens: *, ?, [], and ** (as "any directories")
     - Matching is done against a posix-style relative path from `root_dir`
     - This is not a full reimplementation of gitignore, but stable and testable.
+
+    With compiled=True (default) all patterns are translated once into grouped
+    lookups and regex alternations, see `_CompiledIgnoreMatcher`;
+    compiled=False uses the per-pattern fnmatch loop.
+    Both modes give identical decisions.
+
+    Decisions are kept in a bounded LRU cache (`cache_size` entries, None for
+    unbounded), see `cache_stats`. Directory verdicts are cached too: anything
+    inside an ignored directory is ignored (as in git), so a cached parent
+    verdict answers its children without matching them.
     """
 
-    def __init__(self, root_dir: Optional[Path] = None) -> None:
+    DEFAULT_CACHE_SIZE = 65536
+
+    def __init__(
+        self,
+        root_dir: Optional[Path] = None,
+        *,
+        compiled: bool = True,
+        cache_size: Optional[int] = DEFAULT_CACHE_SIZE,
+    ) -> None:
+        if cache_size is not None and cache_size < 0:
+            raise ValueError("cache_size must be non-negative")
         self.root_dir = (root_dir or Path.cwd()).resolve()
         self.patterns: List[str] = []
+        self.compiled = compiled
         # Tests expect cache keys to be exactly str(path)
-        self._cache: Dict[str, bool] = {}
+        self._cache = _DecisionCache(cache_size)
+        self._matcher: Optional[_CompiledIgnoreMatcher] = None
 
     def load_from_file(self, gitignore_path: Optional[Path] = None) -> bool:
         """
@@ -93,7 +308,7 @@ class GitIgnoreParser:
         if gitignore_path is not None:
             loaded = self._parse_single_file(gitignore_path)
             if loaded:
-                self._cache.clear()
+                self._invalidate()
             return loaded
 
         found = False
@@ -102,7 +317,7 @@ class GitIgnoreParser:
                 found = True
 
         if found:
-            self._cache.clear()
+            self._invalidate()
         return found
 
     def _discover_gitignore_files(self) -> Iterable[Path]:
@@ -131,41 +346,95 @@ class GitIgnoreParser:
 
     def add_pattern(self, pattern: str) -> None:
         self.patterns.append(pattern)
+        self._invalidate()
+
+    def _invalidate(self) -> None:
+        """Drop cached decisions and the compiled matcher after pattern changes."""
         self._cache.clear()
+        self._matcher = None
 
-    def should_ignore(self, path: Path) -> bool:
+    def should_ignore(self, path: Path, *, is_dir: Optional[bool] = None) -> bool:
         """
         Return True if path should be ignored based on loaded patterns.
 
         `path` is expected to be an absolute path or a path under root_dir.
+        `is_dir` may be passed by walkers that already know the entry type
+        (e.g. from os.DirEntry) to avoid an extra stat() call.
         """
         cache_key = str(path)
-        if cache_key in self._cache:
-            return self._cache[cache_key]
+        cached = self._cache.lookup(cache_key)
+        if cached is not None:
+            return cached
 
         # We intentionally use filesystem info; caller code walks real FS.
-        is_dir = path.is_dir()
+        if is_dir is None:
+            is_dir = path.is_dir()
 
         try:
-            rel_path = path.resolve().relative_to(self.root_dir)
+            rel_parts = path.resolve().relative_to(self.root_dir).parts
         except Exception:
             # Not under root -> by design return False, but still cache it (tests expect this)
-            self._cache[cache_key] = False
+            self._cache.store(cache_key, False)
             return False
 
-        rel_str = rel_path.as_posix()
+        ignored = False
+        if len(rel_parts) > 1:
+            # Parent verdict is normally cached already (walkers check directories first)
+            ignored = self.should_ignore(self.root_dir.joinpath(*rel_parts[:-1]), is_dir=True)
+
+        if not ignored:
+            ignored = bool(self._decide_parts(rel_parts, is_dir=is_dir))
+
+        self._cache.store(cache_key, ignored)
+        return ignored
+
+    @property
+    def cache_stats(self) -> Dict[str, Optional[int]]:
+        """Decision cache counters: hits, misses, evictions, size and maxsize."""
+        return {
+            "hits": self._cache.hits,
+            "misses": self._cache.misses,
+            "evictions": self._cache.evictions,
+            "size": len(self._cache),
+            "maxsize": self._cache.maxsize,
+        }
+
+    def should_prune(self, path: Path) -> bool:
+        """
+        Return True if directory `path` is ignored, so walkers can skip
+        its whole subtree without listing it.
+        """
+        return self.should_ignore(path, is_dir=True)
+
+    def _decide_parts(self, rel_parts: Sequence[str], *, is_dir: bool) -> Optional[bool]:
+        """Decide for a path given as root-relative parts (empty for the root itself)."""
+        return self._decide("/".join(rel_parts) or ".", is_dir=is_dir)
+
+    def _decide(self, rel_str: str, *, is_dir: bool) -> Optional[bool]:
+        """
+        Evaluate own patterns against a root-relative posix path.
+
+        Returns None if no pattern matched, otherwise the decision of the last
+        matching pattern (False for a negation).
+        """
+        if self.compiled:
+            if self._matcher is None:
+                self._matcher = _CompiledIgnoreMatcher(self.patterns)
+            return self._matcher.match(rel_str, is_dir=is_dir)
+        return self._match_all(rel_str, is_dir=is_dir)
+
+    def _match_all(self, rel_str: str, *, is_dir: bool) -> Optional[bool]:
+        """Interpreted matching: evaluate every pattern in order, last match wins."""
         rel_parts = rel_str.split("/") if rel_str else []
 
-        ignored = False
+        decision: Optional[bool] = None
         for pattern in self.patterns:
             negated = pattern.startswith("!")
             pat = pattern[1:] if negated else pattern
 
             if self._match(rel_str, rel_parts, pat, is_dir=is_dir):
-                ignored = not negated
-
-        self._cache[cache_key] = ignored
-        return ignored
+                decision = not negated
+        return decision
 
     def _match(self, rel_str: str, rel_parts: List[str], pattern: str, *, is_dir: bool) -> bool:
         """Match gitignore-like pattern against a relative posix path."""
@@ -269,16 +538,1196 @@ class GitIgnoreParser:
         return j == len(pat_parts)
 
 
+class ScopedGitIgnoreParser(GitIgnoreParser):
+    """
+    GitIgnoreParser that also honours .gitignore files in subdirectories.
+
+    - Patterns from load_from_file()/add_pattern() apply relative to root_dir,
+      exactly as in GitIgnoreParser
+    - <dir>/.gitignore below root_dir is read lazily, the first time a path
+      inside <dir> is checked (i.e. when a walker enters <dir>); its patterns
+      are relative to <dir>
+    - The nearest .gitignore with a matching pattern decides (deeper files
+      take precedence, as in git)
+    - Ignored directories are reported by `should_prune()`; walkers skip
+      them, so their .gitignore files are never read
+    """
+
+    def __init__(
+        self,
+        root_dir: Optional[Path] = None,
+        *,
+        compiled: bool = True,
+        cache_size: Optional[int] = GitIgnoreParser.DEFAULT_CACHE_SIZE,
+    ) -> None:
+        super().__init__(root_dir, compiled=compiled, cache_size=cache_size)
+        # Subdirectory -> parser for its own .gitignore (None if it has none)
+        self._scopes: Dict[Path, Optional[GitIgnoreParser]] = {}
+
+    def _decide_parts(self, rel_parts: Sequence[str], *, is_dir: bool) -> Optional[bool]:
+        # Nearest .gitignore with a matching pattern wins, root-level patterns last
+        for depth in range(len(rel_parts) - 1, 0, -1):
+            scope = self._scope_for(self.root_dir.joinpath(*rel_parts[:depth]))
+            if scope is not None:
+                decision = scope._decide("/".join(rel_parts[depth:]), is_dir=is_dir)
+                if decision is not None:
+                    return decision
+        return super()._decide_parts(rel_parts, is_dir=is_dir)
+
+    def add_scope(self, directory: Path, lines: Iterable[str]) -> None:
+        """
+        Use `lines` as the .gitignore of `directory` instead of reading it from
+        disk (for trees that are not on disk, such as archive members). At
+        root_dir they are added to the root patterns.
+        """
+        patterns = [line.strip() for line in lines]
+        patterns = [p for p in patterns if p and not p.startswith("#")]
+        directory = Path(directory)
+        if directory == self.root_dir:
+            self.patterns.extend(patterns)
+        else:
+            scope = GitIgnoreParser(directory, compiled=self.compiled, cache_size=0)
+            scope.patterns.extend(patterns)
+            self._scopes[directory] = scope if patterns else None
+        self._invalidate()
+
+    def _scope_for(self, directory: Path) -> Optional[GitIgnoreParser]:
+        """Return the parser for `directory`'s own .gitignore, loading it on first use."""
+        if directory in self._scopes:
+            return self._scopes[directory]
+
+        scope: Optional[GitIgnoreParser] = None
+        gitignore_path = directory / ".gitignore"
+        if gitignore_path.is_file():
+            scope = GitIgnoreParser(directory, compiled=self.compiled, cache_size=0)
+            if not scope.load_from_file(gitignore_path) or not scope.patterns:
+                scope = None
+
+        self._scopes[directory] = scope
+        return scope
+
+
+_ANY_SEGMENT = "[^/]*/"
+
+
+def _glob_segment_to_regex(seg: str) -> str:
+    """
+    Translate one glob path segment to a regex that never crosses '/'.
+
+    Mirrors fnmatch.translate() (same bracket/range rules), except that
+    '*', '?' and character classes are confined to a single segment.
+    """
+    res: List[str] = []
+    i, n = 0, len(seg)
+    while i < n:
+        c = seg[i]
+        i += 1
+        if c == "*":
+            if not res or res[-1] != "[^/]*":
+                res.append("[^/]*")
+        elif c == "?":
+            res.append("[^/]")
+        elif c == "[":
+            j = i
+            if j < n and seg[j] == "!":
+                j += 1
+            if j < n and seg[j] == "]":
+                j += 1
+            while j < n and seg[j] != "]":
+                j += 1
+            if j >= n:
+                res.append("\\[")
+                continue
+            stuff = seg[i:j]
+            if "-" not in stuff:
+                stuff = stuff.replace("\\", r"\\")
+            else:
+                chunks: List[str] = []
+                k = i + 2 if seg[i] == "!" else i + 1
+                while True:
+                    k = seg.find("-", k, j)
+                    if k < 0:
+                        break
+                    chunks.append(seg[i:k])
+                    i = k + 1
+                    k = k + 3
+                chunk = seg[i:j]
+                if chunk:
+                    chunks.append(chunk)
+                else:
+                    chunks[-1] += "-"
+                # Remove empty ranges -- invalid in RE.
+                for k in range(len(chunks) - 1, 0, -1):
+                    if chunks[k - 1][-1] > chunks[k][0]:
+                        chunks[k - 1] = chunks[k - 1][:-1] + chunks[k][1:]
+                        del chunks[k]
+                stuff = "-".join(s.replace("\\", r"\\").replace("-", r"\-") for s in chunks)
+            stuff = re.sub(r"([&~|])", r"\\\1", stuff)
+            i = j + 1
+            if not stuff:
+                res.append("(?!)")
+            elif stuff == "!":
+                res.append("[^/]")
+            else:
+                if stuff[0] == "!":
+                    stuff = "^" + stuff[1:]
+                elif stuff[0] in ("^", "["):
+                    stuff = "\\" + stuff
+                res.append(f"(?!/)[{stuff}]")
+        else:
+            res.append(re.escape(c))
+    return "".join(res)
+
+
+class _CompiledIgnoreMatcher:
+    """
+    GitIgnoreParser patterns compiled once into grouped lookups.
+
+    Patterns are grouped by form:
+    - literal basenames ("Thumbs.db", "**/cache") -> dict lookup
+    - "*.<literal>" basenames ("*.pyc") -> dict lookup per '.'-suffix of the name
+    - literal directory-only names ("node_modules/") -> dict lookup per segment
+    - other basename globs -> one regex alternation matched against the name
+    - path and multi-segment directory patterns -> regex alternations matched
+      against "<rel_path>/" (one for file subjects, one for directories)
+
+    Every group reports the highest matching pattern index (regex alternatives
+    are ordered last pattern first); the overall highest index decides, which
+    keeps gitignore "last match wins" negation semantics.
+    """
+
+    def __init__(self, patterns: Sequence[str]) -> None:
+        self._negated: List[bool] = []
+        self._names: Dict[str, int] = {}
+        self._suffixes: Dict[str, int] = {}
+        self._dir_names: Dict[str, int] = {}
+
+        name_alts: List[str] = []
+        file_alts: List[str] = []
+        dir_alts: List[str] = []
+
+        for idx, pattern in enumerate(patterns):
+            negated = pattern.startswith("!")
+            self._negated.append(negated)
+            self._add_pattern(idx, pattern[1:] if negated else pattern, name_alts, file_alts, dir_alts)
+
+        self._name_re = self._compile(name_alts)
+        self._file_re = self._compile(file_alts)
+        self._dir_re = self._compile(dir_alts)
+
+    @staticmethod
+    def _compile(alternatives: List[str]) -> Optional["re.Pattern[str]"]:
+        # Last pattern first: the first alternative that matches has the highest index
+        return re.compile("|".join(reversed(alternatives))) if alternatives else None
+
+    def _add_pattern(
+        self,
+        idx: int,
+        pattern: str,
+        name_alts: List[str],
+        file_alts: List[str],
+        dir_alts: List[str],
+    ) -> None:
+        if not pattern:
+            return
+
+        any_segments = f"(?:{_ANY_SEGMENT})*"
+        some_segments = f"(?:{_ANY_SEGMENT})+"
+
+        # Directory-only pattern: matches the directory itself and everything below it
+        if pattern.endswith("/"):
+            body = pattern.rstrip("/").lstrip("/")
+            if not body:
+                return
+
+            if "/" not in body:
+                # Literal segment name at any depth (not a glob, as in GitIgnoreParser._match)
+                self._dir_names[body] = idx
+                return
+
+            prefix = "" if pattern.startswith("/") else any_segments
+            segs = "".join(_glob_segment_to_regex(p) + "/" for p in body.split("/"))
+            file_alts.append(f"(?P<p{idx}>{prefix}{segs}{some_segments})")
+            dir_alts.append(f"(?P<p{idx}>{prefix}{segs}{any_segments})")
+            return
+
+        body = pattern.lstrip("/")
+
+        # "**/name" is equivalent to the basename pattern "name"
+        stripped = body
+        while stripped.startswith("**/"):
+            stripped = stripped[3:]
+        if stripped and "/" not in stripped and stripped != "**":
+            body = stripped
+
+        if "/" not in body:
+            if not any(ch in body for ch in "*?["):
+                self._names[body] = idx
+            elif body.startswith("*.") and not any(ch in body[1:] for ch in "*?["):
+                self._suffixes[body[1:]] = idx
+            else:
+                name_alts.append(f"(?P<p{idx}>{_glob_segment_to_regex(body)})")
+            return
+
+        # Path pattern: segment-wise, '**' spans any number of segments
+        rx = "".join(
+            any_segments if p == "**" else _glob_segment_to_regex(p) + "/"
+            for p in body.split("/")
+        )
+        file_alts.append(f"(?P<p{idx}>{rx})")
+        dir_alts.append(f"(?P<p{idx}>{rx})")
+
+    def matches(self, rel_str: str, *, is_dir: bool) -> bool:
+        """Return True if `rel_str` (root-relative posix path, "." for the root) is ignored."""
+        return bool(self.match(rel_str, is_dir=is_dir))
+
+    def match(self, rel_str: str, *, is_dir: bool) -> Optional[bool]:
+        """Like `matches()`, but returns None if no pattern matched at all."""
+        parts = rel_str.split("/")
+        name = parts[-1]
+
+        best = self._names.get(name, -1)
+
+        if self._suffixes:
+            k = name.find(".")
+            while k != -1:
+                best = max(best, self._suffixes.get(name[k:], -1))
+                k = name.find(".", k + 1)
+
+        if self._dir_names:
+            for seg in (parts if is_dir else parts[:-1]):
+                best = max(best, self._dir_names.get(seg, -1))
+
+        if self._name_re is not None:
+            m = self._name_re.fullmatch(name)
+            if m is not None and m.lastgroup is not None:
+                best = max(best, int(m.lastgroup[1:]))
+
+        path_re = self._dir_re if is_dir else self._file_re
+        if path_re is not None:
+            m = path_re.fullmatch(rel_str + "/")
+            if m is not None and m.lastgroup is not None:
+                best = max(best, int(m.lastgroup[1:]))
+
+        if best < 0:
+            return None
+        return not self._negated[best]
+
+
+# ============================================================================
+# Git Index
+# ============================================================================
+
+_GITLINK_MODE = 0o160000
+
+
+def find_git_worktree(path: Path) -> Optional[Tuple[Path, Path]]:
+    """
+    Return (worktree root, git dir) of the checkout containing `path`, or None.
+
+    Handles both a ".git" directory and a ".git" file ("gitdir: ..."), as used
+    by linked worktrees and submodules.
+    """
+    for candidate in (path, *path.parents):
+        dot_git = candidate / ".git"
+        if dot_git.is_dir():
+            return candidate, dot_git
+        if dot_git.is_file():
+            try:
+                text = dot_git.read_text(encoding="utf-8").strip()
+            except OSError:
+                return None
+            if not text.startswith("gitdir:"):
+                return None
+            git_dir = Path(text[len("gitdir:"):].strip())
+            if not git_dir.is_absolute():
+                git_dir = candidate / git_dir
+            return candidate, git_dir.resolve()
+    return None
+
+
+def _git_hash_len(git_dir: Path) -> int:
+    """Object id length in bytes: 32 for SHA-256 repositories, else 20."""
+    config_dirs = [git_dir]
+    try:
+        common = (git_dir / "commondir").read_text(encoding="utf-8").strip()
+        config_dirs.append((git_dir / common).resolve())
+    except OSError:
+        pass
+
+    for d in config_dirs:
+        try:
+            text = (d / "config").read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            continue
+        if re.search(r"^\s*objectformat\s*=\s*sha256\s*$", text, re.IGNORECASE | re.MULTILINE):
+            return 32
+    return 20
+
+
+def _read_index_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Decode git's offset varint (index v4 path prefix length)."""
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7F)
+    return value, pos
+
+
+def read_git_index(index_path: Path, *, hash_len: int = 20) -> List[str]:
+    """
+    Return worktree-relative posix paths of the files tracked in a git index.
+
+    Reads the binary index directly (versions 2, 3 and 4). Submodules
+    (gitlinks) and skip-worktree entries (sparse checkout) are left out;
+    conflicted paths are listed once. Raises ValueError on malformed data.
+    """
+    data = Path(index_path).read_bytes()
+    if len(data) < 12 or data[:4] != b"DIRC":
+        raise ValueError(f"Not a git index: {index_path}")
+    version, count = struct.unpack(">II", data[4:12])
+    if version not in (2, 3, 4):
+        raise ValueError(f"Unsupported git index version {version}: {index_path}")
+
+    paths: List[str] = []
+    pos = 12
+    prev = b""
+    try:
+        for _ in range(count):
+            start = pos
+            (mode,) = struct.unpack(">I", data[pos + 24:pos + 28])
+            pos += 40 + hash_len
+            (flags,) = struct.unpack(">H", data[pos:pos + 2])
+            pos += 2
+            ext_flags = 0
+            if flags & 0x4000 and version >= 3:
+                (ext_flags,) = struct.unpack(">H", data[pos:pos + 2])
+                pos += 2
+
+            if version == 4:
+                strip, pos = _read_index_varint(data, pos)
+                end = data.index(b"\0", pos)
+                name = prev[:len(prev) - strip] + data[pos:end]
+                pos = end + 1
+            else:
+                end = data.index(b"\0", pos)
+                name = data[pos:end]
+                # Entries are NUL-padded to a multiple of 8 bytes
+                pos = start + ((end - start + 8) & ~7)
+
+            is_repeat = name == prev and (flags >> 12) & 0x3
+            prev = name
+            if is_repeat or (mode & 0o170000) == _GITLINK_MODE or ext_flags & 0x4000:
+                continue
+            paths.append(name.decode("utf-8", "surrogateescape"))
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Truncated git index: {index_path}") from e
+    return paths
+
+
+# ============================================================================
+# Archives
+# ============================================================================
+
+# Inputs FileSystemWalker(archives=True) reads as directory trees (see ArchiveReader)
+ARCHIVE_SUFFIXES: Tuple[str, ...] = (
+    ".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tbz", ".tar.xz", ".txz",
+)
+# Leading bytes of compressed tar streams
+_TAR_CODECS: Tuple[Tuple[bytes, str], ...] = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+)
+
+
+@dataclass(frozen=True, slots=True)
+class ArchiveMember:
+    """A regular file inside an archive (see ArchiveReader)."""
+
+    name: str
+    size: int
+    mtime_ns: int
+    # Tar: offset of the data in the (decompressed) tar stream; zip: the entry
+    offset: int = 0
+    info: Optional[zipfile.ZipInfo] = None
+
+
+class _ArchiveStream:
+    """
+    Decompressed tar stream read from a position on (see ArchiveReader._acquire()).
+
+    The base class reads a plain tar: it can seek anywhere. Compressed
+    streams only move forward; seek() reads and drops the bytes in between.
+    """
+
+    SKIP_CHUNK = 1024 * 1024
+
+    def __init__(self, path: Path) -> None:
+        self._raw = open(path, "rb")
+        self.pos = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._raw.read(size)
+        self.pos += len(data)
+        return data
+
+    def can_seek(self, offset: int) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence != os.SEEK_SET:
+            raise io.UnsupportedOperation("archive streams seek from the start only")
+        if not self.can_seek(offset):
+            raise io.UnsupportedOperation("compressed archive streams do not seek backwards")
+        self._seek_forward(offset)
+        return self.pos
+
+    def _seek_forward(self, offset: int) -> None:
+        self.pos = self._raw.seek(offset)
+
+    def tell(self) -> int:
+        return self.pos
+
+    def close(self) -> None:
+        self._raw.close()
+
+
+class _CodecStream(_ArchiveStream):
+    """bz2/xz tar stream, decompressed by the stdlib file objects."""
+
+    def __init__(self, path: Path, codec: str) -> None:
+        super().__init__(path)
+        self._file: Any = bz2.BZ2File(self._raw) if codec == "bz2" else lzma.LZMAFile(self._raw)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self.pos += len(data)
+        return data
+
+    def can_seek(self, offset: int) -> bool:
+        return offset >= self.pos
+
+    def _seek_forward(self, offset: int) -> None:
+        while self.pos < offset:
+            if not self.read(min(self.SKIP_CHUNK, offset - self.pos)):
+                break
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+class _InflateStream(_CodecStream):
+    """
+    gzip tar stream on zlib, resumable from checkpoints.
+
+    A checkpoint is (output offset, offset of the first unconsumed input
+    byte, decompressor copy); `on_checkpoint` is offered one after every
+    decompress() call.
+    """
+
+    INPUT_CHUNK = 64 * 1024
+    OUTPUT_CHUNK = 256 * 1024
+
+    def __init__(
+        self,
+        path: Path,
+        checkpoint: Optional[Tuple[int, int, Any]] = None,
+        on_checkpoint: Optional[Callable[[int, int, Any], None]] = None,
+    ) -> None:
+        _ArchiveStream.__init__(self, path)
+        if checkpoint is not None:
+            self.pos, in_pos, decomp = checkpoint
+            self._raw.seek(in_pos)
+            self._decomp = decomp.copy()
+        else:
+            self._decomp = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        self._on_checkpoint = on_checkpoint
+        self._produced = self.pos
+        self._tail = b""
+        self._pending = b""
+        self._offset = 0
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            return b"".join(iter(lambda: self.read(self.OUTPUT_CHUNK), b""))
+        while self._offset >= len(self._pending) and not self._eof:
+            self._fill()
+        data = self._pending[self._offset : self._offset + size]
+        self._offset += len(data)
+        self.pos += len(data)
+        return data
+
+    def _fill(self) -> None:
+        data = self._tail or self._raw.read(self.INPUT_CHUNK)
+        if not data:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        out = self._decomp.decompress(data, self.OUTPUT_CHUNK)
+        self._tail = self._decomp.unconsumed_tail
+        if self._decomp.eof:
+            # Concatenated gzip members continue the stream; anything else ends it
+            rest = self._decomp.unused_data or self._raw.read(self.INPUT_CHUNK)
+            if rest[:2] == b"\x1f\x8b":
+                self._decomp = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                self._tail = rest
+            else:
+                self._eof = True
+        elif self._on_checkpoint is not None:
+            self._on_checkpoint(self._produced + len(out), self._raw.tell() - len(self._tail), self._decomp)
+        self._produced += len(out)
+        self._pending, self._offset = out, 0
+
+    def close(self) -> None:
+        _ArchiveStream.close(self)
+
+
+class _ArchiveMemberIO(io.RawIOBase):
+    """Binary stream of one archive member (see ArchiveReader.open())."""
+
+    def __init__(self, reader: "ArchiveReader", member: ArchiveMember) -> None:
+        super().__init__()
+        self._reader = reader
+        self._member = member
+        self._pos = 0
+        self._stream: Optional[_ArchiveStream] = None
+        self._entry: Optional[IO[bytes]] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        size = min(len(buffer), self._member.size - self._pos)
+        if size <= 0:
+            return 0
+        reader = self._reader
+        try:
+            if self._member.info is not None:
+                if self._entry is None:
+                    self._entry = reader._zip_entry(self._member, self._pos)
+                data = self._entry.read(size)
+            else:
+                if self._stream is None:
+                    self._stream = reader._acquire(self._member.offset + self._pos)
+                data = self._stream.read(size)
+        except (EOFError, zlib.error, lzma.LZMAError, zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+            raise OSError(f"Could not read {self._member.name} from {reader.path}: {e}") from e
+        if not data:
+            raise OSError(f"Unexpected end of {reader.path} in {self._member.name}")
+        buffer[: len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._member.size
+        offset = max(0, offset)
+        if offset != self._pos:
+            # Streams are picked again for the new position (a forward seek keeps this one)
+            self._release()
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+    def _release(self) -> None:
+        if self._stream is not None:
+            self._reader._release(self._stream)
+            self._stream = None
+        if self._entry is not None:
+            self._entry.close()
+            self._entry = None
+
+    def close(self) -> None:
+        if not self.closed:
+            self._release()
+        super().close()
+
+
+class ArchiveReader:
+    """
+    Read-only view of a tar or zip archive as a tree of regular files.
+
+    Members are listed once (directories, links and special files are left
+    out; a name repeated in a tar keeps its last copy), and `open()` gives
+    a seekable binary stream of one member. Nothing is extracted to disk:
+    - zip: entries are read through zipfile
+    - plain tar: a member is a byte range of the archive
+    - compressed tar (gzip, bz2, xz): the tar stream is decompressed on the
+      fly. Finished streams are kept (up to MAX_IDLE_STREAMS) and a member
+      is read by the idle stream furthest before it, so reading members in
+      archive order decompresses the archive once. For gzip the listing pass
+      also stores decompressor checkpoints, at least CHECKPOINT_BYTES of
+      compressed input and 1/MAX_CHECKPOINTS of the archive apart, so a
+      member is reached without inflating the archive from the start and
+      memory stays bounded whatever the archive size. bz2/xz decompressors
+      cannot be resumed: a member before every idle stream is decompressed
+      from the start of the archive again.
+
+    `open()` is safe to call from several threads.
+    """
+
+    CHECKPOINT_BYTES = 1024 * 1024
+    MAX_CHECKPOINTS = 64
+    MAX_IDLE_STREAMS = 4
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.members: Dict[Tuple[str, ...], ArchiveMember] = {}
+        self._st = self.path.stat()
+        self._lock = threading.Lock()
+        self._idle: List[_ArchiveStream] = []
+        # gzip only: (output offset, input offset, decompressor), see _InflateStream
+        self._checkpoints: List[Tuple[int, int, Any]] = []
+        self._checkpoint_offsets: List[int] = []
+        self._checkpoint_spacing = max(self.CHECKPOINT_BYTES, self._st.st_size // self.MAX_CHECKPOINTS)
+        self._zip: Optional[zipfile.ZipFile] = None
+        self.codec: Optional[str] = None
+
+        if zipfile.is_zipfile(self.path):
+            self._zip = zipfile.ZipFile(self.path)
+            self._list_zip()
+        else:
+            with open(self.path, "rb") as f:
+                magic = f.read(6)
+            self.codec = next((name for prefix, name in _TAR_CODECS if magic.startswith(prefix)), None)
+            self._list_tar()
+
+    @staticmethod
+    def is_archive(path: Path) -> bool:
+        """True if `path` has one of ARCHIVE_SUFFIXES."""
+        return path.name.lower().endswith(ARCHIVE_SUFFIXES)
+
+    @staticmethod
+    def _member_parts(name: str) -> Optional[Tuple[str, ...]]:
+        """Path parts of a member name, None for names that leave the archive root."""
+        parts = tuple(p for p in name.replace("\\", "/").split("/") if p not in ("", "."))
+        if not parts or ".." in parts:
+            return None
+        return parts
+
+    def _list_zip(self) -> None:
+        assert self._zip is not None
+        for info in self._zip.infolist():
+            if info.is_dir() or stat_module.S_ISLNK(info.external_attr >> 16):
+                continue
+            parts = self._member_parts(info.filename)
+            if parts is None:
+                continue
+            try:
+                mtime_ns = int(time.mktime(info.date_time + (0, 0, -1))) * 1_000_000_000
+            except (OverflowError, ValueError):
+                mtime_ns = 0
+            self.members[parts] = ArchiveMember(info.filename, info.file_size, mtime_ns, info=info)
+
+    def _list_tar(self) -> None:
+        stream = self._new_stream(None)
+        try:
+            with tarfile.open(fileobj=stream, mode="r:") as tar:  # type: ignore[call-overload]
+                for info in tar:
+                    if not info.isreg() or info.sparse is not None:
+                        continue
+                    parts = self._member_parts(info.name)
+                    if parts is not None:
+                        self.members.pop(parts, None)
+                        self.members[parts] = ArchiveMember(
+                            info.name, info.size, int(info.mtime) * 1_000_000_000, offset=info.offset_data
+                        )
+        finally:
+            stream.close()
+
+    def stat(self, member: ArchiveMember) -> os.stat_result:
+        """stat() result for a member: its size and mtime, the archive's device, no inode."""
+        ns = member.mtime_ns
+        sec = ns // 1_000_000_000
+        return os.stat_result(
+            (stat_module.S_IFREG | 0o444, 0, self._st.st_dev, 1, 0, 0, member.size, sec, sec, sec),
+            {
+                "st_atime": ns / 1e9,
+                "st_mtime": ns / 1e9,
+                "st_ctime": ns / 1e9,
+                "st_atime_ns": ns,
+                "st_mtime_ns": ns,
+                "st_ctime_ns": ns,
+            },
+        )
+
+    def open(self, member: ArchiveMember) -> IO[bytes]:
+        """Buffered binary stream of `member`."""
+        return io.BufferedReader(_ArchiveMemberIO(self, member), buffer_size=256 * 1024)
+
+    def read_bytes(self, member: ArchiveMember) -> bytes:
+        with self.open(member) as f:
+            return f.read()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._checkpoints, self._checkpoint_offsets = [], []
+        for stream in idle:
+            stream.close()
+        if self._zip is not None:
+            self._zip.close()
+
+    def __enter__(self) -> "ArchiveReader":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _zip_entry(self, member: ArchiveMember, position: int) -> IO[bytes]:
+        assert self._zip is not None and member.info is not None
+        entry = self._zip.open(member.info)
+        if position:
+            entry.seek(position)
+        return entry
+
+    def _new_stream(self, checkpoint: Optional[Tuple[int, int, Any]]) -> _ArchiveStream:
+        if self.codec == "gzip":
+            return _InflateStream(self.path, checkpoint, self._add_checkpoint)
+        if self.codec is not None:
+            return _CodecStream(self.path, self.codec)
+        return _ArchiveStream(self.path)
+
+    def _add_checkpoint(self, out_pos: int, in_pos: int, decomp: Any) -> None:
+        with self._lock:
+            last_out, last_in = self._checkpoints[-1][:2] if self._checkpoints else (0, 0)
+            # Spaced by compressed input, so an archive has at most about MAX_CHECKPOINTS of them
+            if out_pos > last_out and in_pos >= last_in + self._checkpoint_spacing:
+                self._checkpoints.append((out_pos, in_pos, decomp.copy()))
+                self._checkpoint_offsets.append(out_pos)
+
+    def _acquire(self, offset: int) -> _ArchiveStream:
+        """A tar stream positioned at `offset`: the closest idle one before it, else a new one."""
+        with self._lock:
+            usable = [s for s in self._idle if s.can_seek(offset)]
+            best = max(usable, key=lambda s: s.pos if s.pos <= offset else -1, default=None)
+            k = bisect.bisect_right(self._checkpoint_offsets, offset)
+            checkpoint = self._checkpoints[k - 1] if k else None
+            if best is not None and (checkpoint is None or best.pos >= checkpoint[0] or best.pos > offset):
+                self._idle.remove(best)
+            else:
+                best = None
+        stream = best if best is not None else self._new_stream(checkpoint)
+        stream.seek(offset)
+        return stream
+
+    def _release(self, stream: _ArchiveStream) -> None:
+        with self._lock:
+            self._idle.append(stream)
+            if len(self._idle) <= self.MAX_IDLE_STREAMS:
+                return
+            # Drop the stream furthest behind
+            stream = min(self._idle, key=lambda s: s.pos)
+            self._idle.remove(stream)
+        stream.close()
+
+
 # ============================================================================
 # File System Utilities
 # ============================================================================
 
+@dataclass(slots=True)
+class DirListing:
+    """Unfiltered listing of one directory, see `scan_directory()`."""
+
+    path: Path
+    # (path, is_dir, os.DirEntry or None for the pathlib engine)
+    children: List[Tuple[Path, bool, Optional[os.DirEntry]]] = field(default_factory=list)
+    # Entries dropped by the symlink policy or because their type could not be read
+    skipped: int = 0
+    # Listing error; `children` then holds the entries collected before it
+    error: Optional[Exception] = None
+    # Directory mtime taken before listing (only with scan_directory(mtime=True))
+    mtime_ns: Optional[int] = None
+    # True if the mtime equals `unchanged_mtime_ns`; the directory was not listed
+    unchanged: bool = False
+
+
+def scan_directory(
+    directory: Path,
+    *,
+    engine: str = "scandir",
+    follow_symlinks: bool = False,
+    ordered: bool = False,
+    mtime: bool = False,
+    unchanged_mtime_ns: Optional[int] = None,
+) -> DirListing:
+    """
+    List one directory without applying any filters.
+
+    Symlinks are skipped, or resolved when `follow_symlinks` is set, and entry
+    types are determined here, so this covers all the syscall-bound work of a
+    walk. It does not touch shared state and is safe to run in worker threads.
+
+    With mtime=True the directory mtime is recorded first; if it equals
+    `unchanged_mtime_ns` the listing is skipped and `unchanged` is set.
+    """
+    listing = DirListing(directory)
+    try:
+        if mtime or unchanged_mtime_ns is not None:
+            listing.mtime_ns = os.stat(directory).st_mtime_ns
+            if listing.mtime_ns == unchanged_mtime_ns:
+                listing.unchanged = True
+                return listing
+
+        if engine == "scandir":
+            with os.scandir(directory) as it:
+                entries: Iterable[os.DirEntry] = sorted(it, key=lambda e: e.name) if ordered else it
+                for entry in entries:
+                    item = directory / entry.name
+                    try:
+                        if entry.is_symlink():
+                            if not follow_symlinks:
+                                listing.skipped += 1
+                                continue
+                            item = item.resolve()
+                        # DirEntry.is_dir() follows symlinks, matching Path.is_dir()
+                        is_dir = entry.is_dir()
+                    except Exception:
+                        listing.skipped += 1
+                        continue
+                    listing.children.append((item, is_dir, entry))
+        else:
+            items: Iterable[Path] = directory.iterdir()
+            if ordered:
+                items = sorted(items, key=lambda p: p.name)
+            for item in items:
+                try:
+                    if item.is_symlink():
+                        if not follow_symlinks:
+                            listing.skipped += 1
+                            continue
+                        item = item.resolve()
+                    is_dir = item.is_dir()
+                except Exception:
+                    listing.skipped += 1
+                    continue
+                listing.children.append((item, is_dir, None))
+    except Exception as e:
+        listing.error = e
+    return listing
+
+
+class ParallelScanner:
+    """
+    Runs `scan_directory()` on a thread pool, ahead of the consumer.
+
+    Listing is bound by syscall latency (network mounts, cold caches), so
+    directories are listed concurrently while filtering and stats stay on
+    the calling thread.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        *,
+        engine: str = "scandir",
+        follow_symlinks: bool = False,
+        ordered: bool = False,
+        mtime: bool = False,
+    ) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan")
+        self.engine = engine
+        self.follow_symlinks = follow_symlinks
+        self.ordered = ordered
+        self.mtime = mtime
+
+    def submit(self, directory: Path, *, unchanged_mtime_ns: Optional[int] = None) -> "Future[DirListing]":
+        return self._pool.submit(
+            scan_directory,
+            directory,
+            engine=self.engine,
+            follow_symlinks=self.follow_symlinks,
+            ordered=self.ordered,
+            mtime=self.mtime,
+            unchanged_mtime_ns=unchanged_mtime_ns,
+        )
+
+    def close(self) -> None:
+        """Stop the pool without waiting; listings not started yet are cancelled."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self) -> "ParallelScanner":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def _file_signature(path: Path) -> Optional[List[int]]:
+    """Return [mtime_ns, size] of a file (JSON-friendly), or None if it does not exist."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+class WalkSnapshot:
+    """
+    On-disk snapshot of a filtered walk, used for incremental re-scans.
+
+    For every listed directory it stores the directory mtime, the accepted
+    children and the stats they contributed. A later walk with the same
+    fingerprint reuses the children of directories whose mtime did not change
+    instead of listing and filtering them again (subdirectories are still
+    visited, each checked with a single stat()).
+
+    Safety rules:
+    - another fingerprint (filters, roots, gitignore patterns) discards the snapshot
+    - directories modified less than RACY_WINDOW_NS before the walk started are
+      not stored, so changes within the same mtime tick are never missed
+    - a changed nested .gitignore, or a changed directory containing one,
+      invalidates the whole subtree below it
+    """
+
+    VERSION = 1
+    RACY_WINDOW_NS = 2_000_000_000
+
+    def __init__(self, path: Path, fingerprint: str) -> None:
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self.started_ns = time.time_ns()
+        self.stats: Dict[str, int] = {"reused": 0, "rescanned": 0}
+        self._old: Dict[str, Dict[str, Any]] = {}
+        self._new: Dict[str, Dict[str, Any]] = {}
+        # Directories (as path parts) whose subtree must not be reused in this walk
+        self._dirty: Set[Tuple[str, ...]] = set()
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str) -> "WalkSnapshot":
+        """Load a snapshot; a missing, unreadable or mismatching file gives an empty one."""
+        snapshot = cls(path, fingerprint)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return snapshot
+        except Exception as e:
+            logging.warning("Could not read walk snapshot %s: %s", path, e)
+            return snapshot
+
+        if data.get("version") != cls.VERSION or data.get("fingerprint") != fingerprint:
+            logging.debug("Walk snapshot %s was made with other filters, rescanning", path)
+            return snapshot
+
+        snapshot._old = data.get("directories", {})
+        for directory, rec in snapshot._old.items():
+            sig = rec.get("gitignore")
+            if sig is not None and _file_signature(Path(directory) / ".gitignore") != sig:
+                snapshot._dirty.add(Path(directory).parts)
+        return snapshot
+
+    def lookup(self, directory: Path, depth: int) -> Optional[Dict[str, Any]]:
+        """Return the stored record of `directory` if it may be reused (mtime not checked yet)."""
+        rec = self._old.get(str(directory))
+        if rec is None or rec["depth"] != depth:
+            return None
+        if self._dirty:
+            # The directory itself or any ancestor: O(depth) set lookups
+            parts = directory.parts
+            if any(parts[:n] in self._dirty for n in range(1, len(parts) + 1)):
+                return None
+        return rec
+
+    def reuse(self, directory: Path) -> Tuple[List[Tuple[Path, bool]], Dict[str, int]]:
+        """Carry the record of an unchanged directory over; return its children and stats."""
+        rec = self._old[str(directory)]
+        self._new[str(directory)] = rec
+        self.stats["reused"] += 1
+        return [(Path(p), bool(is_dir)) for p, is_dir in rec["children"]], rec["stats"]
+
+    def record(
+        self,
+        listing: DirListing,
+        depth: int,
+        children: List[Tuple[Path, bool]],
+        stats: Dict[str, int],
+    ) -> None:
+        """Store the filtered result of a fresh listing."""
+        self.stats["rescanned"] += 1
+        directory = listing.path
+
+        gitignore: Optional[List[int]] = None
+        if any(p.name == ".gitignore" and p.parent == directory for p, _, _ in listing.children):
+            gitignore = _file_signature(directory / ".gitignore")
+        old = self._old.get(str(directory))
+        if (old.get("gitignore") if old is not None else None) != gitignore:
+            # .gitignore added, removed or edited: records below may be stale
+            self._dirty.add(directory.parts)
+
+        if listing.error is not None or listing.mtime_ns is None:
+            return
+        if listing.mtime_ns >= self.started_ns - self.RACY_WINDOW_NS:
+            return
+
+        self._new[str(directory)] = {
+            "mtime_ns": listing.mtime_ns,
+            "depth": depth,
+            "children": [[str(p), is_dir] for p, is_dir in children],
+            "stats": stats,
+            "gitignore": gitignore,
+        }
+
+    def save(self) -> bool:
+        data = {"version": self.VERSION, "fingerprint": self.fingerprint, "directories": self._new}
+        return safe_write(self.path, json.dumps(data), backup=False)
+
+
+class FileHashCache:
+    """
+    Content digests of files, keyed by (device, inode, mtime, size).
+
+    A file whose inode, mtime and size match a stored entry is not read
+    again; renamed or moved files keep their entry. With a `path` the cache
+    is loaded from and saved to disk, so repeated runs only hash changed
+    files. Only entries looked up in this run are saved, and files modified
+    less than RACY_WINDOW_NS before the run started are never stored (their
+    content may still change within the same mtime tick). Safe to use from
+    several threads.
+    """
+
+    VERSION = 1
+    RACY_WINDOW_NS = WalkSnapshot.RACY_WINDOW_NS
+    ALGORITHM = "blake2b-128"
+
+    def __init__(self, path: Optional[Path] = None, *, chunk_size: int = 1024 * 1024) -> None:
+        self.path = Path(path) if path is not None else None
+        self.chunk_size = chunk_size
+        self.started_ns = time.time_ns()
+        self.stats: Dict[str, int] = {"hashed": 0, "reused": 0}
+        self._old: Dict[str, List[Any]] = {}
+        self._new: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Optional[Path], *, chunk_size: int = 1024 * 1024) -> "FileHashCache":
+        """Load a cache; a missing, unreadable or mismatching file gives an empty one."""
+        cache = cls(path, chunk_size=chunk_size)
+        if path is None:
+            return cache
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cache
+        except Exception as e:
+            logging.warning("Could not read hash cache %s: %s", path, e)
+            return cache
+
+        if data.get("version") == cls.VERSION and data.get("algorithm") == cls.ALGORITHM:
+            cache._old = data.get("files", {})
+        return cache
+
+    @staticmethod
+    def _key(path: Path, st: os.stat_result) -> str:
+        # st_ino is 0 where the platform has no inode numbers
+        return f"{st.st_dev}:{st.st_ino}" if st.st_ino else f"path:{path}"
+
+    def digest(
+        self,
+        path: Path,
+        st: Optional[os.stat_result] = None,
+        *,
+        opener: Optional[Callable[[Path], IO[bytes]]] = None,
+    ) -> Optional[str]:
+        """
+        Hex digest of the content of `path`, or None if it cannot be read.
+
+        `opener` opens paths that are not plain files (see FileSystemWalker.open_file).
+        """
+        try:
+            st = st if st is not None else path.stat()
+        except OSError:
+            return None
+        key = self._key(path, st)
+        with self._lock:
+            rec = self._new.get(key) or self._old.get(key)
+        if rec is not None and rec[0] == st.st_mtime_ns and rec[1] == st.st_size:
+            with self._lock:
+                self._new[key] = rec
+                self.stats["reused"] += 1
+            return str(rec[2])
+
+        h = hashlib.blake2b(digest_size=16)
+        try:
+            with (opener(path) if opener is not None else open(path, "rb")) as f:
+                while chunk := f.read(self.chunk_size):
+                    h.update(chunk)
+        except OSError:
+            return None
+        digest = h.hexdigest()
+        with self._lock:
+            self.stats["hashed"] += 1
+            if st.st_mtime_ns < self.started_ns - self.RACY_WINDOW_NS:
+                self._new[key] = [st.st_mtime_ns, st.st_size, digest]
+        return digest
+
+    def save(self) -> bool:
+        if self.path is None:
+            return True
+        data = {"version": self.VERSION, "algorithm": self.ALGORITHM, "files": self._new}
+        return safe_write(self.path, json.dumps(data), backup=False)
+
+
 class FileSystemWalker:
-    """Efficient file system traversal with filtering and stats."""
+    """
+    Efficient file system traversal with filtering and stats.
+
+    Two listing backends are available (see FilterConfig.walk_engine):
+    - "scandir": os.scandir-based; entry type comes from the directory listing
+      and stat info is taken from os.DirEntry lazily (cached per entry)
+    - "pathlib": legacy Path.iterdir()-based traversal
+    Both produce identical results and stats.
+
+    With FilterConfig.walk_workers > 1 directories are listed concurrently by
+    a `ParallelScanner`; exclusion rules and stats are applied on the calling
+    thread, so results and stats are the same as for a sequential walk.
+
+    `find_files()` returns a sorted list; `iter_files()` streams matches while
+    the walk is still running.
+
+    With FilterConfig.walk_snapshot set, recursive walks load and update a
+    `WalkSnapshot`: unchanged directories are not listed again (see `snapshot`
+    for reuse counters of the last walk).
+
+    With FilterConfig.file_source="git-index", roots inside a git checkout
+    take their files from .git/index instead of listing directories; the
+    filter rules (except .gitignore, which git does not apply to tracked
+    files) still apply. `include_untracked` adds files found by a regular
+    walk. Roots outside a checkout fall back to the filesystem walk.
+
+    With archives=True, roots that are tar/zip files (see ARCHIVE_SUFFIXES)
+    are walked as directories: members become paths below the archive path
+    (`release.tar.gz/pkg/mod.py`) and go through the same filters, max_depth
+    and .gitignore rules, including .gitignore files inside the archive when
+    the parser is a ScopedGitIgnoreParser. Read them with `open_file()`;
+    `get_stat()` describes them. `close()` releases the archives.
+    """
 
-    def __init__(self, config: FilterConfig, gitignore_parser: Optional[GitIgnoreParser] = None) -> None:
+    def __init__(
+        self,
+        config: FilterConfig,
+        gitignore_parser: Optional[GitIgnoreParser] = None,
+        *,
+        archives: bool = False,
+    ) -> None:
         self.config = config
         self.gitignore_parser = gitignore_parser
+        self.archives = archives
         self.stats: Dict[str, int] = {
             "files_found": 0,
             "directories_found": 0,
@@ -286,6 +1735,17 @@ class FileSystemWalker:
             "directories_excluded": 0,
         }
         self._roots: List[Path] = []
+        # DirEntry objects of accepted files from the last walk (scandir engine only)
+        self._entries: Dict[Path, os.DirEntry] = {}
+        # Snapshot used by the last recursive walk (FilterConfig.walk_snapshot)
+        self.snapshot: Optional[WalkSnapshot] = None
+        # lstat() results of tracked files from the last git-index discovery
+        self._stats: Dict[Path, os.stat_result] = {}
+        # exclude/include rules of `config`, compiled once
+        self.matcher = config.compile_matcher()
+        # Archive roots of the last walk and their accepted members
+        self._archives: List[ArchiveReader] = []
+        self._members: Dict[Path, Tuple[ArchiveReader, ArchiveMember]] = {}
 
     def find_files(self, root_dirs: Sequence[Path], *, recursive: Optional[bool] = None) -> List[Path]:
         """
@@ -294,154 +1754,578 @@ class FileSystemWalker:
         `recursive` is kept for backward compatibility with callers in this repo.
         If None, uses self.config.recursive.
         """
+        return sorted(set(self.iter_files(root_dirs, recursive=recursive)))
+
+    def iter_files(
+        self,
+        root_dirs: Sequence[Path],
+        *,
+        recursive: Optional[bool] = None,
+        ordered: bool = False,
+    ) -> Iterator[Path]:
+        """
+        Yield matching files as they are discovered.
+
+        - Duplicates (overlapping roots, followed symlinks) are yielded once.
+        - ordered=False: directory order as returned by the OS (fastest).
+        - ordered=True: entries are sorted per directory and subdirectories are
+          visited in place, which for a single root gives the same order as
+          `find_files()` without buffering the whole tree. Roots are walked in
+          the given order.
+
+        Stats are updated incrementally and are final once the generator is
+        exhausted; the walk snapshot (if configured) is saved at that point too.
+        """
         self._roots = [p.resolve() for p in root_dirs]
         self._reset_stats()
+        self._entries.clear()
+        self._stats.clear()
+        self.close()
 
         do_recursive = self.config.recursive if recursive is None else recursive
+        need_dedup = len(self._roots) > 1 or self.config.follow_symlinks
+        seen: Set[Path] = set()
+
+        self.snapshot = None
+        if do_recursive and self.config.walk_snapshot is not None:
+            self.snapshot = WalkSnapshot.load(self.config.walk_snapshot, self._snapshot_fingerprint())
 
-        files: List[Path] = []
         for root in self._roots:
             if not root.exists():
                 logging.warning("Directory does not exist: %s", root)
                 continue
-            if root.is_file():
+            if self.archives and root.is_file() and ArchiveReader.is_archive(root):
+                found = self._iter_archive(root, recursive=do_recursive, ordered=ordered)
+            elif root.is_file():
                 self.stats["files_found"] += 1
-                if not self._should_exclude(root, is_dir=False):
-                    files.append(root)
-                else:
+                if self._should_exclude(root, is_dir=False):
                     self.stats["files_excluded"] += 1
-                continue
-
-            if do_recursive:
-                files.extend(self._walk_recursive(root))
+                    continue
+                found: Iterable[Path] = (root,)
+            elif self.config.file_source == "git-index" and (
+                tracked := self._git_index_entries(root, recursive=do_recursive)
+            ) is not None:
+                found = self._iter_git_index(root, tracked, recursive=do_recursive, ordered=ordered)
+            elif do_recursive:
+                found = self._iter_recursive(root, ordered=ordered)
             else:
-                files.extend(self._walk_single(root))
+                found = self._iter_single(root, ordered=ordered)
+
+            for path in found:
+                if need_dedup:
+                    if path in seen:
+                        continue
+                    seen.add(path)
+                yield path
+
+        if self.snapshot is not None:
+            self.snapshot.save()
+
+    def _snapshot_fingerprint(self) -> str:
+        """Fingerprint of everything that decides the filtered listings."""
+        parser = self.gitignore_parser
+        return self.config.fingerprint(
+            [str(r) for r in self._roots],
+            type(parser).__name__ if parser is not None else None,
+            parser.patterns if parser is not None else None,
+        )
+
+    def get_stat(self, path: Path) -> Optional[os.stat_result]:
+        """
+        Return stat info for a file returned by the last walk.
+
+        Uses the cached os.DirEntry when available, otherwise falls back to
+        Path.stat(). Returns None if the file cannot be stat'ed.
+        """
+        cached = self._stats.get(path)
+        if cached is not None:
+            return cached
+        entry = self._entries.get(path)
+        try:
+            if entry is not None:
+                return entry.stat()
+            return path.stat()
+        except OSError:
+            return None
+
+    def open_file(self, path: Path) -> IO[bytes]:
+        """Open a file for binary reading; archive members of the last walk come from their archive."""
+        member = self._members.get(path)
+        if member is not None:
+            return member[0].open(member[1])
+        return open(path, "rb")
+
+    def is_archive_member(self, path: Path) -> bool:
+        return path in self._members
+
+    def close(self) -> None:
+        """Close the archives of the last walk (their members can no longer be opened)."""
+        for reader in self._archives:
+            reader.close()
+        self._archives = []
+        self._members = {}
 
-        return sorted(set(files))
+    def get_size(self, path: Path) -> int:
+        """Return file size in bytes (0 if unknown), see `get_stat()`."""
+        st = self.get_stat(path)
+        return int(st.st_size) if st is not None else 0
 
     def _reset_stats(self) -> None:
         for k in self.stats:
             self.stats[k] = 0
 
-    def _walk_recursive(self, root_dir: Path) -> List[Path]:
+    def _iter_recursive(self, root_dir: Path, *, ordered: bool) -> Iterator[Path]:
         """
         Walk directory tree.
 
         Depth convention:
         - root_dir children (files/dirs directly inside) are at depth=1
         """
-        results: List[Path] = []
-        stack: List[Tuple[Path, int]] = [(root_dir, 0)]  # (dir, depth_of_dir)
+        if self.config.walk_workers > 1:
+            yield from self._iter_parallel(root_dir, ordered=ordered)
+            return
 
-        while stack:
-            current_dir, depth = stack.pop()
+        max_depth = self.config.max_depth
 
-            if self.config.max_depth is not None and depth > self.config.max_depth:
+        if not ordered:
+            stack: List[Tuple[Path, int]] = [(root_dir, 0)]  # (dir, depth_of_dir)
+            while stack:
+                current_dir, depth = stack.pop()
+                if max_depth is not None and depth > max_depth:
+                    continue
+                for item, is_dir in self._list_dir(current_dir, depth):
+                    if is_dir:
+                        stack.append((item, depth + 1))
+                    else:
+                        yield item
+            return
+
+        # Ordered: stack of per-directory iterators, subdirectories are entered in place.
+        iter_stack: List[Tuple[Iterator[Tuple[Path, bool]], int]] = [
+            (iter(self._list_dir(root_dir, 0, ordered=True)), 0)
+        ]
+        while iter_stack:
+            it, depth = iter_stack[-1]
+            nxt = next(it, None)
+            if nxt is None:
+                iter_stack.pop()
                 continue
+            item, is_dir = nxt
+            if not is_dir:
+                yield item
+            elif max_depth is None or depth + 1 <= max_depth:
+                iter_stack.append((iter(self._list_dir(item, depth + 1, ordered=True)), depth + 1))
+
+    def _iter_parallel(self, root_dir: Path, *, ordered: bool) -> Iterator[Path]:
+        """
+        Walk directory tree with directories listed on a thread pool.
+
+        ordered=False yields files as listings complete; ordered=True consumes
+        listings in the same order as the sequential ordered walk, while
+        subdirectories are already being listed in the background.
+        """
+        max_depth = self.config.max_depth
+
+        def can_enter(depth: int) -> bool:
+            return max_depth is None or depth <= max_depth
+
+        with ParallelScanner(
+            self.config.walk_workers,
+            engine=self.config.walk_engine,
+            follow_symlinks=self.config.follow_symlinks,
+            # Snapshot records are always stored in sorted order
+            ordered=ordered or self.snapshot is not None,
+            mtime=self.snapshot is not None,
+        ) as scanner:
+            def submit(directory: Path, depth: int) -> "Future[DirListing]":
+                return scanner.submit(directory, unchanged_mtime_ns=self._known_mtime(directory, depth))
+
+            if not ordered:
+                pending: Dict["Future[DirListing]", int] = {submit(root_dir, 0): 0}
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        depth = pending.pop(fut)
+                        for item, is_dir in self._accept_listing(fut.result(), depth):
+                            if not is_dir:
+                                yield item
+                            elif can_enter(depth + 1):
+                                pending[submit(item, depth + 1)] = depth + 1
+                return
+
+            def expand(fut: "Future[DirListing]", depth: int) -> Iterator[Tuple[Path, bool, Optional["Future[DirListing]"]]]:
+                # Submit all subdirectory listings before the first one is consumed
+                children = self._accept_listing(fut.result(), depth)
+                return iter([
+                    (item, is_dir, submit(item, depth + 1) if is_dir and can_enter(depth + 1) else None)
+                    for item, is_dir in children
+                ])
+
+            iter_stack = [(expand(submit(root_dir, 0), 0), 0)]
+            while iter_stack:
+                it, depth = iter_stack[-1]
+                nxt = next(it, None)
+                if nxt is None:
+                    iter_stack.pop()
+                    continue
+                item, is_dir, sub = nxt
+                if not is_dir:
+                    yield item
+                elif sub is not None:
+                    iter_stack.append((expand(sub, depth + 1), depth + 1))
 
+    def _git_index_entries(self, root: Path, *, recursive: bool) -> Optional[List[Tuple[str, ...]]]:
+        """
+        Root-relative path parts of files tracked in the git index, or None
+        if `root` is not inside a readable git checkout.
+        """
+        located = find_git_worktree(root)
+        if located is None:
+            logging.debug("Not a git checkout, walking the filesystem: %s", root)
+            return None
+        worktree, git_dir = located
+
+        try:
+            paths = read_git_index(git_dir / "index", hash_len=_git_hash_len(git_dir))
+        except (OSError, ValueError) as e:
+            logging.debug("Could not read git index of %s, walking the filesystem: %s", worktree, e)
+            return None
+
+        prefix = root.relative_to(worktree).parts
+        n = len(prefix)
+        entries: List[Tuple[str, ...]] = []
+        for rel in paths:
+            parts = tuple(rel.split("/"))
+            if parts[:n] != prefix or len(parts) == n:
+                continue
+            parts = parts[n:]
+            if recursive or len(parts) == 1:
+                entries.append(parts)
+        return entries
+
+    def _iter_git_index(
+        self,
+        root: Path,
+        tracked: List[Tuple[str, ...]],
+        *,
+        recursive: bool,
+        ordered: bool,
+    ) -> Iterator[Path]:
+        """Yield tracked files that pass the filters (plus untracked ones if configured)."""
+        walked: Set[Path] = set()
+        if self.config.include_untracked:
+            walk = self._iter_recursive(root, ordered=False) if recursive else self._iter_single(root, ordered=False)
+            for path in walk:
+                walked.add(path)
+                if not ordered:
+                    yield path
+
+        dir_verdicts: Dict[Tuple[str, ...], bool] = {}
+        accepted: List[Path] = []
+        for parts in tracked:
+            path = root.joinpath(*parts)
+            if path in walked:
+                continue
+            accepted_path = self._accept_tracked(root, parts, dir_verdicts)
+            if accepted_path is None:
+                continue
+            path = accepted_path
+            if ordered:
+                accepted.append(path)
+            else:
+                yield path
+
+        if ordered:
+            # Same order as the ordered filesystem walk: component-wise by name
+            yield from sorted([*walked, *accepted], key=lambda p: p.parts)
+
+    def _accept_tracked(
+        self,
+        root: Path,
+        parts: Tuple[str, ...],
+        dir_verdicts: Dict[Tuple[str, ...], bool],
+    ) -> Optional[Path]:
+        """
+        Apply symlink policy, exclusion rules and stats to one tracked file.
+
+        Returns the accepted path (resolved if it is a followed symlink) or None.
+        """
+        path = root.joinpath(*parts)
+        try:
+            st = os.lstat(path)
+        except OSError:
+            # Deleted in the worktree but still tracked
+            return None
+
+        if stat_module.S_ISLNK(st.st_mode):
+            if not self.config.follow_symlinks:
+                return None
             try:
-                for item in current_dir.iterdir():
-                    if item.is_symlink() and not self.config.follow_symlinks:
-                        continue
+                path = path.resolve()
+                st = path.stat()
+            except (OSError, RuntimeError):
+                return None
+        if not stat_module.S_ISREG(st.st_mode):
+            return None
 
-                    if item.is_symlink() and self.config.follow_symlinks:
-                        try:
-                            item = item.resolve()
-                        except Exception:
-                            continue
+        if not self._accept_parts(root, parts, path, dir_verdicts, use_gitignore=False):
+            return None
+        self._stats[path] = st
+        return path
+
+    def _accept_parts(
+        self,
+        root: Path,
+        parts: Tuple[str, ...],
+        path: Path,
+        dir_verdicts: Dict[Tuple[str, ...], bool],
+        *,
+        use_gitignore: bool,
+    ) -> bool:
+        """Exclusion rules and stats for a file known by its root-relative parts (not listed by a walk)."""
+        self.stats["files_found"] += 1
+
+        # Parent directories, checked once each, as the walker would see them
+        for i in range(1, len(parts)):
+            key = parts[:i]
+            ok = dir_verdicts.get(key)
+            if ok is None:
+                self.stats["directories_found"] += 1
+                ok = not self._should_exclude(root.joinpath(*key), is_dir=True, use_gitignore=use_gitignore)
+                if not ok:
+                    self.stats["directories_excluded"] += 1
+                dir_verdicts[key] = ok
+            if not ok:
+                self.stats["files_excluded"] += 1
+                return False
 
-                    if item.is_dir():
-                        self.stats["directories_found"] += 1
-                        if self._should_exclude(item, is_dir=True):
-                            self.stats["directories_excluded"] += 1
-                            continue
-                        stack.append((item, depth + 1))
-                        continue
+        if self.config.max_depth is not None and len(parts) > self.config.max_depth:
+            self.stats["files_excluded"] += 1
+            return False
 
-                    self.stats["files_found"] += 1
+        if self._should_exclude(path, is_dir=False, use_gitignore=use_gitignore):
+            self.stats["files_excluded"] += 1
+            return False
+        return True
 
-                    if self.config.max_depth is not None and (depth + 1) > self.config.max_depth:
-                        self.stats["files_excluded"] += 1
-                        continue
+    def _iter_archive(self, root: Path, *, recursive: bool, ordered: bool) -> Iterator[Path]:
+        """Yield the accepted members of archive `root` as paths below it (see ArchiveReader)."""
+        try:
+            reader = ArchiveReader(root)
+        except (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile, zlib.error, lzma.LZMAError) as e:
+            logging.warning("Could not read archive %s: %s", root, e)
+            return
+        self._archives.append(reader)
 
-                    if self._should_exclude(item, is_dir=False):
-                        self.stats["files_excluded"] += 1
-                        continue
+        parser = self.gitignore_parser
+        if isinstance(parser, ScopedGitIgnoreParser):
+            for parts, member in reader.members.items():
+                if parts[-1] != ".gitignore":
+                    continue
+                try:
+                    text = reader.read_bytes(member).decode("utf-8", "replace")
+                except OSError as e:
+                    logging.warning("Could not parse %s in %s: %s", member.name, root, e)
+                    continue
+                parser.add_scope(root.joinpath(*parts[:-1]), text.splitlines())
+
+        dir_verdicts: Dict[Tuple[str, ...], bool] = {}
+        accepted: List[Path] = []
+        for parts, member in reader.members.items():
+            if not recursive and len(parts) > 1:
+                continue
+            path = root.joinpath(*parts)
+            if not self._accept_parts(root, parts, path, dir_verdicts, use_gitignore=True):
+                continue
+            self._stats[path] = reader.stat(member)
+            self._members[path] = (reader, member)
+            if ordered:
+                accepted.append(path)
+            else:
+                yield path
+
+        if ordered:
+            yield from sorted(accepted, key=lambda p: p.parts)
 
-                    results.append(item)
+    def _list_dir(self, current_dir: Path, depth: int, *, ordered: bool = False) -> List[Tuple[Path, bool]]:
+        """
+        List one directory: apply symlink policy, exclusion rules and stats.
+
+        Returns accepted (path, is_dir) children; `depth` is the depth of `current_dir`.
+        On listing errors, children collected so far are returned.
+        """
+        listing = scan_directory(
+            current_dir,
+            engine=self.config.walk_engine,
+            follow_symlinks=self.config.follow_symlinks,
+            # Snapshot records are always stored in sorted order
+            ordered=ordered or self.snapshot is not None,
+            mtime=self.snapshot is not None,
+            unchanged_mtime_ns=self._known_mtime(current_dir, depth),
+        )
+        return self._accept_listing(listing, depth)
+
+    def _known_mtime(self, directory: Path, depth: int) -> Optional[int]:
+        """Directory mtime stored in the walk snapshot, if its record may be reused."""
+        if self.snapshot is None:
+            return None
+        rec = self.snapshot.lookup(directory, depth)
+        return rec["mtime_ns"] if rec is not None else None
+
+    def _accept_listing(self, listing: DirListing, depth: int) -> List[Tuple[Path, bool]]:
+        """Apply exclusion rules and stats to a raw listing (always on the calling thread)."""
+        if listing.unchanged and self.snapshot is not None:
+            children, stats = self.snapshot.reuse(listing.path)
+            for k, v in stats.items():
+                self.stats[k] += v
+            return children
+
+        if isinstance(listing.error, PermissionError):
+            logging.debug("Permission denied: %s", listing.path)
+        elif listing.error is not None:
+            logging.debug("Error accessing %s: %s", listing.path, listing.error)
+
+        before = dict(self.stats)
+        children: List[Tuple[Path, bool]] = []
+        for item, is_dir, entry in listing.children:
+            if self._accept_child(item, is_dir, depth, children) and entry is not None:
+                self._entries[item] = entry
+
+        if self.snapshot is not None:
+            self.snapshot.record(listing, depth, children, {k: self.stats[k] - before[k] for k in self.stats})
+        return children
+
+    def _accept_child(self, item: Path, is_dir: bool, depth: int, children: List[Tuple[Path, bool]]) -> bool:
+        """Update stats for one listed child; append it to `children` if accepted."""
+        if is_dir:
+            self.stats["directories_found"] += 1
+            if self._should_exclude(item, is_dir=True):
+                self.stats["directories_excluded"] += 1
+                return False
+            children.append((item, True))
+            return False
+
+        self.stats["files_found"] += 1
+
+        if self.config.max_depth is not None and (depth + 1) > self.config.max_depth:
+            self.stats["files_excluded"] += 1
+            return False
 
-            except PermissionError:
-                logging.debug("Permission denied: %s", current_dir)
-            except Exception as e:
-                logging.debug("Error accessing %s: %s", current_dir, e)
+        if self._should_exclude(item, is_dir=False):
+            self.stats["files_excluded"] += 1
+            return False
 
-        return results
+        children.append((item, False))
+        return True
 
-    def _walk_single(self, directory: Path) -> List[Path]:
+    def _iter_single(self, directory: Path, *, ordered: bool) -> Iterator[Path]:
         """Walk a single directory (non-recursive)."""
         results: List[Path] = []
         try:
-            for item in directory.iterdir():
-                if not item.is_file():
-                    continue
-                self.stats["files_found"] += 1
-                if self._should_exclude(item, is_dir=False):
-                    self.stats["files_excluded"] += 1
-                    continue
-                results.append(item)
+            if self.config.walk_engine == "scandir":
+                with os.scandir(directory) as it:
+                    entries: Iterable[os.DirEntry] = sorted(it, key=lambda e: e.name) if ordered else it
+                    for entry in entries:
+                        if not entry.is_file():
+                            continue
+                        item = directory / entry.name
+                        if self._accept_single(item):
+                            results.append(item)
+                            self._entries[item] = entry
+            else:
+                items: Iterable[Path] = directory.iterdir()
+                if ordered:
+                    items = sorted(items, key=lambda p: p.name)
+                for item in items:
+                    if item.is_file() and self._accept_single(item):
+                        results.append(item)
         except PermissionError:
             logging.debug("Permission denied: %s", directory)
-        return results
-
-    def _should_exclude(self, path: Path, *, is_dir: bool) -> bool:
-        """Return True if path should be excluded by config/gitignore rules."""
-        if self.gitignore_parser and self.gitignore_parser.should_ignore(path):
-            return True
-
-        if is_dir and self.config.exclude_dirs:
-            for d in self.config.exclude_dirs:
-                if d and d in path.parts:
-                    return True
+        return iter(results)
 
-        if self.config.exclude_names:
-            for pat in self.config.exclude_names:
-                if fnmatch.fnmatchcase(path.name, pat):
-                    return True
+    def _accept_single(self, item: Path) -> bool:
+        self.stats["files_found"] += 1
+        if self._should_exclude(item, is_dir=False):
+            self.stats["files_excluded"] += 1
+            return False
+        return True
 
-        if self.config.exclude_patterns:
-            rel = self._relative_to_nearest_root(path).as_posix()
-            for pat in self.config.exclude_patterns:
-                if fnmatch.fnmatchcase(path.name, pat) or fnmatch.fnmatchcase(rel, pat):
+    def _should_exclude(self, path: Path, *, is_dir: bool, use_gitignore: bool = True) -> bool:
+        """Return True if path should be excluded by config/gitignore rules."""
+        if self.gitignore_parser and use_gitignore:
+            if is_dir:
+                if self.gitignore_parser.should_prune(path):
                     return True
+            elif self.gitignore_parser.should_ignore(path, is_dir=False):
+                return True
 
-        if not is_dir and not fnmatch.fnmatchcase(path.name, self.config.include_pattern):
-            return True
+        matcher = self.matcher
+        rel = self._relative_to_nearest_root(path) if matcher.needs_rel else None
+        return matcher.excludes(path.name, rel, is_dir=is_dir)
 
-        return False
-
-    def _relative_to_nearest_root(self, path: Path) -> Path:
+    def _relative_to_nearest_root(self, path: Path) -> str:
         """
-        Compute path relative to the nearest root used in `find_files()`.
-        Falls back to cwd-relative, then absolute.
+        POSIX path relative to the nearest root used in `find_files()`.
+
+        Paths produced by the walk lie lexically below a (resolved) root, so no
+        resolve() is needed; others (followed symlinks) are resolved first and
+        fall back to cwd-relative, then absolute.
         """
+        for r in self._roots:
+            rel = FilterMatcher.relative_posix(path, r)
+            if rel is not None:
+                return rel
         p = path.resolve()
         for r in self._roots:
-            try:
-                return p.relative_to(r)
-            except Exception:
-                continue
+            rel = FilterMatcher.relative_posix(p, r)
+            if rel is not None:
+                return rel
         try:
-            return p.relative_to(Path.cwd().resolve())
+            return p.relative_to(Path.cwd().resolve()).as_posix()
         except Exception:
-            return p
+            return p.as_posix()
 
 
 # ============================================================================
 # File Content Utilities
 # ============================================================================
 
+@dataclass(frozen=True, slots=True)
+class ContentProbe:
+    """What one read of a file's first bytes tells (see `FileContentDetector.probe`)."""
+
+    file_type: FileType
+    encoding: str
+    # "utf-8", "utf-16-le", "utf-16-be" or None
+    bom: Optional[str] = None
+    # First line ending in the sample: "\n", "\r\n", "\r", or None
+    newline: Optional[str] = None
+
+
 class FileContentDetector:
-    """Detect file content type and encoding."""
+    """
+    Detect file content type and encoding.
+
+    `probe()` opens a file once and derives type, encoding, BOM and newline
+    style from a single buffer; results are cached per (device, inode, size,
+    mtime), so repeated questions about an unchanged file cost one stat().
+    `detect_file_type()` and `detect_encoding()` are views on the same probe.
+    """
+
+    # Bytes read by probe(): the type check looks at the first 4 KB, the
+    # encoding check at one 8 KB text-mode chunk
+    TYPE_SAMPLE_SIZE = 4096
+    PROBE_SIZE = 8192
+    PROBE_CACHE_SIZE = 4096
+
+    _probe_cache = _DecisionCache(PROBE_CACHE_SIZE)
+    _probe_lock = threading.Lock()
+
+    _BOMS: Tuple[Tuple[bytes, str], ...] = (
+        (b"\xef\xbb\xbf", "utf-8"),
+        (b"\xff\xfe", "utf-16-le"),
+        (b"\xfe\xff", "utf-16-be"),
+    )
 
     BINARY_EXTENSIONS: Set[str] = {
         ".exe", ".dll", ".so", ".dylib", ".bin",
@@ -472,6 +2356,107 @@ class FileContentDetector:
         ".xml": {"block": ("<!--", "-->")},
     }
 
+    @classmethod
+    def probe(
+        cls,
+        path: Path,
+        st: Optional[os.stat_result] = None,
+        *,
+        opener: Optional[Callable[[Path], IO[bytes]]] = None,
+    ) -> ContentProbe:
+        """
+        Probe a file with a single open() and read (cached, see class docstring).
+
+        `st` may be passed when the caller already has the file's stat result;
+        `opener` opens paths that are not plain files (see FileSystemWalker.open_file).
+        Unreadable files give UNKNOWN (BINARY for known binary extensions) and
+        "utf-8", and are not cached.
+        """
+        if st is None:
+            try:
+                st = path.stat()
+            except OSError:
+                st = None
+        key: Optional[Tuple[Any, ...]] = None
+        if st is not None:
+            # st_ino is 0 for DirEntry.stat() on Windows: key by path there
+            ident = (st.st_dev, st.st_ino) if st.st_ino else (str(path),)
+            key = (*ident, st.st_size, st.st_mtime_ns)
+        if key is not None:
+            with cls._probe_lock:
+                cached = cls._probe_cache.lookup(key)
+            if cached is not None:
+                return cached
+
+        binary_ext = path.suffix.lower() in cls.BINARY_EXTENSIONS
+        try:
+            with (opener(path) if opener is not None else open(path, "rb")) as f:
+                sample = f.read(cls.PROBE_SIZE)
+                encoding = cls._sample_encoding(sample, f)
+        except Exception:
+            return ContentProbe(FileType.BINARY if binary_ext else FileType.UNKNOWN, "utf-8")
+
+        result = ContentProbe(
+            FileType.BINARY if binary_ext else cls._sample_type(sample[: cls.TYPE_SAMPLE_SIZE]),
+            encoding,
+            next((name for bom, name in cls._BOMS if sample.startswith(bom)), None),
+            cls._sample_newline(sample),
+        )
+        if key is not None:
+            with cls._probe_lock:
+                cls._probe_cache.store(key, result)
+        return result
+
+    @classmethod
+    def clear_probe_cache(cls) -> None:
+        with cls._probe_lock:
+            cls._probe_cache.clear()
+
+    @staticmethod
+    def _sample_type(sample: bytes) -> FileType:
+        if b"\x00" in sample:
+            return FileType.BINARY
+        try:
+            sample.decode("utf-8", errors="strict")
+        except UnicodeDecodeError:
+            return FileType.UNKNOWN
+        return FileType.TEXT
+
+    @classmethod
+    def _sample_encoding(cls, sample: bytes, f: Any) -> str:
+        """
+        Same verdict as reading 2048 characters in text mode: PROBE_SIZE chunks
+        are decoded until 2048 characters (after newline translation) are
+        seen; a truncated trailing sequence only counts at EOF. `f` supplies
+        further chunks in the rare case the first one falls short.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")("strict")
+        chars = 0
+        pending_cr = False
+        chunk = sample
+        try:
+            while True:
+                eof = not chunk
+                text = decoder.decode(chunk, final=eof)
+                if pending_cr and not text.startswith("\n"):
+                    chars += 1
+                pending_cr = text.endswith("\r") and not eof
+                chars += len(text) - text.count("\r\n") - pending_cr
+                if chars >= 2048 or eof:
+                    return "utf-8"
+                chunk = f.read(cls.PROBE_SIZE)
+        except UnicodeDecodeError:
+            # latin-1 decodes anything, so later candidates are never reached
+            return "latin-1"
+
+    @staticmethod
+    def _sample_newline(sample: bytes) -> Optional[str]:
+        lf = sample.find(b"\n")
+        cr = sample.find(b"\r")
+        if cr != -1 and (lf == -1 or cr < lf):
+            return "\r\n" if cr + 1 == lf else "\r"
+        return "\n" if lf != -1 else None
+
     @classmethod
     def detect_file_type(cls, path: Path) -> FileType:
         """
@@ -485,18 +2470,7 @@ class FileContentDetector:
         """
         if path.suffix.lower() in cls.BINARY_EXTENSIONS:
             return FileType.BINARY
-
-        try:
-            with open(path, "rb") as f:
-                sample = f.read(4096)
-
-            if b"\x00" in sample:
-                return FileType.BINARY
-
-            sample.decode("utf-8", errors="strict")
-            return FileType.TEXT
-        except Exception:
-            return FileType.UNKNOWN
+        return cls.probe(path).file_type
 
     @classmethod
     def get_comment_style(cls, path: Path) -> Optional[Dict[str, object]]:
@@ -507,19 +2481,10 @@ class FileContentDetector:
         """
         Detect file encoding with a simple trial strategy.
 
-        Returns one of the tried encodings; falls back to latin-1 (never fails).
+        Returns "utf-8" if the start of the file decodes as UTF-8, otherwise
+        latin-1 (never fails); unreadable files give "utf-8".
         """
-        encodings = ("utf-8", "latin-1", "cp1252", "utf-16")
-        for enc in encodings:
-            try:
-                with open(path, "r", encoding=enc) as f:
-                    f.read(2048)
-                return enc
-            except UnicodeDecodeError:
-                continue
-            except Exception:
-                return "utf-8"
-        return "latin-1"
+        return cls.probe(path).encoding
 
 
 # ============================================================================
@@ -784,12 +2749,29 @@ def handle_file_errors(func: Callable) -> Callable:
 __all__ = [
     # Configuration
     "FilterConfig",
+    "FilterMatcher",
+    "WALK_ENGINES",
+    "FILE_SOURCES",
     "FileType",
+    # Git index
+    "find_git_worktree",
+    "read_git_index",
     # GitIgnore
     "GitIgnoreParser",
+    "ScopedGitIgnoreParser",
+    # Archives
+    "ARCHIVE_SUFFIXES",
+    "ArchiveMember",
+    "ArchiveReader",
     # File System
+    "DirListing",
+    "scan_directory",
+    "ParallelScanner",
+    "WalkSnapshot",
+    "FileHashCache",
     "FileSystemWalker",
     # Content Detection
+    "ContentProbe",
     "FileContentDetector",
     # Safe Operations
     "SafeFileProcessor",
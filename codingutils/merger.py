@@ -5,29 +5,71 @@ Advanced file merger with intelligent filtering and formatting.
 from __future__ import annotations
 
 import argparse
+import bz2
+import codecs
+import contextlib
+import fnmatch
+import gzip
 import hashlib
+import io
+import itertools
+import json
 import logging
+import lzma
+import math
+import mmap
+import os
+import queue
+import re
 import shutil
 import sys
+import threading
 import time
-from dataclasses import dataclass
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
 
 from codingutils.common_utils import (
+    ContentProbe,
     FilterConfig,
+    FilterMatcher,
     GitIgnoreParser,
+    ScopedGitIgnoreParser,
     FileSystemWalker,
     FileContentDetector,
+    FileHashCache,
     FileType,
     ProgressReporter,
+    WalkSnapshot,
     format_size,
     get_relative_path,
+    safe_write,
 )
 
 logger = logging.getLogger(__name__)
 
+# How select_files() fits files into max_total_size (see SmartFileMerger._pack_by_priority)
+BUDGET_MODES: Tuple[str, ...] = ("order", "priority")
+# Output compression; "auto" picks it from the output suffix (see COMPRESSION_SUFFIXES)
+COMPRESSIONS: Tuple[str, ...] = ("auto", "none", "gzip", "bz2", "xz")
+COMPRESSION_SUFFIXES: Dict[str, str] = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}
+# Table of contents written next to an output with MergerConfig.toc (see extract_file())
+TOC_SUFFIX = ".toc.json"
+TOC_VERSION = 1
+# How deduplicate_lines remembers lines: the lines themselves or their digests (see LineDigestSet)
+DEDUP_LINE_DIGESTS: Tuple[str, ...] = ("exact", "digest64", "digest128")
+# When two digests match: "trust" them, or also require equal line "length"
+DEDUP_LINE_COLLISIONS: Tuple[str, ...] = ("trust", "length")
+# Where deduplicate_lines looks for earlier copies: the same file or the whole output
+DEDUP_LINE_SCOPES: Tuple[str, ...] = ("file", "global")
+# output_file meaning "write to standard output" (see MergerConfig.writes_to_stream())
+STDOUT_OUTPUT = "-"
+
 
 
 
@@ -37,6 +79,10 @@ logger = logging.getLogger(__name__)
 class MergerConfig(FilterConfig):
 
     output_file: Path = Path("merged_output.txt")
+    # Write to this binary stream instead of output_file (output_file "-" = stdout), see _write_stream()
+    output_stream: Optional[BinaryIO] = None
+    # (pattern, output) pairs merged from one walk instead of output_file (see target_configs())
+    targets: List[Tuple[str, Path]] = field(default_factory=list)
     encoding: str = "utf-8"
 
 
@@ -54,11 +100,37 @@ class MergerConfig(FilterConfig):
     add_line_numbers: bool = False
     remove_empty_lines: bool = False
     deduplicate_lines: bool = False
+    # Non-default digest or scope implies deduplicate_lines (see DEDUP_LINE_*)
+    dedup_lines_digest: str = "exact"
+    dedup_lines_collisions: str = "trust"
+    dedup_lines_scope: str = "file"
 
 
     sort_files: bool = False
+    stream_files: bool = False
+    # Threads reading and rendering file sections ahead of the writer (1 = sequential)
+    read_workers: int = 1
+    # Approximate input bytes of sections read ahead but not yet written
+    read_ahead_bytes: int = 64 * 1024 * 1024
+    # Copy untransformed files byte-for-byte instead of decoding them line by line
+    zero_copy: bool = True
+    # Compress the output on a background thread (see COMPRESSIONS); level None = codec default
+    compression: str = "auto"
+    compression_level: Optional[int] = None
+    # Write a table of contents with byte offsets next to the output (see toc_path(), extract_file())
+    toc: bool = False
+    # Write each distinct file content once; later copies get a stub (see SmartFileMerger._plan_duplicates)
+    dedup_files: bool = False
+    # Keep content digests between runs (see FileHashCache); implies dedup_files
+    hash_cache_file: Optional[Path] = None
     max_file_size: Optional[int] = None
     max_total_size: Optional[int] = None
+    budget_mode: str = "order"
+    # Priority scores for budget_mode="priority": 1 + the weights below
+    priority_recency_weight: float = 0.0
+    priority_size_weight: float = 0.0
+    priority_path_weights: Dict[str, float] = field(default_factory=dict)
+    priority_pattern_weights: Dict[str, float] = field(default_factory=dict)
 
 
     include_binary_placeholders: bool = True
@@ -70,6 +142,17 @@ class MergerConfig(FilterConfig):
     backup_dir: Optional[Path] = None
     overwrite_backups: bool = False
 
+    # Reuse sections of unchanged files from the previous output (see MergeManifest)
+    incremental: bool = False
+    manifest_file: Optional[Path] = None
+
+    # Split the output into shards (see SmartFileMerger._plan_shards); output_file becomes their index
+    shard_max_bytes: Optional[int] = None
+    shard_max_files: Optional[int] = None
+    shard_max_lines: Optional[int] = None
+    # Cut text files larger than a shard at line boundaries instead of giving them a shard of their own
+    shard_split_files: bool = False
+
     def __post_init__(self) -> None:
         FilterConfig.__post_init__(self)
 
@@ -77,6 +160,14 @@ class MergerConfig(FilterConfig):
         if self.backup_dir is not None:
             self.backup_dir = Path(self.backup_dir)
             self.keep_backups = True
+        if self.manifest_file is not None:
+            self.manifest_file = Path(self.manifest_file)
+            self.incremental = True
+        if self.hash_cache_file is not None:
+            self.hash_cache_file = Path(self.hash_cache_file)
+            self.dedup_files = True
+        if self.dedup_lines_digest != "exact" or self.dedup_lines_scope != "file":
+            self.deduplicate_lines = True
 
         if self.max_file_size is not None and self.max_file_size <= 0:
             raise ValueError("max_file_size must be positive")
@@ -84,6 +175,443 @@ class MergerConfig(FilterConfig):
         if self.max_total_size is not None and self.max_total_size <= 0:
             raise ValueError("max_total_size must be positive")
 
+        if self.compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression: {self.compression}")
+        if self.compression_level is not None and not 0 <= self.compression_level <= 9:
+            raise ValueError("compression_level must be between 0 and 9")
+
+        if self.dedup_lines_digest not in DEDUP_LINE_DIGESTS:
+            raise ValueError(f"Unsupported dedup_lines_digest: {self.dedup_lines_digest}")
+        if self.dedup_lines_collisions not in DEDUP_LINE_COLLISIONS:
+            raise ValueError(f"Unsupported dedup_lines_collisions: {self.dedup_lines_collisions}")
+        if self.dedup_lines_scope not in DEDUP_LINE_SCOPES:
+            raise ValueError(f"Unsupported dedup_lines_scope: {self.dedup_lines_scope}")
+
+        if self.budget_mode not in BUDGET_MODES:
+            raise ValueError(f"Unsupported budget_mode: {self.budget_mode}")
+        self.priority_path_weights = {
+            p.strip("/"): float(w) for p, w in dict(self.priority_path_weights).items()
+        }
+        self.priority_pattern_weights = {p: float(w) for p, w in dict(self.priority_pattern_weights).items()}
+
+        if self.read_workers < 1:
+            raise ValueError("read_workers must be at least 1")
+
+        if self.read_ahead_bytes <= 0:
+            raise ValueError("read_ahead_bytes must be positive")
+
+        for name in ("shard_max_bytes", "shard_max_files", "shard_max_lines"):
+            value = getattr(self, name)
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} must be positive")
+
+        if self.shard_split_files and self.shard_max_bytes is None and self.shard_max_lines is None:
+            raise ValueError("shard_split_files needs shard_max_bytes or shard_max_lines")
+
+        if self.incremental and self.is_sharded():
+            raise ValueError("incremental merge does not support sharded output")
+
+        if self.incremental and self.dedup_lines_scope == "global":
+            raise ValueError("incremental merge does not support dedup_lines_scope='global'")
+
+        if self.incremental and self.output_compression() is not None:
+            raise ValueError("incremental merge does not support compressed output")
+
+        if self.toc and self.output_compression() is not None:
+            raise ValueError("toc needs uncompressed output")
+
+        self.targets = [(str(pattern), Path(output)) for pattern, output in self.targets]
+        if self.targets:
+            outputs = [output for _pattern, output in self.targets]
+            if len(set(outputs)) != len(outputs):
+                raise ValueError("targets need distinct outputs")
+            if self.output_stream is not None:
+                raise ValueError("targets cannot share output_stream")
+            if self.manifest_file is not None:
+                raise ValueError("targets cannot share manifest_file")
+            # Each target must be valid as a config of its own
+            self.target_configs()
+
+        if self.writes_to_stream() and not self.targets:
+            for name, enabled in (
+                ("incremental merge", self.incremental),
+                ("toc", self.toc),
+                ("sharded output", self.is_sharded()),
+                ("keep_backups", self.keep_backups),
+            ):
+                if enabled:
+                    raise ValueError(f"{name} needs an output file, not a stream")
+
+    def target_configs(self) -> List["MergerConfig"]:
+        """One single-output config per target: its pattern as include_pattern, its output as output_file."""
+        return [
+            replace(self, targets=[], include_pattern=pattern, output_file=output)
+            for pattern, output in self.targets
+        ]
+
+    def writes_to_stream(self) -> bool:
+        """The output goes to output_stream or stdout instead of a file."""
+        return self.output_stream is not None or str(self.output_file) == STDOUT_OUTPUT
+
+    def output_label(self) -> str:
+        """output_file for messages; streams have no path."""
+        if self.output_stream is not None:
+            return "<stream>"
+        return "<stdout>" if self.writes_to_stream() else str(self.output_file)
+
+    def is_sharded(self) -> bool:
+        return self.shard_max_bytes is not None or self.shard_max_files is not None or self.shard_max_lines is not None
+
+    def output_compression(self) -> Optional[str]:
+        """Codec of the output ("gzip", "bz2", "xz") or None for plain text."""
+        if self.compression == "auto":
+            return COMPRESSION_SUFFIXES.get(self.output_file.suffix.lower())
+        return None if self.compression == "none" else self.compression
+
+    def output_name_parts(self) -> Tuple[str, str]:
+        """output_file name as (stem, suffix); the suffix keeps a compression extension (`.txt.gz`)."""
+        name = self.output_file.name
+        stem, suffix = os.path.splitext(name)
+        if suffix.lower() in COMPRESSION_SUFFIXES:
+            inner_stem, inner_suffix = os.path.splitext(stem)
+            return inner_stem, inner_suffix + suffix
+        return stem, suffix
+
+    def shard_path(self, number: int) -> Path:
+        """Path of shard `number` (1-based): `<stem>.part001<suffix>` next to output_file."""
+        stem, suffix = self.output_name_parts()
+        return self.output_file.with_name(f"{stem}.part{number:03d}{suffix}")
+
+    def manifest_path(self) -> Path:
+        """Manifest of an incremental merge: `manifest_file` or `<output_file>.manifest.json`."""
+        if self.manifest_file is not None:
+            return self.manifest_file
+        return self.output_file.with_name(self.output_file.name + ".manifest.json")
+
+
+
+
+
+
+class MergeManifest:
+    """
+    Sidecar manifest of an incremental merge (see MergerConfig.incremental).
+
+    For every file section it stores the file's size, mtime and detected
+    encoding plus offset, length and CRC-32 of the section body (everything
+    after the per-file header) in the output. A later merge with the same
+    fingerprint copies the bodies of unchanged files from the previous output
+    instead of reading them again. Per-file headers, metadata and footer are
+    always rendered anew, so the result is identical to a full merge.
+
+    Safety rules:
+    - another fingerprint (filters, body-affecting options) discards the manifest
+    - an output whose size or mtime differs from the recorded ones is not reused
+    - a reused body must still match its CRC-32, otherwise the file is read again
+    - files modified less than RACY_WINDOW_NS before the merge started and
+      sections that failed to read are not stored
+    """
+
+    VERSION = 1
+    RACY_WINDOW_NS = WalkSnapshot.RACY_WINDOW_NS
+
+    def __init__(self, path: Path, fingerprint: str) -> None:
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self.started_ns = time.time_ns()
+        self.stats: Dict[str, int] = {"reused": 0, "rendered": 0}
+        self._old: Dict[str, Dict[str, Any]] = {}
+        self._new: Dict[str, Dict[str, Any]] = {}
+        # Previous output, mapped while its sections are copied
+        self._src: Optional[BinaryIO] = None
+        self._data: Optional[mmap.mmap] = None
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str, output: Path) -> "MergeManifest":
+        """Load a manifest; a missing, unreadable or mismatching one (or output) gives an empty one."""
+        manifest = cls(path, fingerprint)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return manifest
+        except Exception as e:
+            logger.warning("Could not read merge manifest %s: %s", path, e)
+            return manifest
+
+        if data.get("version") != cls.VERSION or data.get("fingerprint") != fingerprint:
+            logger.debug("Merge manifest %s was made with other settings, merging all files", path)
+            return manifest
+
+        recorded = data.get("output") or {}
+        try:
+            src = open(output, "rb")
+        except OSError:
+            return manifest
+        try:
+            st = os.fstat(src.fileno())
+            if st.st_size != recorded.get("size") or st.st_mtime_ns != recorded.get("mtime_ns"):
+                logger.debug("Output %s changed since the last merge, merging all files", output)
+                src.close()
+                return manifest
+            if st.st_size:
+                manifest._data = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            src.close()
+            return manifest
+
+        manifest._src = src
+        manifest._old = data.get("files", {})
+        return manifest
+
+    def lookup(self, path: Path, st: Optional[os.stat_result]) -> Optional[Dict[str, Any]]:
+        """Return the stored record of `path` if its size and mtime are unchanged."""
+        if self._src is None or st is None:
+            return None
+        rec = self._old.get(str(path))
+        if rec is None or rec["size"] != st.st_size or rec["mtime_ns"] != st.st_mtime_ns:
+            return None
+        return rec
+
+    def copy_body(self, rec: Dict[str, Any], out) -> bool:
+        """
+        Append the stored body of `rec` to the real output file `out`.
+
+        Returns False (nothing written) if the previous output no longer
+        holds the recorded bytes.
+        """
+        offset, length = rec["offset"], rec["length"]
+        size = len(self._data) if self._data is not None else 0
+        if self._src is None or offset < 0 or offset + length > size:
+            return False
+
+        if self._data is not None and length:
+            with memoryview(self._data) as whole, whole[offset : offset + length] as body:
+                if zlib.crc32(body) != rec["crc32"]:
+                    return False
+                out.flush()
+                _copy_file_bytes(self._src.fileno(), out.fileno(), body, start=offset)
+        elif rec["crc32"] != 0:
+            return False
+        self.stats["reused"] += 1
+        return True
+
+    def record(
+        self,
+        path: Path,
+        st: Optional[os.stat_result],
+        *,
+        encoding: Optional[str],
+        offset: int,
+        length: int,
+        stats: Dict[str, int],
+        crc32: Optional[int] = None,
+    ) -> None:
+        """Store the body of a written section; `crc32` None means "compute in finish()"."""
+        if crc32 is None:
+            self.stats["rendered"] += 1
+        if st is None or stats.get("files_failed"):
+            return
+        if st.st_mtime_ns >= self.started_ns - self.RACY_WINDOW_NS:
+            return
+
+        self._new[str(path)] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "encoding": encoding,
+            "offset": offset,
+            "length": length,
+            "crc32": crc32,
+            "stats": stats,
+        }
+
+    def finish(self, output: Path) -> None:
+        """Release the previous output and checksum the new bodies in `output` (not yet moved)."""
+        self.close()
+        missing = [rec for rec in self._new.values() if rec["crc32"] is None]
+        if not missing:
+            return
+        with open(output, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                for rec in missing:
+                    rec["crc32"] = 0
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data, memoryview(data) as whole:
+                for rec in missing:
+                    with whole[rec["offset"] : rec["offset"] + rec["length"]] as body:
+                        rec["crc32"] = zlib.crc32(body)
+
+    def save(self, output: Path) -> bool:
+        try:
+            st = output.stat()
+        except OSError as e:
+            logger.warning("Could not stat %s, merge manifest not saved: %s", output, e)
+            return False
+        data = {
+            "version": self.VERSION,
+            "fingerprint": self.fingerprint,
+            "output": {"size": st.st_size, "mtime_ns": st.st_mtime_ns},
+            "files": self._new,
+        }
+        return safe_write(self.path, json.dumps(data), backup=False)
+
+    def close(self) -> None:
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        if self._src is not None:
+            self._src.close()
+            self._src = None
+
+
+
+
+
+
+class LineDigestSet:
+    """
+    Set of text lines kept as fixed-width digests (see MergerConfig.dedup_lines_digest).
+
+    Digests live in an open-addressing table with linear probing, backed by
+    array("Q") columns kept at most half full: about 16 bytes per distinct
+    line for 64-bit digests and 32 for 128-bit ones, whatever the line
+    length (a set of the lines costs their text plus ~70 bytes each).
+    64-bit digests are Python's str hash (salted per process and cached on
+    the string), 128-bit ones are BLAKE2b.
+
+    Two different lines with the same digest count as one, so the later one
+    is dropped; with n distinct lines that happens with probability about
+    n**2 / 2**(bits + 1). collisions="length" also stores each line's length
+    (4 more bytes per slot), so only lines of equal length can collide.
+    """
+
+    MAX_LOAD = 0.5
+
+    def __init__(self, bits: int = 64, *, collisions: str = "trust", capacity: int = 256) -> None:
+        if bits not in (64, 128):
+            raise ValueError("bits must be 64 or 128")
+        if collisions not in DEDUP_LINE_COLLISIONS:
+            raise ValueError(f"Unsupported collisions: {collisions}")
+        self.bits = bits
+        self.collisions = collisions
+        self._count = 0
+        self._allocate(max(8, 1 << (capacity - 1).bit_length()))
+
+    def _allocate(self, size: int) -> None:
+        self._mask = size - 1
+        self._limit = int(size * self.MAX_LOAD)
+        # Slot is empty while its key is 0 (digests of 0 are stored as 1)
+        self._keys = array("Q", bytes(8 * size))
+        self._lows: Optional[array] = array("Q", bytes(8 * size)) if self.bits == 128 else None
+        self._lengths: Optional[array] = array("I", bytes(4 * size)) if self.collisions == "length" else None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the table columns."""
+        return sum(col.itemsize * len(col) for col in (self._keys, self._lows, self._lengths) if col is not None)
+
+    def add(self, line: str) -> bool:
+        """Remember `line`; False if it (or a line with the same digest) was added before."""
+        return bool(self.filter_new((line,)))
+
+    def filter_new(self, lines: Iterable[str]) -> List[str]:
+        """Lines of `lines` not added before, first occurrences only; all of them are added."""
+        new: List[str] = []
+        wide = self.bits == 128
+        blake2b = hashlib.blake2b
+        keys, lows, lengths, mask = self._keys, self._lows, self._lengths, self._mask
+        for line in lines:
+            if wide:
+                digest = blake2b(line.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+                key, low = int.from_bytes(digest[:8], "little") or 1, int.from_bytes(digest[8:], "little")
+            else:
+                key, low = hash(line) & _U64 or 1, 0
+            length = len(line) & 0xFFFFFFFF
+
+            i = key & mask
+            while True:
+                k = keys[i]
+                if not k:
+                    break
+                if k == key and (lows is None or lows[i] == low) and (lengths is None or lengths[i] == length):
+                    break
+                i = (i + 1) & mask
+            if k:
+                continue
+
+            keys[i] = key
+            if lows is not None:
+                lows[i] = low
+            if lengths is not None:
+                lengths[i] = length
+            new.append(line)
+            self._count += 1
+            if self._count > self._limit:
+                self._grow()
+                keys, lows, lengths, mask = self._keys, self._lows, self._lengths, self._mask
+        return new
+
+    def _grow(self) -> None:
+        keys, lows, lengths = self._keys, self._lows, self._lengths
+        self._allocate(2 * len(keys))
+        new_keys, new_lows, new_lengths, mask = self._keys, self._lows, self._lengths, self._mask
+        for j, key in enumerate(keys):
+            if not key:
+                continue
+            i = key & mask
+            while new_keys[i]:
+                i = (i + 1) & mask
+            new_keys[i] = key
+            if new_lows is not None and lows is not None:
+                new_lows[i] = lows[j]
+            if new_lengths is not None and lengths is not None:
+                new_lengths[i] = lengths[j]
+
+
+
+
+
+
+@dataclass(slots=True)
+class _RenderedSection:
+    """A file section rendered by a reader thread (see MergerConfig.read_workers)."""
+
+    header: str = ""
+    body: str = ""
+    counts: Dict[str, int] = field(default_factory=dict)
+    error: Optional[Exception] = None
+
+
+
+
+
+
+@dataclass(slots=True)
+class _TransformState:
+    """Line state carried across the blocks of one file (see SmartFileMerger._iter_text_blocks())."""
+
+    seen: Union[Set[str], LineDigestSet, None]
+    line_no: int
+
+
+@dataclass(slots=True)
+class _ShardPiece:
+    """A file, or a line-aligned byte range of one, assigned to a shard (see MergerConfig.shard_split_files)."""
+
+    path: Path
+    index: int
+    size: int
+    lines: int = 0
+    start: Optional[int] = None
+    end: Optional[int] = None
+    # Source lines before `start`: line numbers of a split file continue from there
+    first_line: int = 0
+    part: int = 1
+    parts: int = 1
+
 
 
 
@@ -94,8 +622,10 @@ class SmartFileMerger:
         self.config = config
 
         self._roots: List[Path] = []
+        # stat() results of this run's files, gathered once (see _stat())
+        self._file_stats: Dict[Path, Optional[os.stat_result]] = {}
         self._gitignore = self._create_gitignore_parser()
-        self._walker = FileSystemWalker(config, gitignore_parser=self._gitignore)
+        self._walker = FileSystemWalker(config, gitignore_parser=self._gitignore, archives=True)
 
         self.stats: Dict[str, object] = {
             "start_time": 0.0,
@@ -105,12 +635,37 @@ class SmartFileMerger:
             "files_processed": 0,
             "files_skipped_by_limits": 0,
             "files_skipped_binary": 0,
+            "files_deduplicated": 0,
             "files_failed": 0,
             "excluded_items": 0,
             "total_found_size": 0,
             "total_selected_size": 0,
             "output_size": 0,
+            # The reader of a stream output went away before the end (see _write_stream())
+            "output_closed": False,
         }
+        # Guards stats updated by reader threads (see read_workers)
+        self._stats_lock = threading.Lock()
+        # Stats bumped while the current thread renders a section body (see _write_file_body())
+        self._section_counts = threading.local()
+        # Manifest of the running incremental merge
+        self._manifest: Optional[MergeManifest] = None
+        # Why select_files() dropped a file, beyond its reason (see _pack_by_priority())
+        self._skip_details: Dict[Path, str] = {}
+        # Files with the content of an earlier one: path -> (first path, its FILE index)
+        self._duplicates: Dict[Path, Tuple[Path, int]] = {}
+        # line_number_format of 1..n, shared by all files (see _line_prefixes())
+        self._number_prefixes: List[str] = []
+        self._prefix_lock = threading.Lock()
+        # Lines seen so far with dedup_lines_scope="global" (see _new_line_set())
+        self._global_lines: Union[Set[str], LineDigestSet, None] = None
+        # Digest cache shared by the mergers of all targets (see _merge_targets())
+        self._hash_cache: Optional[FileHashCache] = None
+        # Targets log their results once all of them are written
+        self._log_when_done = True
+        self._progress_label = "Merging files"
+        # Stats of every target by output, with config.targets
+        self.target_stats: Dict[str, Dict[str, object]] = {}
 
 
 
@@ -119,17 +674,39 @@ class SmartFileMerger:
     def _resolve_roots(self) -> List[Path]:
         roots = [Path(d).resolve() for d in (self.config.directories or ["."])]
         self._roots = roots
+        self._file_stats = {}
         return roots
 
     def _rel(self, p: Path) -> str:
 
-        rp = p.resolve()
+        # Walker output lies lexically below a resolved root; resolve() only for other paths
+        rel = self._rel_to_roots(p)
+        if rel is None:
+            rel = self._rel_to_roots(p.resolve())
+        return rel if rel is not None else get_relative_path(p)
+
+    def _rel_to_roots(self, p: Path) -> Optional[str]:
         for r in self._roots:
-            try:
-                return rp.relative_to(r).as_posix()
-            except Exception:
-                continue
-        return get_relative_path(p)
+            rel = FilterMatcher.relative_posix(p, r)
+            if rel is not None:
+                return rel
+        return None
+
+    def _stat(self, path: Path) -> Optional[os.stat_result]:
+        """
+        stat() of a file of this run, gathered once and reused by selection,
+        headers and rendering (walk entries first, see FileSystemWalker.get_stat).
+        None if the file cannot be stat'ed.
+        """
+        try:
+            return self._file_stats[path]
+        except KeyError:
+            st = self._file_stats[path] = self._walker.get_stat(path)
+            return st
+
+    def _probe(self, path: Path, st: Optional[os.stat_result]) -> ContentProbe:
+        """FileContentDetector.probe() that also reads archive members (see FileSystemWalker.open_file)."""
+        return FileContentDetector.probe(path, st, opener=self._walker.open_file)
 
 
 
@@ -140,10 +717,13 @@ class SmartFileMerger:
             return None
 
         root = Path(self.config.directories[0]).resolve() if self.config.directories else Path.cwd().resolve()
-        parser = GitIgnoreParser(root_dir=root)
+        parser: GitIgnoreParser
         if self.config.custom_gitignore:
+            parser = GitIgnoreParser(root_dir=root)
             parser.load_from_file(self.config.custom_gitignore)
         else:
+            # Auto-discovery also honours nested .gitignore files, read lazily during the walk
+            parser = ScopedGitIgnoreParser(root_dir=root)
             parser.load_from_file()
         return parser
 
@@ -156,11 +736,8 @@ class SmartFileMerger:
         files = self._walker.find_files(roots, recursive=self.config.recursive)
 
 
-        try:
-            out_abs = self.config.output_file.resolve()
-            files = [f for f in files if f.resolve() != out_abs]
-        except Exception:
-            pass
+        is_own = self._own_outputs()
+        files = [f for f in files if not is_own(f)]
 
 
         if self.config.backup_dir is not None:
@@ -180,49 +757,91 @@ class SmartFileMerger:
 
         total = 0
         for f in files:
-            try:
-                total += f.stat().st_size
-            except Exception:
-                pass
+            st = self._stat(f)
+            total += st.st_size if st is not None else 0
         self.stats["total_found_size"] = total
 
         return files
 
+    def _own_outputs(self) -> Callable[[Path], bool]:
+        """
+        Predicate for files this merger writes (output, incremental manifest,
+        hash cache, shards `<stem>.partNNN<suffix>` next to the output, their
+        tables of contents); never merged themselves. With targets, the files
+        of every target.
+        """
+        checks = [self._own_outputs_of(cfg) for cfg in self.config.target_configs() or [self.config]]
+        if len(checks) == 1:
+            return checks[0]
+        return lambda f: any(check(f) for check in checks)
+
     @staticmethod
-    def _is_under_dir(p: Path, base: Path) -> bool:
+    def _own_outputs_of(cfg: MergerConfig) -> Callable[[Path], bool]:
+        paths = [] if cfg.writes_to_stream() else [cfg.output_file]
+        if cfg.incremental:
+            paths.append(cfg.manifest_path())
+        if cfg.hash_cache_file is not None:
+            paths.append(cfg.hash_cache_file)
+        own: Set[Path] = set()
+        for p in paths:
+            try:
+                # Walker yields canonical paths (resolved roots, resolved symlinks).
+                own.add(p.resolve())
+            except Exception:
+                pass
+
+        out = cfg.output_file
         try:
-            p.resolve().relative_to(base.resolve())
-            return True
+            out_dir: Optional[Path] = out.parent.resolve()
         except Exception:
-            return False
+            out_dir = None
+        stem, suffix = cfg.output_name_parts()
+        shard_name = re.compile(re.escape(stem) + r"\.part\d{3,}" + re.escape(suffix))
+
+        def is_own(f: Path) -> bool:
+            if f.name.endswith(TOC_SUFFIX):
+                f = f.with_name(f.name[: -len(TOC_SUFFIX)])
+            return f in own or (f.parent == out_dir and shard_name.fullmatch(f.name) is not None)
+
+        return is_own
+
+    @staticmethod
+    def _is_under_dir(p: Path, base: Path) -> bool:
+        """`p` lies inside `base`; both canonical (walker output, resolved backup_dir)."""
+        return FilterMatcher.relative_posix(p, base) is not None
 
     def select_files(self, files: List[Path]) -> Tuple[List[Path], List[Tuple[Path, str]]]:
         """
         Returns (selected_files, skipped_with_reason).
         Reasons: max_file_size, max_total_size, stat_failed
+
+        With budget_mode="priority" max_total_size is filled by
+        `_pack_by_priority()` instead of in file order.
         """
         skipped: List[Tuple[Path, str]] = []
         selected: List[Path] = []
+        self._skip_details = {}
+        packing = self.config.budget_mode == "priority" and self.config.max_total_size is not None
 
         total = 0
 
         for f in files:
-            try:
-                size = f.stat().st_size
-            except Exception:
-                skipped.append((f, "stat_failed"))
-                continue
-
-            if self.config.max_file_size is not None and size > self.config.max_file_size:
-                skipped.append((f, "max_file_size"))
-                continue
-
-            if self.config.max_total_size is not None and (total + size) > self.config.max_total_size:
-                skipped.append((f, "max_total_size"))
+            st = self._stat(f)
+            reason = self._limit_reason(st.st_size if st is not None else None, 0 if packing else total)
+            if reason is not None:
+                skipped.append((f, reason))
                 continue
 
             selected.append(f)
-            total += size
+            total += st.st_size
+
+        if packing and selected:
+            selected, dropped = self._pack_by_priority(selected)
+            if dropped:
+                skipped.extend((f, "max_total_size") for f in dropped)
+                position = {f: i for i, f in enumerate(files)}
+                skipped.sort(key=lambda item: position[item[0]])
+                total = sum(st.st_size for f in selected if (st := self._stat(f)) is not None)
 
         self.stats["files_selected"] = len(selected)
         self.stats["total_selected_size"] = total
@@ -232,6 +851,172 @@ class SmartFileMerger:
 
         return selected, skipped
 
+    def _limit_reason(self, size: Optional[int], total: int) -> Optional[str]:
+        """Return skip reason for a file of `size` given `total` bytes already selected."""
+        if size is None:
+            return "stat_failed"
+
+        if self.config.max_file_size is not None and size > self.config.max_file_size:
+            return "max_file_size"
+
+        if self.config.max_total_size is not None and (total + size) > self.config.max_total_size:
+            return "max_total_size"
+
+        return None
+
+    def _pack_by_priority(self, candidates: List[Path]) -> Tuple[List[Path], List[Path]]:
+        """
+        Choose the candidates of highest total priority within max_total_size.
+
+        0/1 knapsack approximation in O(n log n): files are taken by priority
+        per byte (empty files first) while they fit, then the pick is compared
+        with the best single file that fits, which bounds the result at half
+        the optimum or better. If that file wins, the budget it leaves is
+        filled the same greedy way. Returns (selected, dropped), both in candidate
+        order; every dropped file gets an explanation in `_skip_details`.
+        """
+        budget = int(self.config.max_total_size or 0)
+        sizes = [st.st_size if (st := self._stat(f)) is not None else 0 for f in candidates]
+        if sum(sizes) <= budget:
+            return candidates, []
+
+        scores = self._priority_scores(candidates, sizes)
+        n = len(candidates)
+        order = sorted(range(n), key=lambda i: (sizes[i] > 0, -scores[i] / sizes[i] if sizes[i] else 0.0, i))
+
+        taken = [False] * n
+        used = 0
+        value = 0.0
+        for i in order:
+            if used + sizes[i] <= budget:
+                taken[i] = True
+                used += sizes[i]
+                value += scores[i]
+
+        best = max((i for i in range(n) if sizes[i] <= budget), key=lambda i: scores[i], default=None)
+        single = best is not None and scores[best] > value
+        if single:
+            assert best is not None
+            taken = [i == best for i in range(n)]
+            used = sizes[best]
+            for i in order:
+                if not taken[i] and used + sizes[i] <= budget:
+                    taken[i] = True
+                    used += sizes[i]
+
+        if single:
+            why = (
+                f"budget went to {self._rel(candidates[best])} (priority {scores[best]:.2f}), "
+                "the rest to files of higher priority per byte"
+            )
+        else:
+            why = f"budget {format_size(budget)} filled by files of higher priority per byte"
+        for r, i in enumerate(order, 1):
+            if not taken[i]:
+                self._skip_details[candidates[i]] = (
+                    f"priority {scores[i]:.2f} for {format_size(sizes[i])}, rank {r}/{n}; {why}"
+                )
+
+        selected = [f for f, t in zip(candidates, taken) if t]
+        dropped = [f for f, t in zip(candidates, taken) if not t]
+        return selected, dropped
+
+    def _priority_scores(self, files: List[Path], sizes: List[int]) -> List[float]:
+        """
+        Priority of each file: 1 + weighted recency (newest = full weight) +
+        weighted smallness (log scale, smallest = full weight) + weights of
+        matching path prefixes and glob patterns (name or relative path).
+        Never negative.
+        """
+        cfg = self.config
+        mtimes = [st.st_mtime_ns if (st := self._stat(f)) is not None else 0 for f in files]
+        m_lo, m_hi = min(mtimes), max(mtimes)
+        log_sizes = [math.log1p(s) for s in sizes]
+        s_lo, s_hi = min(log_sizes), max(log_sizes)
+        patterns = [(re.compile(fnmatch.translate(p)), w) for p, w in cfg.priority_pattern_weights.items()]
+        prefixes = list(cfg.priority_path_weights.items())
+        need_rel = bool(patterns or prefixes)
+
+        scores: List[float] = []
+        for f, mtime, log_size in zip(files, mtimes, log_sizes):
+            score = 1.0
+            if cfg.priority_recency_weight and m_hi > m_lo:
+                score += cfg.priority_recency_weight * (mtime - m_lo) / (m_hi - m_lo)
+            if cfg.priority_size_weight and s_hi > s_lo:
+                score += cfg.priority_size_weight * (s_hi - log_size) / (s_hi - s_lo)
+            if need_rel:
+                rel = self._rel(f)
+                for prefix, weight in prefixes:
+                    if rel == prefix or rel.startswith(prefix + "/"):
+                        score += weight
+                for rx, weight in patterns:
+                    if rx.match(f.name) or rx.match(rel):
+                        score += weight
+            scores.append(max(score, 0.0))
+        return scores
+
+    def can_stream(self) -> bool:
+        """
+        True if files can be merged while the walk is still running.
+
+        Metadata header, per-file headers (FILE i/N), sorting, sharding,
+        priority packing, file deduplication and preview all need the
+        complete file list, so streaming only applies without them.
+        """
+        cfg = self.config
+        return (
+            cfg.stream_files
+            and not cfg.preview_mode
+            and not cfg.include_metadata
+            and not cfg.include_headers
+            and not cfg.sort_files
+            and not cfg.is_sharded()
+            and not (cfg.budget_mode == "priority" and cfg.max_total_size is not None)
+            and not cfg.dedup_files
+        )
+
+    def iter_selected_files(self) -> Iterator[Path]:
+        """
+        Streaming counterpart of find_files() + select_files().
+
+        Yields files in per-directory sorted order (same order as find_files()
+        for a single root) as soon as they pass filters and size limits.
+        Stats are final once the iterator is exhausted.
+        """
+        roots = self._resolve_roots()
+
+        is_own = self._own_outputs()
+        backup_dir = self.config.backup_dir.resolve() if self.config.backup_dir is not None else None
+
+        found = found_size = selected = selected_size = skipped_by_limits = 0
+        try:
+            for f in self._walker.iter_files(roots, recursive=self.config.recursive, ordered=True):
+                if is_own(f) or (backup_dir is not None and self._is_under_dir(f, backup_dir)):
+                    continue
+
+                st = self._stat(f)
+                found += 1
+                found_size += st.st_size if st is not None else 0
+
+                reason = self._limit_reason(st.st_size if st is not None else None, selected_size)
+                if reason is not None:
+                    if reason != "stat_failed":
+                        skipped_by_limits += 1
+                    continue
+
+                selected += 1
+                selected_size += st.st_size
+                yield f
+        finally:
+            self.stats["files_found"] = found
+            self.stats["total_found_size"] = found_size
+            self.stats["files_selected"] = selected
+            self.stats["total_selected_size"] = selected_size
+            self.stats["files_skipped_by_limits"] = skipped_by_limits
+            self.stats["excluded_items"] = (
+                int(self._walker.stats.get("files_excluded", 0)) + int(self._walker.stats.get("directories_excluded", 0))
+            )
+
 
 
 
@@ -243,7 +1028,7 @@ class SmartFileMerger:
         lines.append("=" * 60)
         lines.append("MERGE PREVIEW")
         lines.append("=" * 60)
-        lines.append(f"Output: {self.config.output_file}")
+        lines.append(f"Output: {self.config.output_label()}")
         lines.append(f"Pattern: {self.config.include_pattern}")
         lines.append(f"Recursive: {self.config.recursive}")
         if self.config.max_depth is not None:
@@ -255,6 +1040,7 @@ class SmartFileMerger:
         lines.append("LIMITS:")
         lines.append(f"  max_file_size: {format_size(self.config.max_file_size) if self.config.max_file_size else 'none'}")
         lines.append(f"  max_total_size: {format_size(self.config.max_total_size) if self.config.max_total_size else 'none'}")
+        lines.append(f"  budget_mode: {self.config.budget_mode}")
         lines.append("")
 
         lines.append("COUNTS:")
@@ -271,7 +1057,11 @@ class SmartFileMerger:
         lines.append(f"  compact_file_headers: {self.config.compact_file_headers}")
         lines.append(f"  add_line_numbers: {self.config.add_line_numbers}")
         lines.append(f"  remove_empty_lines: {self.config.remove_empty_lines}")
-        lines.append(f"  deduplicate_lines(within file): {self.config.deduplicate_lines}")
+        lines.append(f"  deduplicate_lines({self._dedup_lines_scope_label()}): {self.config.deduplicate_lines}")
+        if self.config.deduplicate_lines and self.config.dedup_lines_digest != "exact":
+            lines.append(f"  dedup_lines_digest: {self.config.dedup_lines_digest} ({self.config.dedup_lines_collisions})")
+        if self.config.dedup_files:
+            lines.append("  dedup_files: True")
         lines.append("")
 
         lines.append("FILES (selected):")
@@ -279,11 +1069,8 @@ class SmartFileMerger:
 
         for i, f in enumerate(selected[:200], 1):
             rel = self._rel(f)
-            size = 0
-            try:
-                size = f.stat().st_size
-            except Exception:
-                pass
+            st = self._stat(f)
+            size = st.st_size if st is not None else 0
             kind = "BINARY" if self._is_binary_fast(f) else "TEXT"
             lines.append(f"{i:4}. [{kind}] {rel} ({format_size(size)})")
 
@@ -295,7 +1082,8 @@ class SmartFileMerger:
             lines.append("SKIPPED (first 50):")
             for f, reason in skipped[:50]:
                 rel = self._rel(f)
-                lines.append(f"  - {rel} [{reason}]")
+                detail = self._skip_details.get(f)
+                lines.append(f"  - {rel} [{reason}]" + (f": {detail}" if detail else ""))
             if len(skipped) > 50:
                 lines.append(f"  ... ({len(skipped) - 50} more skipped)")
 
@@ -314,9 +1102,33 @@ class SmartFileMerger:
 
 
     def merge(self) -> bool:
+        try:
+            return self._merge()
+        finally:
+            # Archive inputs stay open while their members are read
+            self._walker.close()
+
+    def _merge(self) -> bool:
         self.stats["start_time"] = time.time()
+        self._global_lines = self._new_line_set() if self.config.dedup_lines_scope == "global" else None
 
-        files = self.find_files()
+        if self.config.targets:
+            return self._merge_targets()
+
+        if self.can_stream():
+            stream = self.iter_selected_files()
+            first = next(stream, None)
+            if first is None:
+                logger.error("No files found to merge.")
+                return False
+            return self._write_output(itertools.chain((first,), stream), [], total=None)
+        if self.config.stream_files:
+            logger.debug("Streaming disabled: headers, metadata, sorting or preview need the full file list")
+
+        return self._merge_files(self.find_files())
+
+    def _merge_files(self, files: List[Path]) -> bool:
+        """Select, deduplicate and write `files` (the walk result) to the output."""
         if not files:
             logger.error("No files found to merge.")
             return False
@@ -330,37 +1142,187 @@ class SmartFileMerger:
             logger.error("No files selected after applying limits.")
             return False
 
+        self._duplicates = self._plan_duplicates(selected)
+
+        if self.config.is_sharded():
+            return self._write_shards(selected, skipped)
+        return self._write_output(selected, skipped, total=len(selected))
+
+    def _merge_targets(self) -> bool:
+        """
+        Merge into every (pattern, output) of config.targets from a single walk.
+
+        The tree is walked, filtered and gitignore-checked once; each file then
+        goes to every target whose pattern matches its name. The targets are
+        written concurrently, each by a SmartFileMerger sharing this walk's
+        stats, archives and hash cache, and otherwise working like a
+        single-output merge (selection, limits, shards, compression).
+        """
+        files = self.find_files()
+        if not files:
+            logger.error("No files found to merge.")
+            return False
+
+        mergers = [self._target_merger(cfg) for cfg in self.config.target_configs()]
+        routed: List[List[Path]] = []
+        for merger in mergers:
+            matcher = merger.config.compile_matcher()
+            routed.append([f for f in files if not matcher.excludes(f.name, None, is_dir=False)])
+
+        cache: Optional[FileHashCache] = None
+        if self.config.dedup_files:
+            cache = FileHashCache.load(self.config.hash_cache_file, chunk_size=self.config.hash_chunk_size)
+            for merger in mergers:
+                merger._hash_cache = cache
+
+        jobs = list(zip(mergers, routed))
+        if self.config.preview_mode or len(jobs) == 1:
+            results = [merger._merge_routed(target_files) for merger, target_files in jobs]
+        else:
+            with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="merge-target") as pool:
+                results = list(pool.map(lambda job: job[0]._merge_routed(job[1]), jobs))
+
+        if cache is not None and not cache.save():
+            logger.warning("Could not write hash cache %s", self.config.hash_cache_file)
+
+        for key in _TARGET_SUMMED_STATS:
+            self.stats[key] = sum(int(m.stats[key]) for m in mergers)
+        self.stats["output_closed"] = any(m.stats["output_closed"] for m in mergers)
+        self.stats["end_time"] = time.time()
+        for merger, ok in zip(mergers, results):
+            self.target_stats[merger.config.output_label()] = merger.stats
+            if ok and not self.config.preview_mode:
+                merger._log_results()
+        return all(results)
+
+    def _target_merger(self, config: MergerConfig) -> "SmartFileMerger":
+        """Merger of one target, reusing this merger's walker, roots and stat cache."""
+        merger = SmartFileMerger(config)
+        merger._walker, merger._gitignore = self._walker, self._gitignore
+        merger._roots, merger._file_stats = self._roots, self._file_stats
+        merger._log_when_done = False
+        merger._progress_label = f"Merging {config.output_label()}"
+        return merger
+
+    def _merge_routed(self, files: List[Path]) -> bool:
+        """_merge() of a target over the files routed to it (see _merge_targets())."""
+        self.stats["start_time"] = time.time()
+        self._global_lines = self._new_line_set() if self.config.dedup_lines_scope == "global" else None
+        self.stats["files_found"] = len(files)
+        total = 0
+        for f in files:
+            st = self._stat(f)
+            total += st.st_size if st is not None else 0
+        self.stats["total_found_size"] = total
+        return self._merge_files(files)
+
+    def _plan_duplicates(self, selected: List[Path]) -> Dict[Path, Tuple[Path, int]]:
+        """
+        Find files whose content equals that of an earlier selected file.
+
+        Only files sharing their size with another one can be duplicates, so
+        only those are hashed (on `read_workers` threads, digests cached by
+        inode/mtime/size in FileHashCache). Empty files and files over
+        max_file_size are written as usual.
+        """
+        cfg = self.config
+        if not cfg.dedup_files:
+            return {}
+
+        sizes: List[Optional[int]] = []
+        for fp in selected:
+            st = self._stat(fp)
+            size = st.st_size if st is not None else None
+            if not size or (cfg.max_file_size is not None and size > cfg.max_file_size):
+                size = None
+            sizes.append(size)
+        counts: Dict[int, int] = {}
+        for size in sizes:
+            if size is not None:
+                counts[size] = counts.get(size, 0) + 1
+        candidates = [(idx, fp) for idx, (fp, size) in enumerate(zip(selected, sizes), 1) if size and counts[size] > 1]
+
+        shared = self._hash_cache is not None
+        if self._hash_cache is not None:
+            cache = self._hash_cache
+        else:
+            cache = FileHashCache.load(cfg.hash_cache_file, chunk_size=cfg.hash_chunk_size)
+        paths = [fp for _idx, fp in candidates]
+        if cfg.read_workers > 1 and len(paths) > 1:
+            with ThreadPoolExecutor(max_workers=cfg.read_workers, thread_name_prefix="merge-hash") as pool:
+                digests = list(
+                    pool.map(lambda fp: cache.digest(fp, self._stat(fp), opener=self._walker.open_file), paths)
+                )
+        else:
+            digests = [cache.digest(fp, self._stat(fp), opener=self._walker.open_file) for fp in paths]
+        if not shared and not cache.save():
+            logger.warning("Could not write hash cache %s", cfg.hash_cache_file)
+
+        first: Dict[Tuple[int, str], Tuple[Path, int]] = {}
+        duplicates: Dict[Path, Tuple[Path, int]] = {}
+        for (idx, fp), digest in zip(candidates, digests):
+            if digest is None:
+                continue
+            key = (sizes[idx - 1] or 0, digest)
+            if key in first:
+                duplicates[fp] = first[key]
+            else:
+                first[key] = (fp, idx)
+
+        logger.debug(
+            "Dedup: %d candidates, %d hashed, %d digests reused, %d duplicates",
+            len(candidates),
+            cache.stats["hashed"],
+            cache.stats["reused"],
+            len(duplicates),
+        )
+        return duplicates
+
+    def _write_output(self, selected: Iterable[Path], skipped: List[Tuple[Path, str]], *, total: Optional[int]) -> bool:
+        """
+        Write the merged output atomically (tmp file + replace, optional backup).
+
+        `total` is None when `selected` is a stream of unknown length; then
+        neither metadata nor per-file headers are written (see can_stream()).
+        """
+        if self.config.writes_to_stream():
+            return self._write_stream(selected, skipped, total=total)
 
         out_path = self.config.output_file
         out_path.parent.mkdir(parents=True, exist_ok=True)
         tmp_path = out_path.with_name(out_path.name + ".tmp")
 
         backup_path: Optional[Path] = None
+        manifest: Optional[MergeManifest] = None
+        toc: Optional[List[Dict[str, Any]]] = [] if self.config.toc else None
 
         try:
             if self.config.keep_backups and out_path.exists():
                 backup_path = self._create_output_backup(out_path)
 
-            with open(tmp_path, "w", encoding=self.config.encoding, newline="") as out:
-                if self.config.include_metadata:
-                    out.write(self._metadata_header(selected, skipped))
+            if self.config.incremental:
+                manifest = self._manifest = MergeManifest.load(
+                    self.config.manifest_path(), self._manifest_fingerprint(), out_path
+                )
 
-                with ProgressReporter(total=len(selected), description="Merging files", stream=sys.stderr) as progress:
-                    for idx, fp in enumerate(selected, 1):
-                        try:
-                            self._write_file_section(out, fp, idx, len(selected))
-                            self.stats["files_processed"] = int(self.stats["files_processed"]) + 1
-                        except Exception as e:
-                            self.stats["files_failed"] = int(self.stats["files_failed"]) + 1
-                            out.write(f"[ERROR processing {self._rel(fp)}: {e}]\n")
-                        progress.update(1)
-
-                if self.config.include_metadata:
-                    self.stats["end_time"] = time.time()
-                    out.write(self._footer())
+            with self._open_output(tmp_path) as out:
+                self._write_sections(out, selected, skipped, total=total, toc=toc)
 
+            if manifest is not None:
+                manifest.finish(tmp_path)
+            toc_doc = self._finish_toc(tmp_path, out_path, toc) if toc is not None else None
 
             tmp_path.replace(out_path)
+            if toc_doc is not None:
+                safe_write(toc_path(out_path), json.dumps(toc_doc), backup=False)
+
+            if manifest is not None:
+                manifest.save(out_path)
+                logger.info(
+                    "Incremental merge: %d sections reused, %d rendered",
+                    manifest.stats["reused"],
+                    manifest.stats["rendered"],
+                )
 
             try:
                 self.stats["output_size"] = out_path.stat().st_size
@@ -368,7 +1330,8 @@ class SmartFileMerger:
                 self.stats["output_size"] = 0
 
             self.stats["end_time"] = time.time()
-            self._log_results()
+            if self._log_when_done:
+                self._log_results()
             return True
 
         except Exception as e:
@@ -389,52 +1352,718 @@ class SmartFileMerger:
 
             return False
 
+        finally:
+            if manifest is not None:
+                manifest.close()
+            self._manifest = None
+
+    def _write_sections(
+        self,
+        out,
+        selected: Iterable[Path],
+        skipped: List[Tuple[Path, str]],
+        *,
+        total: Optional[int],
+        toc: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """Write metadata, the section of every selected file and the footer to `out`."""
+        if self.config.include_metadata and total is not None:
+            out.write(self._metadata_header(list(selected), skipped))
+
+        sections: Iterator[Tuple[Path, int, Optional[_RenderedSection]]]
+        if self._renders_in_parallel():
+            sections = self._iter_rendered_sections(selected, total or 0)
+        else:
+            sections = ((fp, idx, None) for idx, fp in enumerate(selected, 1))
+
+        # Closing the generator stops reader threads early if the output fails
+        with contextlib.closing(sections), ProgressReporter(
+            total=total or 0, description=self._progress_label, stream=sys.stderr
+        ) as progress:
+            for fp, idx, rendered in sections:
+                error: Optional[Exception] = None
+                try:
+                    self._write_file_section(out, fp, idx, total or 0, rendered, toc=toc)
+                except BrokenPipeError:
+                    raise
+                except Exception as e:
+                    error = e
+                self._finish_section(out, fp, error)
+                progress.update(1)
+
+        if self.config.include_metadata and total is not None:
+            self.stats["end_time"] = time.time()
+            out.write(self._footer())
+
+    def _write_stream(self, selected: Iterable[Path], skipped: List[Tuple[Path, str]], *, total: Optional[int]) -> bool:
+        """
+        Write the merged output straight to output_stream, or to stdout.
+
+        Nothing touches the disk: text goes out in _STREAM_CHUNK writes
+        (compressed on the way with an explicit `compression`), while progress
+        and logs stay on stderr. When the reader closes the stream (broken
+        pipe) the merge stops at once and returns False with
+        stats["output_closed"] set; the stream itself is never closed.
+        """
+        cfg = self.config
+        sink = _StreamWriter(cfg.output_stream if cfg.output_stream is not None else sys.stdout.buffer)
+        try:
+            with self._open_output(sink) as out:
+                self._write_sections(out, selected, skipped, total=total)
+        except BrokenPipeError:
+            self.stats["output_closed"] = True
+            logger.warning(
+                "Output stream closed by its reader after %d files; merge stopped",
+                int(self.stats["files_processed"]),
+            )
+            return False
+        except Exception as e:
+            logger.error("Failed to merge: %s", e)
+            return False
+        finally:
+            self.stats["output_size"] = sink.bytes_written
+
+        self.stats["end_time"] = time.time()
+        if self._log_when_done:
+            self._log_results()
+        return True
+
+    def _open_output(self, target: Union[Path, "_StreamWriter"]) -> io.TextIOWrapper:
+        """Open a (tmp) output file or a stream sink for text, through a background compressor if configured."""
+        cfg = self.config
+        method = cfg.output_compression()
+        if isinstance(target, Path):
+            if method is None:
+                return open(target, "w", encoding=cfg.encoding, newline="")
+            raw: io.RawIOBase = _CompressedWriter(open(target, "wb"), method, cfg.compression_level, name=cfg.output_file.name)
+        elif method is None:
+            raw = target
+        else:
+            raw = _CompressedWriter(target, method, cfg.compression_level, name="")
+        buffer_size = _COMPRESS_CHUNK if method is not None else _STREAM_CHUNK
+        return io.TextIOWrapper(io.BufferedWriter(raw, buffer_size=buffer_size), encoding=cfg.encoding, newline="")
+
+    def _newline_size(self) -> int:
+        """Bytes of one newline in the output encoding (without a BOM)."""
+        enc = self.config.encoding
+        return len("\n\n".encode(enc)) - len("\n".encode(enc))
+
+    def _finish_toc(self, written: Path, output: Path, toc: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Complete a table of contents once `written` (the tmp file of `output`)
+        is closed: 1-based output line ranges of every file's content are
+        counted in one forward read in _COMPRESS_CHUNK blocks (None for
+        encodings that are not ASCII-compatible).
+        """
+        cfg = self.config
+        size = written.stat().st_size
+        ascii_compatible = self._newline_size() == 1
+        if ascii_compatible and size:
+            with open(written, "rb") as f:
+                line, pos = 1, 0
+                for entry in toc:
+                    start, length = entry["content_offset"], entry["content_length"]
+                    line += _count_newlines(f, start - pos)
+                    entry["first_line"] = line
+                    line += _count_newlines(f, length)
+                    entry["last_line"] = line - 1
+                    pos = start + length
+        else:
+            for entry in toc:
+                entry["first_line"] = entry["last_line"] = None
+
+        return {
+            "version": TOC_VERSION,
+            "output": output.name,
+            "encoding": cfg.encoding,
+            "size": size,
+            "files": toc,
+        }
+
+    def _manifest_fingerprint(self) -> str:
+        """Settings a section body depends on (headers are always rendered anew)."""
+        cfg = self.config
+        return cfg.fingerprint(
+            "merge-manifest",
+            cfg.encoding,
+            cfg.add_line_numbers,
+            cfg.line_number_format,
+            cfg.remove_empty_lines,
+            cfg.deduplicate_lines,
+            cfg.dedup_lines_digest,
+            cfg.dedup_lines_collisions,
+            cfg.max_file_size,
+            cfg.include_binary_placeholders,
+            cfg.hash_binary_files,
+        )
+
+
+
+
+
+    def _plan_shards(self, selected: List[Path]) -> List[List[_ShardPiece]]:
+        """
+        Assign files to shards in order, bounded by shard_max_bytes/files/lines.
+
+        Bounds apply to input sizes and source line counts (the latter are
+        counted only when shard_max_lines is set). A file never spans shards:
+        one exceeding a bound gets a shard of its own, or with
+        shard_split_files (text files only) is cut at line boundaries into
+        pieces that fit.
+
+        With dedup_files a duplicate only becomes a stub when a whole copy of
+        its content is in the same shard (the stub then names that copy), so
+        every shard stands alone; otherwise it is written in full.
+        """
+        cfg = self.config
+        max_bytes, max_files, max_lines = cfg.shard_max_bytes, cfg.shard_max_files, cfg.shard_max_lines
+
+        shards: List[List[_ShardPiece]] = []
+        current: List[_ShardPiece] = []
+        cur_bytes = cur_lines = 0
+        # First file of a content -> its whole copy in the current shard
+        local: Dict[Path, Tuple[Path, int]] = {}
+
+        def starts_shard(piece: _ShardPiece) -> bool:
+            return bool(current) and (
+                (max_files is not None and len(current) + 1 > max_files)
+                or (max_bytes is not None and cur_bytes + piece.size > max_bytes)
+                or (max_lines is not None and cur_lines + piece.lines > max_lines)
+            )
+
+        for idx, fp in enumerate(selected, 1):
+            dup = self._duplicates.get(fp)
+            pieces: Optional[List[_ShardPiece]] = None
+            if dup is not None:
+                # Written as a one-line stub if its copy is in this shard
+                stub = _ShardPiece(fp, idx, 0, 1 if max_lines is not None else 0)
+                copy = local.get(dup[0])
+                if copy is not None and not starts_shard(stub):
+                    self._duplicates[fp] = copy
+                    pieces = [stub]
+                else:
+                    del self._duplicates[fp]
+            if pieces is None:
+                st = self._stat(fp)
+                size = st.st_size if st is not None else 0
+                lines = self._count_lines(fp) if max_lines is not None else 0
+                pieces = [_ShardPiece(fp, idx, size, lines)]
+                too_big = (max_bytes is not None and size > max_bytes) or (max_lines is not None and lines > max_lines)
+                if too_big and cfg.shard_split_files:
+                    pieces = self._split_file(fp, idx, size) or pieces
+
+            for piece in pieces:
+                if starts_shard(piece):
+                    shards.append(current)
+                    current, cur_bytes, cur_lines = [], 0, 0
+                    local = {}
+                current.append(piece)
+                cur_bytes += piece.size
+                cur_lines += piece.lines
+            if len(pieces) == 1 and fp not in self._duplicates:
+                local[dup[0] if dup is not None else fp] = (fp, idx)
+
+        if current:
+            shards.append(current)
+        return shards
+
+    def _count_lines(self, file_path: Path) -> int:
+        """Source lines of a text file (0 for binary or unreadable files)."""
+        st = self._stat(file_path)
+        if st is None or self._probe(file_path, st).file_type == FileType.BINARY:
+            return 0
+        count = 0
+        last = b""
+        try:
+            with self._walker.open_file(file_path) as f:
+                while chunk := f.read(self.config.hash_chunk_size):
+                    count += chunk.count(b"\n")
+                    last = chunk[-1:]
+        except OSError:
+            return 0
+        return count + (1 if last not in (b"", b"\n") else 0)
+
+    def _split_file(self, file_path: Path, index: int, size: int) -> List[_ShardPiece]:
+        """
+        Cut a text file into line-aligned pieces within shard_max_bytes/lines.
+
+        Returns [] when the file must stay whole (binary, not ASCII-compatible
+        encoding, unreadable). A single line longer than the bound becomes a
+        piece of its own.
+        """
+        cfg = self.config
+        probe = self._probe(file_path, self._stat(file_path))
+        if probe.file_type == FileType.BINARY or _codec_name(probe.encoding).startswith(("utf-16", "utf-32")):
+            return []
+
+        pieces: List[_ShardPiece] = []
+        try:
+            with self._walker.open_file(file_path) as f, _map_input(f) as data:
+                size = len(data)
+                start = first_line = 0
+                while start < size:
+                    end = size
+                    if cfg.shard_max_bytes is not None and start + cfg.shard_max_bytes < size:
+                        cut = data.rfind(b"\n", start, start + cfg.shard_max_bytes)
+                        if cut == -1:
+                            cut = data.find(b"\n", start + cfg.shard_max_bytes)
+                        end = cut + 1 if cut != -1 else size
+                    if cfg.shard_max_lines is not None:
+                        pos = start
+                        for _ in range(cfg.shard_max_lines):
+                            pos = data.find(b"\n", pos, end)
+                            if pos == -1:
+                                break
+                            pos += 1
+                        else:
+                            end = min(end, pos)
+
+                    chunk = data[start:end]
+                    # Line numbers follow the line path, which also ends lines at a lone CR
+                    lines = chunk.count(b"\n") + (len(_LONE_CR.findall(chunk)) if b"\r" in chunk else 0)
+                    pieces.append(_ShardPiece(file_path, index, end - start, lines, start, end, first_line))
+                    first_line += lines
+                    start = end
+        except (OSError, ValueError):
+            return []
+
+        for number, piece in enumerate(pieces, 1):
+            piece.part, piece.parts = number, len(pieces)
+        if len(pieces) == 1:
+            pieces[0].start = pieces[0].end = None
+        return pieces
+
+    def _write_shards(self, selected: List[Path], skipped: List[Tuple[Path, str]]) -> bool:
+        """
+        Write the selected files as shards plus an index at output_file.
+
+        Every shard is a complete merge of its files (own metadata header and
+        footer; FILE i/N numbering stays global). Shards are written on
+        `read_workers` threads, each by a single thread, and replace the old
+        ones only when all succeeded; shards left over from a previous run
+        with more shards are removed.
+        """
+        cfg = self.config
+        out_path = cfg.output_file
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+
+        shards = self._plan_shards(selected)
+        total = len(selected)
+        paths = [cfg.shard_path(k) for k in range(1, len(shards) + 1)]
+        tmp_paths = [p.with_name(p.name + ".tmp") for p in paths] + [out_path.with_name(out_path.name + ".tmp")]
+        backup_path: Optional[Path] = None
+
+        try:
+            if cfg.keep_backups and out_path.exists():
+                backup_path = self._create_output_backup(out_path)
+
+            jobs = [(tmp, k, pieces) for k, (tmp, pieces) in enumerate(zip(tmp_paths, shards), 1)]
+            tocs: List[Optional[Dict[str, Any]]] = []
+            with ProgressReporter(total=total, description="Merging shards", stream=sys.stderr) as progress:
+                if self._renders_in_parallel() and len(shards) > 1:
+                    with ThreadPoolExecutor(
+                        max_workers=min(cfg.read_workers, len(shards)), thread_name_prefix="merge-shard"
+                    ) as pool:
+                        futures = [
+                            pool.submit(self._write_shard, tmp, k, len(shards), pieces, skipped, total)
+                            for tmp, k, pieces in jobs
+                        ]
+                        for fut, (_tmp, _k, pieces) in zip(futures, jobs):
+                            tocs.append(fut.result())
+                            progress.update(sum(1 for p in pieces if p.part == p.parts))
+                else:
+                    for tmp, k, pieces in jobs:
+                        tocs.append(self._write_shard(tmp, k, len(shards), pieces, skipped, total))
+                        progress.update(sum(1 for p in pieces if p.part == p.parts))
+
+            self.stats["end_time"] = time.time()
+            sizes = [tmp.stat().st_size for tmp in tmp_paths[:-1]]
+            with self._open_output(tmp_paths[-1]) as out:
+                out.write(self._shard_index(paths, sizes, shards, skipped))
+
+            for tmp, path in zip(tmp_paths, paths + [out_path]):
+                tmp.replace(path)
+            for path, toc_doc in zip(paths, tocs):
+                if toc_doc is not None:
+                    safe_write(toc_path(path), json.dumps(toc_doc), backup=False)
+            self._remove_stale_shards(len(shards) + 1)
+
+            self.stats["output_size"] = sum(p.stat().st_size for p in paths + [out_path])
+            self.stats["end_time"] = time.time()
+            if self._log_when_done:
+                self._log_results()
+            logger.info("Shards: %d (index: %s)", len(shards), out_path)
+            return True
+
+        except Exception as e:
+            logger.error("Failed to merge: %s", e)
+
+            for tmp in tmp_paths:
+                try:
+                    tmp.unlink(missing_ok=True)
+                except Exception:
+                    pass
+
+            if backup_path and backup_path.exists():
+                try:
+                    shutil.copy2(backup_path, out_path)
+                except Exception:
+                    pass
+
+            return False
+
+    def _write_shard(
+        self,
+        tmp_path: Path,
+        number: int,
+        count: int,
+        pieces: List[_ShardPiece],
+        skipped: List[Tuple[Path, str]],
+        total: int,
+    ) -> Optional[Dict[str, Any]]:
+        """Write one shard to `tmp_path`; return its table of contents if enabled."""
+        cfg = self.config
+        toc: Optional[List[Dict[str, Any]]] = [] if cfg.toc else None
+        with self._open_output(tmp_path) as out:
+            if cfg.include_metadata:
+                files = [p.path for p in pieces]
+                out.write(self._metadata_header(files, skipped if number == 1 else [], shard=(number, count)))
+
+            for piece in pieces:
+                error: Optional[Exception] = None
+                try:
+                    self._write_file_section(out, piece.path, piece.index, total, piece=piece, toc=toc)
+                except Exception as e:
+                    error = e
+                # A split file counts once, when its last piece is written
+                if error is not None or piece.part == piece.parts:
+                    self._finish_section(out, piece.path, error)
 
+            if cfg.include_metadata:
+                out.write(self._footer())
 
+        return self._finish_toc(tmp_path, cfg.shard_path(number), toc) if toc is not None else None
 
+    def _shard_index(
+        self, paths: List[Path], sizes: List[int], shards: List[List[_ShardPiece]], skipped: List[Tuple[Path, str]]
+    ) -> str:
+        cfg = self.config
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    def _write_file_section(self, out, file_path: Path, index: int, total: int) -> None:
+        lines: List[str] = []
+        lines.append("MERGED FILE INDEX")
+        lines.append(cfg.header_separator)
+        lines.append(f"Generated: {now}")
+        lines.append("Tool: SmartFileMerger")
+        lines.append(f"Shards: {len(shards)}")
+        lines.append(f"Files: {int(self.stats['files_selected'])}")
+        if skipped:
+            lines.append(f"Skipped: {len(skipped)}")
+        limits = []
+        if cfg.shard_max_bytes is not None:
+            limits.append(f"max_bytes={format_size(cfg.shard_max_bytes)}")
+        if cfg.shard_max_files is not None:
+            limits.append(f"max_files={cfg.shard_max_files}")
+        if cfg.shard_max_lines is not None:
+            limits.append(f"max_lines={cfg.shard_max_lines}")
+        lines.append(f"Limits: {', '.join(limits)}{' (split files)' if cfg.shard_split_files else ''}")
+        lines.append("")
+        lines.append("SHARDS:")
+        lines.append(cfg.header_separator)
+        for number, (path, size, pieces) in enumerate(zip(paths, sizes, shards), 1):
+            lines.append(f"{number:4}. {path.name} ({len(pieces)} files, {format_size(size)})")
+            for piece in pieces:
+                part = f" (part {piece.part}/{piece.parts})" if piece.parts > 1 else ""
+                lines.append(f"      {piece.index:4}. {self._rel(piece.path)}{part}")
+        lines.append(cfg.header_separator)
+        lines.append("")
+        return "\n".join(lines)
 
-        if self.config.include_headers:
-            header = self._file_header(file_path, index, total)
-            if header:
-                out.write(header)
+    def _remove_stale_shards(self, first: int) -> None:
+        number = first
+        while (path := self.config.shard_path(number)).exists():
+            try:
+                path.unlink()
+                toc_path(path).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning("Could not remove stale shard %s: %s", path, e)
+                break
+            number += 1
+
+    def _iter_rendered_sections(
+        self, selected: Iterable[Path], total: int
+    ) -> Iterator[Tuple[Path, int, Optional[_RenderedSection]]]:
+        """
+        Render file sections on `read_workers` threads; yield them in `selected` order.
+
+        Each item is (path, index, rendered): `rendered` holds exactly what
+        `_write_file_section()` would have written itself, so the output is
+        byte-identical to the sequential path. It is None for sections the
+        writer produces itself: duplicate stubs, bodies an incremental merge
+        copies from the previous output, files the writer copies unchanged
+        (see _write_passthrough()) and files larger than `read_ahead_bytes`,
+        which the writer streams in blocks instead of holding them rendered.
+        Sections are submitted while the input size of the ones not yet
+        yielded stays within `read_ahead_bytes`.
+        """
+        budget = self.config.read_ahead_bytes
+        pending: Deque[Tuple[Path, int, int, Optional["Future[_RenderedSection]"]]] = deque()
+        in_flight = 0
 
+        with ThreadPoolExecutor(max_workers=self.config.read_workers, thread_name_prefix="merge-read") as pool:
+            try:
+                for idx, fp in enumerate(selected, 1):
+                    st = self._stat(fp)
+                    cost = st.st_size if st is not None else 0
+                    if (
+                        fp in self._duplicates
+                        or (self._manifest is not None and self._manifest.lookup(fp, st) is not None)
+                        or cost > budget
+                        or self._passthrough_probe(fp) is not None
+                    ):
+                        pending.append((fp, idx, 0, None))
+                        continue
+                    while pending and in_flight + cost > budget:
+                        path, index, size, fut = pending.popleft()
+                        in_flight -= size
+                        yield path, index, fut.result() if fut is not None else None
+                    pending.append((fp, idx, cost, pool.submit(self._render_file_section, fp, idx, total)))
+                    in_flight += cost
+
+                while pending:
+                    path, index, _size, fut = pending.popleft()
+                    yield path, index, fut.result() if fut is not None else None
+            finally:
+                for _path, _index, _size, fut in pending:
+                    if fut is not None:
+                        fut.cancel()
+
+    def _render_file_section(self, file_path: Path, index: int, total: int) -> _RenderedSection:
+        section = _RenderedSection()
+        buf = io.StringIO()
+        try:
+            if self.config.include_headers:
+                section.header = self._file_header(file_path, index, total)
+            section.counts = self._write_file_body(buf, file_path)
+        except Exception as e:
+            section.error = e
+        section.body = buf.getvalue()
+        return section
 
-        wrote_any = False
-        for line in self._iter_processed_lines(file_path):
-            out.write(line)
-            wrote_any = True
+    def _finish_section(self, out, file_path: Path, error: Optional[Exception]) -> None:
+        if error is None:
+            self._bump_stat("files_processed")
+        else:
+            self._bump_stat("files_failed")
+            out.write(f"[ERROR processing {self._rel(file_path)}: {error}]\n")
+
+    def _bump_stat(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] = int(self.stats[key]) + 1
+        counts = getattr(self._section_counts, "value", None)
+        if counts is not None:
+            counts[key] = counts.get(key, 0) + 1
+
+    def _write_file_section(
+        self,
+        out,
+        file_path: Path,
+        index: int,
+        total: int,
+        rendered: Optional[_RenderedSection] = None,
+        *,
+        piece: Optional[_ShardPiece] = None,
+        toc: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        Write the section of `file_path` (header + body) to the output file.
+
+        `rendered` is a section prepared by a reader thread; `piece` limits the
+        section to one part of a file split across shards. A duplicate of an
+        earlier file gets a stub naming it instead of its body. In an
+        incremental merge the body of an unchanged file is copied from the
+        previous output and every other body written is recorded in the
+        manifest. With `toc` the section's byte offsets are appended to it
+        (see _finish_toc()).
+        """
+        manifest = self._manifest if file_path not in self._duplicates else None
+        duplicate_of = self._duplicates.get(file_path)
+        st = self._stat(file_path)
+        split = piece is not None and piece.parts > 1
+        rec = manifest.lookup(file_path, st) if manifest is not None and rendered is None and not split else None
+        tracking = manifest is not None or toc is not None
+        section_start = out.tell() if tracking else 0
+
+        if rendered is not None:
+            out.write(rendered.header)
+        elif self.config.include_headers:
+            if split:
+                assert piece is not None
+                out.write(self._file_header(file_path, index, total, part=(piece.part, piece.parts)))
+            else:
+                out.write(self._file_header(file_path, index, total))
+
+        start = out.tell() if tracking else 0
+        crc32: Optional[int] = None
+        if duplicate_of is not None:
+            out.write(self._duplicate_stub(*duplicate_of) + "\n")
+            self._bump_stat("files_deduplicated")
+            counts: Dict[str, int] = {}
+        elif rendered is not None:
+            out.write(rendered.body)
+            if rendered.error is not None:
+                raise rendered.error
+            counts = rendered.counts
+        elif rec is not None and manifest is not None and manifest.copy_body(rec, out):
+            counts = dict(rec["stats"])
+            crc32 = rec["crc32"]
+            for key, n in counts.items():
+                for _ in range(n):
+                    self._bump_stat(key)
+        else:
+            counts = self._write_file_body(out, file_path, piece)
+        end = out.tell() if tracking else 0
+
+        if manifest is not None:
+            manifest.record(
+                file_path,
+                st,
+                encoding=self._header_encoding(file_path, st) if self.config.include_headers else None,
+                offset=start,
+                length=end - start,
+                stats=counts,
+                crc32=crc32,
+            )
+
+        if toc is not None:
+            entry: Dict[str, Any] = {
+                "path": self._rel(file_path),
+                "index": index,
+                "offset": section_start,
+                "content_offset": start,
+                # A non-empty body ends with the blank separator line
+                "content_length": max(end - start - self._newline_size(), 0) if end > start else 0,
+                "size": st.st_size if st is not None else None,
+            }
+            if split:
+                assert piece is not None
+                entry["part"] = [piece.part, piece.parts]
+            if duplicate_of is not None:
+                entry["duplicate_of"] = self._rel(duplicate_of[0])
+            toc.append(entry)
+
+    def _duplicate_stub(self, original: Path, index: int) -> str:
+        return f"[DUPLICATE: same content as FILE {index}: {self._rel(original)}]\n"
+
+    def _write_file_body(self, out, file_path: Path, piece: Optional[_ShardPiece] = None) -> Dict[str, int]:
+        """Write the content part of a section (or of a `piece` of it); return the stats it bumped."""
+        counts: Dict[str, int] = {}
+        self._section_counts.value = counts
+        try:
+            wrote_any = self._write_passthrough(out, file_path) if piece is None else None
+            if wrote_any is None:
+                wrote_any = False
+                for block in self._iter_processed_lines(file_path, piece):
+                    out.write(block)
+                    wrote_any = True
+
+            if wrote_any:
+                out.write("\n")
+        finally:
+            self._section_counts.value = None
+        return counts
+
+    def _passthrough_probe(self, file_path: Path) -> Optional[ContentProbe]:
+        """Probe of a file `_write_passthrough()` may copy unchanged (the content checks aside), else None."""
+        cfg = self.config
+        if not cfg.zero_copy or cfg.add_line_numbers or cfg.remove_empty_lines or cfg.deduplicate_lines:
+            return None
 
+        st = self._stat(file_path)
+        if st is None:
+            return None
+        if cfg.max_file_size is not None and st.st_size > cfg.max_file_size:
+            return None
+        if self._walker.is_archive_member(file_path):
+            return None
+        probe = self._probe(file_path, st)
+        if probe.file_type == FileType.BINARY or _codec_name(probe.encoding) != _codec_name(cfg.encoding):
+            return None
+        return probe
 
-        if wrote_any:
+    def _write_passthrough(self, out, file_path: Path) -> Optional[bool]:
+        """
+        Copy a file's bytes to `out` unchanged when that equals the line path.
+
+        Applies when no line transform is configured, the file is text in the
+        output encoding (and not an archive member), decodes strictly and has
+        no lone CR (the line path
+        turns those into CRLF); a missing final newline is still added. Real
+        output files get the bytes via copy_file_range/sendfile, otherwise
+        from an mmap. Returns whether anything was written, or None when the
+        file must go through `_iter_processed_lines()`.
+        """
+        probe = self._passthrough_probe(file_path)
+        if probe is None:
+            return None
+        st = self._stat(file_path)
+        assert st is not None
+
+        try:
+            if st.st_size == 0:
+                return False
+            with open(file_path, "rb") as src:
+                with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if data.find(b"\r") != -1 and _LONE_CR.search(data):
+                        return None
+                    # Strict decode validates the whole file before anything is written
+                    # (latin-1 accepts any bytes); blocks keep memory bounded
+                    if _codec_name(probe.encoding) != "latin-1":
+                        for _text in _iter_decoded(data, probe.encoding):
+                            pass
+
+                    try:
+                        dst = out.fileno()
+                    except (AttributeError, OSError, ValueError):
+                        dst = None
+                    if dst is None:
+                        for text in _iter_decoded(data, probe.encoding):
+                            out.write(text)
+                    else:
+                        out.flush()
+                        _copy_file_bytes(src.fileno(), dst, data)
+                    ends_with_newline = data[-1:] == b"\n"
+        except BrokenPipeError:
+            raise
+        except (OSError, ValueError):
+            # Unreadable or not valid in its encoding: the line path reports or recovers
+            return None
+
+        if not ends_with_newline:
             out.write("\n")
+        return True
 
-    def _file_header(self, file_path: Path, index: int, total: int) -> str:
+    def _file_header(self, file_path: Path, index: int, total: int, *, part: Optional[Tuple[int, int]] = None) -> str:
         cfg = self.config
 
         rel = self._rel(file_path)
         name = file_path.name
 
-        size = 0
-        mtime = 0.0
-        try:
-            st = file_path.stat()
-            size = st.st_size
-            mtime = st.st_mtime
-        except Exception:
-            pass
+        st = self._stat(file_path)
+        size = st.st_size if st is not None else 0
+        mtime = st.st_mtime if st is not None else 0.0
 
 
-        enc = FileContentDetector.detect_encoding(file_path)
+        enc = self._header_encoding(file_path, st)
 
         lines: List[str] = []
         lines.append("")
         lines.append(cfg.file_separator)
+        suffix = f" (part {part[0]}/{part[1]})" if part is not None else ""
         if not cfg.compact_file_headers:
-            lines.append(f"FILE {index}/{total}: {rel}")
+            lines.append(f"FILE {index}/{total}: {rel}{suffix}")
         else:
-            lines.append(f"FILE {index}/{total}: {name}")
+            lines.append(f"FILE {index}/{total}: {name}{suffix}")
 
         lines.append(f"Size: {format_size(size)} | Encoding: {enc}")
 
@@ -449,21 +2078,28 @@ class SmartFileMerger:
 
 
 
-    def _iter_processed_lines(self, file_path: Path) -> Iterable[str]:
+    def _header_encoding(self, file_path: Path, st: Optional[os.stat_result]) -> str:
+        """Detected encoding of a file; an incremental merge takes it from the manifest if unchanged."""
+        rec = self._manifest.lookup(file_path, st) if self._manifest is not None else None
+        if rec is not None and rec.get("encoding"):
+            return str(rec["encoding"])
+        return self._probe(file_path, st).encoding
 
-        try:
-            size = file_path.stat().st_size
-        except Exception:
-            size = 0
+    def _iter_processed_lines(self, file_path: Path, piece: Optional[_ShardPiece] = None) -> Iterable[str]:
+        """Yield the body of a section as non-empty blocks of whole lines (see _iter_text_blocks())."""
+
+        st = self._stat(file_path)
+        size = st.st_size if st is not None else 0
 
         if self.config.max_file_size is not None and size > self.config.max_file_size:
-            self.stats["files_skipped_by_limits"] = int(self.stats["files_skipped_by_limits"]) + 1
+            self._bump_stat("files_skipped_by_limits")
             yield f"[FILE SKIPPED: exceeds max_file_size {format_size(self.config.max_file_size)}]\n"
             return
 
 
-        if self._is_binary(file_path):
-            self.stats["files_skipped_binary"] = int(self.stats["files_skipped_binary"]) + 1
+        probe = self._probe(file_path, st)
+        if probe.file_type == FileType.BINARY:
+            self._bump_stat("files_skipped_binary")
             if self.config.include_binary_placeholders:
                 yield from self._binary_placeholder(file_path)
             else:
@@ -471,56 +2107,130 @@ class SmartFileMerger:
             return
 
 
-        encoding = FileContentDetector.detect_encoding(file_path)
+        encoding = probe.encoding
         try:
-            yield from self._iter_text_lines(file_path, encoding=encoding)
+            yield from self._iter_text_blocks(file_path, encoding=encoding, piece=piece)
         except UnicodeDecodeError:
             logger.warning("Decode failed for %s with %s, fallback to latin-1", file_path, encoding)
-            yield from self._iter_text_lines(file_path, encoding="latin-1", errors="replace")
+            yield from self._iter_text_blocks(file_path, encoding="latin-1", errors="replace", piece=piece)
         except PermissionError:
-            self.stats["files_failed"] = int(self.stats["files_failed"]) + 1
+            self._bump_stat("files_failed")
             yield "[ERROR: permission denied while reading file]\n"
         except FileNotFoundError:
-            self.stats["files_failed"] = int(self.stats["files_failed"]) + 1
+            self._bump_stat("files_failed")
             yield "[ERROR: file not found]\n"
         except Exception as e:
-            self.stats["files_failed"] = int(self.stats["files_failed"]) + 1
+            self._bump_stat("files_failed")
             yield f"[ERROR: failed to read file: {e}]\n"
 
-    def _iter_text_lines(self, file_path: Path, *, encoding: str, errors: str = "strict") -> Iterable[str]:
+    def _iter_text_blocks(
+        self, file_path: Path, *, encoding: str, errors: str = "strict", piece: Optional[_ShardPiece] = None
+    ) -> Iterable[str]:
+        """
+        Decode and transform a text file (or a `piece` of it) a block at a time.
+
+        Files up to _TRANSFORM_CHUNK bytes are one block, larger ones are cut
+        at line ends. Lines end at LF, CRLF or a lone CR, like a text file
+        opened with newline="": the line terminator is dropped except for its
+        CR and a newline is appended, so a lone CR becomes CRLF. Lines are then
+        filtered (remove_empty_lines, deduplicate_lines) and numbered as a
+        whole list per block (see _transform_block()).
+        """
+        state = _TransformState(
+            seen=self._global_lines if self._global_lines is not None else self._new_line_set(),
+            line_no=piece.first_line if piece is not None else 0,
+        )
+        decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+
+        with self._walker.open_file(file_path) as f:
+            left: Optional[int] = None
+            if piece is not None and piece.start is not None and piece.end is not None:
+                f.seek(piece.start)
+                left = piece.end - piece.start
+            tail = ""
+            while True:
+                data = f.read(_TRANSFORM_CHUNK if left is None else min(_TRANSFORM_CHUNK, left))
+                if left is not None:
+                    left -= len(data)
+                final = not data or left == 0
+                text = tail + decoder.decode(data, final=final)
+                if not final:
+                    # Keep the last, possibly incomplete line (or a CR that may precede an LF)
+                    cut = text.rfind("\n")
+                    cr = text.rfind("\r", 0, len(text) - 1)
+                    cut = max(cut, cr) + 1
+                    text, tail = text[:cut], text[cut:]
+                block = self._transform_block(text, state)
+                if block:
+                    yield block
+                if final:
+                    return
+
+    def _transform_block(self, text: str, state: "_TransformState") -> str:
+        """Apply the line transforms to whole lines of decoded `text` (the last may lack its newline)."""
+        if not text:
+            return ""
         cfg = self.config
-        seen: Optional[set[str]] = set() if cfg.deduplicate_lines else None
-        line_no = 0
-
-        with open(file_path, "r", encoding=encoding, errors=errors, newline="") as f:
-            for raw in f:
-                line = raw.rstrip("\n")
-
-                if cfg.remove_empty_lines and not line.strip():
-                    continue
-
-                if seen is not None:
-                    if line in seen:
-                        continue
-                    seen.add(line)
+        if "\r" in text:
+            text = _LONE_CR_TEXT.sub("\r\n", text)
+        if not (cfg.remove_empty_lines or cfg.deduplicate_lines or cfg.add_line_numbers):
+            return text if text.endswith("\n") else text + "\n"
+
+        lines = text.split("\n")
+        if not lines[-1]:
+            lines.pop()
+        if cfg.remove_empty_lines:
+            lines = [line for line in lines if line.strip()]
+        seen = state.seen
+        if isinstance(seen, set):
+            # First occurrences within the block, then those not seen in earlier blocks
+            lines = [line for line in dict.fromkeys(lines) if line not in seen]
+            seen.update(lines)
+        elif seen is not None:
+            lines = seen.filter_new(lines)
+        if not lines:
+            return ""
 
-                line_no += 1
-                if cfg.add_line_numbers:
-                    yield cfg.line_number_format.format(line_no) + line + "\n"
-                else:
-                    yield line + "\n"
+        if cfg.add_line_numbers:
+            prefixes = self._line_prefixes(state.line_no + 1, len(lines))
+            lines = list(map(str.__add__, prefixes, lines))
+        state.line_no += len(lines)
+        lines.append("")
+        return "\n".join(lines)
 
-    def _is_binary(self, file_path: Path) -> bool:
-        if file_path.suffix.lower() in FileContentDetector.BINARY_EXTENSIONS:
-            return True
-        return FileContentDetector.detect_file_type(file_path) == FileType.BINARY
+    def _new_line_set(self) -> Union[Set[str], LineDigestSet, None]:
+        """Empty set of seen lines for deduplicate_lines, as configured by dedup_lines_digest."""
+        cfg = self.config
+        if not cfg.deduplicate_lines:
+            return None
+        if cfg.dedup_lines_digest == "exact":
+            return set()
+        bits = 64 if cfg.dedup_lines_digest == "digest64" else 128
+        return LineDigestSet(bits, collisions=cfg.dedup_lines_collisions)
+
+    def _renders_in_parallel(self) -> bool:
+        """Whether sections may render on read_workers threads; global line dedup needs file order."""
+        return self.config.read_workers > 1 and self._global_lines is None
+
+    def _line_prefixes(self, first: int, count: int) -> List[str]:
+        """line_number_format applied to first..first+count-1; small numbers come from a shared cache."""
+        fmt = self.config.line_number_format
+        end = first + count - 1
+        cache = self._number_prefixes
+        if len(cache) < min(end, _PREFIX_CACHE_SIZE):
+            with self._prefix_lock:
+                size = len(cache)
+                if size < min(end, _PREFIX_CACHE_SIZE):
+                    target = min(max(end, 2 * size, 1024), _PREFIX_CACHE_SIZE)
+                    cache.extend([fmt.format(n) for n in range(size + 1, target + 1)])
+        if end <= len(cache):
+            return cache[first - 1 : end]
+        head = cache[first - 1 :] if first <= len(cache) else []
+        return head + [fmt.format(n) for n in range(first + len(head), end + 1)]
 
     def _binary_placeholder(self, file_path: Path) -> Iterable[str]:
-        size = 0
-        try:
-            size = file_path.stat().st_size
-        except Exception:
-            pass
+        st = self._stat(file_path)
+        size = st.st_size if st is not None else 0
 
         sha256 = self._sha256(file_path) if self.config.hash_binary_files else ""
 
@@ -533,7 +2243,7 @@ class SmartFileMerger:
     def _sha256(self, file_path: Path) -> str:
         h = hashlib.sha256()
         try:
-            with open(file_path, "rb") as f:
+            with self._walker.open_file(file_path) as f:
                 while True:
                     chunk = f.read(self.config.hash_chunk_size)
                     if not chunk:
@@ -547,22 +2257,25 @@ class SmartFileMerger:
 
 
 
-    def _metadata_header(self, files: List[Path], skipped: List[Tuple[Path, str]]) -> str:
+    def _dedup_lines_scope_label(self) -> str:
+        return "across files" if self.config.dedup_lines_scope == "global" else "within file"
+
+    def _metadata_header(
+        self, files: List[Path], skipped: List[Tuple[Path, str]], *, shard: Optional[Tuple[int, int]] = None
+    ) -> str:
         cfg = self.config
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        total = 0
-        for f in files:
-            try:
-                total += f.stat().st_size
-            except Exception:
-                pass
+        sizes = [st.st_size if (st := self._stat(f)) is not None else 0 for f in files]
+        total = sum(sizes)
 
         lines: List[str] = []
         lines.append("MERGED FILE REPORT")
         lines.append(cfg.header_separator)
         lines.append(f"Generated: {now}")
         lines.append("Tool: SmartFileMerger")
+        if shard is not None:
+            lines.append(f"Shard: {shard[0]}/{shard[1]}")
         lines.append("")
         lines.append("INPUT:")
         lines.append(f"  Files selected: {len(files)}")
@@ -598,22 +2311,22 @@ class SmartFileMerger:
         lines.append(f"    compact_file_headers: {cfg.compact_file_headers}")
         lines.append(f"    add_line_numbers: {cfg.add_line_numbers}")
         lines.append(f"    remove_empty_lines: {cfg.remove_empty_lines}")
-        lines.append(f"    deduplicate_lines(within file): {cfg.deduplicate_lines}")
+        lines.append(f"    deduplicate_lines({self._dedup_lines_scope_label()}): {cfg.deduplicate_lines}")
+        if cfg.deduplicate_lines and cfg.dedup_lines_digest != "exact":
+            lines.append(f"    dedup_lines_digest: {cfg.dedup_lines_digest} ({cfg.dedup_lines_collisions})")
         if cfg.max_file_size is not None:
             lines.append(f"    max_file_size: {format_size(cfg.max_file_size)}")
         if cfg.max_total_size is not None:
             lines.append(f"    max_total_size: {format_size(cfg.max_total_size)}")
+            lines.append(f"    budget_mode: {cfg.budget_mode}")
+        if cfg.dedup_files:
+            lines.append(f"    dedup_files: True ({len(self._duplicates)} duplicates)")
 
         lines.append("")
         lines.append("FILE LIST:")
         lines.append(cfg.header_separator)
-        for i, f in enumerate(files, 1):
+        for i, (f, sz) in enumerate(zip(files, sizes), 1):
             rel = self._rel(f)
-            sz = 0
-            try:
-                sz = f.stat().st_size
-            except Exception:
-                pass
             lines.append(f"{i:4}. {rel} ({format_size(sz)})")
         lines.append(cfg.header_separator)
         lines.append("")
@@ -696,12 +2409,13 @@ class SmartFileMerger:
         logger.info("=" * 60)
         logger.info("MERGE COMPLETE")
         logger.info("=" * 60)
-        logger.info("Output: %s", self.config.output_file)
+        logger.info("Output: %s", self.config.output_label())
         logger.info("files_found: %d", int(self.stats["files_found"]))
         logger.info("files_selected: %d", int(self.stats["files_selected"]))
         logger.info("files_processed: %d", int(self.stats["files_processed"]))
         logger.info("skipped_by_limits: %d", int(self.stats["files_skipped_by_limits"]))
         logger.info("skipped_binary: %d", int(self.stats["files_skipped_binary"]))
+        logger.info("deduplicated: %d", int(self.stats["files_deduplicated"]))
         logger.info("failed: %d", int(self.stats["files_failed"]))
         logger.info("total_found_size: %s", format_size(int(self.stats["total_found_size"])))
         logger.info("total_selected_size: %s", format_size(int(self.stats["total_selected_size"])))
@@ -714,6 +2428,263 @@ class SmartFileMerger:
 
 
 
+# Stats of a multi-target merge that add up over its targets (see SmartFileMerger._merge_targets())
+_TARGET_SUMMED_STATS: Tuple[str, ...] = (
+    "files_selected",
+    "files_processed",
+    "files_skipped_by_limits",
+    "files_skipped_binary",
+    "files_deduplicated",
+    "files_failed",
+    "total_selected_size",
+    "output_size",
+)
+_LONE_CR = re.compile(rb"\r(?!\n)")
+_LONE_CR_TEXT = re.compile(r"\r(?!\n)")
+# Input bytes transformed at once by SmartFileMerger._iter_text_blocks()
+_TRANSFORM_CHUNK = 4 * 1024 * 1024
+_PREFIX_CACHE_SIZE = 1 << 16
+_U64 = (1 << 64) - 1
+
+
+def _codec_name(encoding: str) -> str:
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return encoding.lower()
+
+
+def _iter_decoded(data: Union[mmap.mmap, bytes], encoding: str) -> Iterator[str]:
+    """Strictly decode `data` in _TRANSFORM_CHUNK blocks (UnicodeDecodeError on invalid input)."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="strict")
+    size = len(data)
+    for start in range(0, size, _TRANSFORM_CHUNK):
+        end = min(start + _TRANSFORM_CHUNK, size)
+        text = decoder.decode(data[start:end], final=end == size)
+        if text:
+            yield text
+
+
+def _count_newlines(f: BinaryIO, length: int) -> int:
+    """Count b"\\n" in the next `length` bytes of `f`, reading _COMPRESS_CHUNK at a time."""
+    count = 0
+    while length > 0:
+        chunk = f.read(min(length, _COMPRESS_CHUNK))
+        if not chunk:
+            break
+        count += chunk.count(b"\n")
+        length -= len(chunk)
+    return count
+
+
+def _map_input(f: BinaryIO) -> Any:
+    """Context manager over the whole content of `f`: an mmap of a real file, else its bytes (archive members)."""
+    try:
+        fd = f.fileno()
+    except (OSError, io.UnsupportedOperation):
+        return contextlib.nullcontext(f.read())
+    return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+
+
+def _copy_file_bytes(src_fd: int, dst_fd: int, data: Union[mmap.mmap, memoryview], *, start: int = 0) -> None:
+    """
+    Append all of `data` (an mmap of `src_fd`, or a view of it beginning at
+    byte `start`) at the current position of `dst_fd`.
+
+    Uses os.copy_file_range, then os.sendfile (kernel-side copies); whatever
+    they did not copy is written from the mmap.
+    """
+    total = len(data)
+    offset = 0
+    copiers = []
+    if hasattr(os, "copy_file_range"):
+        copiers.append(lambda n, off: os.copy_file_range(src_fd, dst_fd, n, start + off))
+    if hasattr(os, "sendfile"):
+        copiers.append(lambda n, off: os.sendfile(dst_fd, src_fd, start + off, n))
+
+    for copy in copiers:
+        try:
+            while offset < total:
+                n = copy(total - offset, offset)
+                if n == 0:
+                    break
+                offset += n
+        except OSError:
+            continue
+        if offset >= total:
+            return
+
+    view = memoryview(data)
+    try:
+        while offset < total:
+            offset += os.write(dst_fd, view[offset:])
+    finally:
+        view.release()
+
+
+_COMPRESS_CHUNK = 1024 * 1024
+# Bytes handed to an output stream at once (see SmartFileMerger._write_stream())
+_STREAM_CHUNK = 1024 * 1024
+
+
+class _StreamWriter(io.RawIOBase):
+    """
+    Write-only raw stream passing bytes on to a binary stream it does not own.
+
+    close() flushes the target but leaves it open (stdout stays usable);
+    bytes_written counts what the target accepted.
+    """
+
+    def __init__(self, target: BinaryIO) -> None:
+        super().__init__()
+        self._target = target
+        self.bytes_written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        n = self._target.write(b)
+        n = len(b) if n is None else n
+        self.bytes_written += n
+        return n
+
+    def flush(self) -> None:
+        if not self.closed:
+            self._target.flush()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._target.flush()
+        finally:
+            super().close()
+
+
+class _CompressedWriter(io.RawIOBase):
+    """
+    Write-only raw stream compressing into `fileobj` on a background thread.
+
+    write() hands chunks over through a bounded queue, so compression
+    overlaps with reading and rendering. Errors of the compressor thread
+    are raised by the next write() or by close(); close() finishes the
+    compressed stream and closes `fileobj`.
+    """
+
+    def __init__(self, fileobj: BinaryIO, method: str, level: Optional[int], *, name: str) -> None:
+        super().__init__()
+        self._file = fileobj
+        try:
+            self._compressor = self._open_compressor(self._file, method, level, name)
+        except Exception:
+            self._file.close()
+            raise
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=8)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="merge-compress", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _open_compressor(fileobj: BinaryIO, method: str, level: Optional[int], name: str) -> BinaryIO:
+        if method == "gzip":
+            # Stored name is the uncompressed output name, not the .tmp file
+            inner = name[:-3] if name.lower().endswith(".gz") else name
+            return gzip.GzipFile(filename=inner, mode="wb", compresslevel=6 if level is None else level, fileobj=fileobj)
+        if method == "bz2":
+            return bz2.BZ2File(fileobj, mode="wb", compresslevel=9 if level is None else max(level, 1))
+        if method == "xz":
+            return lzma.LZMAFile(fileobj, mode="wb", preset=level)
+        raise ValueError(f"Unsupported compression: {method}")
+
+    def _run(self) -> None:
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            if self._error is not None:
+                # Keep draining so the writer never blocks on a full queue
+                continue
+            try:
+                self._compressor.write(chunk)
+            except BaseException as e:
+                self._error = e
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        if self._error is not None:
+            raise self._error
+        data = bytes(b)
+        self._queue.put(data)
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._queue.put(None)
+            self._thread.join()
+            try:
+                self._compressor.close()
+            except BaseException as e:
+                if self._error is None:
+                    self._error = e
+            self._file.close()
+        finally:
+            super().close()
+        if self._error is not None:
+            raise self._error
+
+
+def toc_path(merged_file: Path) -> Path:
+    """Table of contents of a merged file: `<merged_file>.toc.json`."""
+    merged_file = Path(merged_file)
+    return merged_file.with_name(merged_file.name + TOC_SUFFIX)
+
+
+def load_toc(merged_file: Path) -> Dict[str, Any]:
+    """
+    Read the table of contents of `merged_file` (see MergerConfig.toc).
+
+    Raises FileNotFoundError without one and ValueError if it is of another
+    version or the merged file changed size since it was written.
+    """
+    merged_file = Path(merged_file)
+    with open(toc_path(merged_file), "r", encoding="utf-8") as f:
+        toc = json.load(f)
+    if toc.get("version") != TOC_VERSION:
+        raise ValueError(f"Unsupported table of contents version: {toc.get('version')}")
+    if merged_file.stat().st_size != toc.get("size"):
+        raise ValueError(f"Table of contents of {merged_file} is stale")
+    return toc
+
+
+def extract_file(merged_file: Path, rel_path: str, *, toc: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Return the merged content of `rel_path` (as listed in FILE headers)
+    from `merged_file`, reading only its bytes via the table of contents.
+
+    Parts of a split file within the same shard are joined; a duplicate
+    (MergerConfig.dedup_files) gives the content of the file it refers to.
+    Raises KeyError if the file is not in this merged file.
+    """
+    toc = toc if toc is not None else load_toc(merged_file)
+    entries = [e for e in toc["files"] if e["path"] == rel_path]
+    if not entries:
+        raise KeyError(rel_path)
+    if "duplicate_of" in entries[0]:
+        return extract_file(merged_file, entries[0]["duplicate_of"], toc=toc)
+
+    chunks: List[bytes] = []
+    with open(merged_file, "rb") as f:
+        for entry in entries:
+            f.seek(entry["content_offset"])
+            chunks.append(f.read(entry["content_length"]))
+    return codecs.decode(b"".join(chunks), toc["encoding"])
+
+
 def parse_size_string(size_str: str) -> int:
     """
     Parse size string like '10MB', '1GB', '500KB' into bytes.
@@ -736,6 +2707,22 @@ def parse_size_string(size_str: str) -> int:
     return int(s)
 
 
+def parse_weight_string(spec: str) -> Tuple[str, float]:
+    """Parse 'KEY=WEIGHT' (e.g. 'src/core=2', '*.md=-0.5') into (key, weight)."""
+    key, sep, weight = spec.rpartition("=")
+    if not sep or not key.strip():
+        raise ValueError(f"Expected KEY=WEIGHT, got {spec!r}")
+    return key.strip(), float(weight)
+
+
+def parse_target_string(spec: str) -> Tuple[str, Path]:
+    """Parse 'PATTERN=OUTPUT' (e.g. '*.py=py.txt', '*.md=-') into (pattern, output)."""
+    pattern, sep, output = spec.partition("=")
+    if not sep or not pattern.strip() or not output.strip():
+        raise ValueError(f"Expected PATTERN=OUTPUT, got {spec!r}")
+    return pattern.strip(), Path(output.strip())
+
+
 def parse_arguments(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Advanced file merger with intelligent filtering",
@@ -761,20 +2748,52 @@ Examples:
   file-merger . -r -ig -p "*" -o merged.txt
 
 
+  file-merger . -r -p "*.py" -o merged.txt --max-total-size 5MB --budget-mode priority --priority-recency 2 --priority-path src=1
+
+
   file-merger . -r -p "*.py" -o merged.txt --keep-backups
   file-merger . -r -p "*.py" -o merged.txt --backup-dir .backups
   file-merger . -r -p "*.py" -o merged.txt --backup-dir .backups --overwrite-backups
+
+
+  file-merger . -r -p "*.py" -o merged.txt --incremental
+
+
+  file-merger . -r -o merged.txt --dedup-files --hash-cache .merge-hashes.json
+
+
+  file-merger . -r -p "*.log" -o logs.txt --dedup-lines-scope global --dedup-lines-digest digest64
+
+
+  file-merger . -r -p "*.py" -o merged.txt.gz
+
+
+  file-merger . -r -p "*.py" -o merged.txt --shard-size 50MB --read-workers 4
+
+
+  file-merger release-1.0.tar.gz -r -p "*.py" -o merged.txt
+
+
+  file-merger . -r -p "*.py" -o - | zstd > merged.txt.zst
+
+
+  file-merger . -r -ig -t "*.py=py.txt" -t "*.md=docs.txt" -t "*.yaml=config.txt"
 """.strip(),
     )
 
 
-    parser.add_argument("directories", nargs="*", default=["."], help="Directories to merge files from (default: .)")
+    parser.add_argument("directories", nargs="*", default=["."], help="Directories or tar/zip archives to merge files from (default: .)")
     parser.add_argument("-p", "--pattern", default="*", help='File pattern (e.g. "*.py")')
     parser.add_argument("-r", "--recursive", action="store_true", help="Search directories recursively")
     parser.add_argument("--max-depth", type=int, help="Maximum recursion depth")
+    parser.add_argument("--walk-workers", type=int, default=1, help="Threads listing directories concurrently (default: 1)")
+    parser.add_argument("--walk-snapshot", type=Path, help="Snapshot file for incremental re-scans of unchanged directories")
+    parser.add_argument("--git-index", action="store_const", const="git-index", default="filesystem", dest="file_source", help="Take tracked files from .git/index instead of walking directories")
+    parser.add_argument("--include-untracked", action="store_true", help="With --git-index: also include untracked files")
 
 
-    parser.add_argument("-o", "--output", type=Path, default=Path("merged_output.txt"), help="Output file path")
+    parser.add_argument("-o", "--output", type=Path, default=Path("merged_output.txt"), help='Output file path ("-" writes to stdout)')
+    parser.add_argument("-t", "--target", action="append", type=parse_target_string, dest="targets", help="PATTERN=OUTPUT: merge files matching PATTERN into OUTPUT; all targets share one walk and replace -o (repeatable)")
     parser.add_argument("--encoding", default="utf-8", help="Output encoding (default: utf-8)")
     parser.add_argument("--log-file", type=Path, help="Write logs to file (default: stderr)")
     parser.add_argument("-v", "--verbose", action="store_true", help="Verbose logs")
@@ -802,11 +2821,34 @@ Examples:
     parser.add_argument("--add-line-numbers", action="store_true", help="Add line numbers to file content")
     parser.add_argument("--remove-empty-lines", action="store_true", help="Remove empty/whitespace-only lines")
     parser.add_argument("--deduplicate", action="store_true", dest="deduplicate_lines", help="Deduplicate identical lines within each file")
+    parser.add_argument("--dedup-lines-digest", choices=DEDUP_LINE_DIGESTS, default="exact", help="Remember lines for --deduplicate as 64/128-bit digests instead of text (implies it; default: exact)")
+    parser.add_argument("--dedup-lines-collisions", choices=DEDUP_LINE_COLLISIONS, default="trust", help="With digests: trust equal digests or also compare line length (default: trust)")
+    parser.add_argument("--dedup-lines-scope", choices=DEDUP_LINE_SCOPES, default="file", help="Deduplicate lines within each file or across all files (global implies --deduplicate)")
     parser.add_argument("--sort-files", action="store_true", help="Sort files before merging")
+    parser.add_argument("--stream", action="store_true", dest="stream_files", help="Merge files while the walk is running (only with --no-headers --no-metadata)")
+    parser.add_argument("--read-workers", type=int, default=1, help="Threads reading files ahead of the writer (default: 1)")
+    parser.add_argument("--read-ahead", default="64MB", help="Max input size of files read ahead of the writer (default: 64MB)")
+    parser.add_argument("--no-zero-copy", action="store_false", dest="zero_copy", help="Always decode files line by line (disable raw byte copy)")
+    parser.add_argument("--compress", choices=COMPRESSIONS, default="auto", dest="compression", help="Compress output (default: auto = by -o suffix .gz/.bz2/.xz)")
+    parser.add_argument("--compress-level", type=int, dest="compression_level", help="Compression level 0-9 (default: codec default)")
+    parser.add_argument("--dedup-files", action="store_true", help="Write each distinct file content once; later copies get a reference stub")
+    parser.add_argument("--hash-cache", type=Path, dest="hash_cache_file", help="Cache file of content digests for --dedup-files (implies it)")
+    parser.add_argument("--toc", action="store_true", help="Write OUTPUT.toc.json with byte offsets and line ranges of every file")
+    parser.add_argument("--incremental", action="store_true", help="Reuse sections of unchanged files from the previous output (manifest: OUTPUT.manifest.json)")
+    parser.add_argument("--manifest", type=Path, dest="manifest_file", help="Manifest file for --incremental (implies --incremental)")
+    parser.add_argument("--shard-size", help="Split output into shards of at most this input size (e.g. 50MB); -o becomes the index")
+    parser.add_argument("--shard-files", type=int, help="Split output into shards of at most N files")
+    parser.add_argument("--shard-lines", type=int, help="Split output into shards of at most N source lines")
+    parser.add_argument("--split-files", action="store_true", help="With --shard-size/--shard-lines: cut larger text files across shards")
 
 
     parser.add_argument("--max-file-size", help="Max individual file size (e.g. 10MB, 200KB)")
     parser.add_argument("--max-total-size", help="Max total size of selected files (e.g. 100MB)")
+    parser.add_argument("--budget-mode", choices=BUDGET_MODES, default="order", help="Fill --max-total-size in file order or by priority (default: order)")
+    parser.add_argument("--priority-recency", type=float, default=0.0, help="Priority weight of newer files (with --budget-mode priority)")
+    parser.add_argument("--priority-size", type=float, default=0.0, help="Priority weight of smaller files (with --budget-mode priority)")
+    parser.add_argument("--priority-path", action="append", type=parse_weight_string, help="PATH=WEIGHT priority for files under a relative path (repeatable)")
+    parser.add_argument("--priority-pattern", action="append", type=parse_weight_string, help="GLOB=WEIGHT priority for matching files (repeatable)")
 
 
     parser.add_argument("--keep-backups", action="store_true", help="Keep backups of output file before overwrite")
@@ -841,12 +2883,17 @@ def create_config_from_args(args: argparse.Namespace) -> MergerConfig:
         recursive=bool(args.recursive),
         include_pattern=args.pattern,
         max_depth=args.max_depth,
+        walk_workers=args.walk_workers,
+        walk_snapshot=args.walk_snapshot,
+        file_source=args.file_source,
+        include_untracked=bool(args.include_untracked),
         exclude_dirs=set(args.exclude_dirs or []),
         exclude_names=set(args.exclude_names or []),
         exclude_patterns=set(args.exclude_patterns or []),
         use_gitignore=use_gitignore,
         custom_gitignore=custom_gitignore,
         output_file=args.output,
+        targets=list(args.targets or []),
         encoding=args.encoding,
         preview_mode=bool(args.preview),
         include_headers=bool(args.include_headers),
@@ -855,17 +2902,50 @@ def create_config_from_args(args: argparse.Namespace) -> MergerConfig:
         add_line_numbers=bool(args.add_line_numbers),
         remove_empty_lines=bool(args.remove_empty_lines),
         deduplicate_lines=bool(args.deduplicate_lines),
+        dedup_lines_digest=args.dedup_lines_digest,
+        dedup_lines_collisions=args.dedup_lines_collisions,
+        dedup_lines_scope=args.dedup_lines_scope,
         sort_files=bool(args.sort_files),
+        stream_files=bool(args.stream_files),
+        read_workers=args.read_workers,
+        read_ahead_bytes=parse_size_string(args.read_ahead),
+        zero_copy=bool(args.zero_copy),
+        compression=args.compression,
+        compression_level=args.compression_level,
+        toc=bool(args.toc),
+        dedup_files=bool(args.dedup_files) or bool(args.hash_cache_file),
+        hash_cache_file=args.hash_cache_file,
         max_file_size=max_file,
         max_total_size=max_total,
+        budget_mode=args.budget_mode,
+        priority_recency_weight=args.priority_recency,
+        priority_size_weight=args.priority_size,
+        priority_path_weights=dict(args.priority_path or []),
+        priority_pattern_weights=dict(args.priority_pattern or []),
         keep_backups=bool(args.keep_backups) or bool(args.backup_dir),
         backup_dir=args.backup_dir,
         overwrite_backups=bool(args.overwrite_backups),
+        incremental=bool(args.incremental) or bool(args.manifest_file),
+        manifest_file=args.manifest_file,
+        shard_max_bytes=parse_size_string(args.shard_size) if args.shard_size else None,
+        shard_max_files=args.shard_files,
+        shard_max_lines=args.shard_lines,
+        shard_split_files=bool(args.split_files),
         include_binary_placeholders=bool(args.include_binary_placeholders),
         hash_binary_files=bool(args.hash_binary_files),
     )
 
 
+def _detach_stdout() -> None:
+    """Point stdout at os.devnull once its reader is gone, so the exit-time flush does not fail again."""
+    try:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+    except (OSError, ValueError):
+        pass
+
+
 def main(argv: Optional[Sequence[str]] = None) -> int:
     try:
         args = parse_arguments(argv)
@@ -875,6 +2955,8 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         merger = SmartFileMerger(config)
 
         ok = merger.merge()
+        if merger.stats["output_closed"] and config.output_stream is None:
+            _detach_stdout()
         return 0 if ok else 1
 
     except KeyboardInterrupt:
@@ -0,0 +1,849 @@
+"""
+Split merged files produced by file-merger back into the original tree.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bz2
+import codecs
+import gzip
+import io
+import logging
+import lzma
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set, TextIO, Tuple
+
+from codingutils.common_utils import ProgressReporter, format_size
+from codingutils.merger import COMPRESSION_SUFFIXES, _codec_name, load_toc, parse_size_string
+
+logger = logging.getLogger(__name__)
+
+_FILE_LINE = re.compile(r"FILE (\d+)/(\d+): (.*?)(?: \(part (\d+)/(\d+)\))?")
+_ENCODING_LINE = re.compile(r"Size: .* \| Encoding: (\S+)")
+_FILE_LIST_ENTRY = re.compile(r"\s*\d+\. (.*) \([^()]*\)")
+_SHARD_ENTRY = re.compile(r"\s*\d+\. (.*) \(\d+ files, [^()]*\)")
+# Bodies the merger writes instead of a file's content (binary placeholders, skip and error markers)
+_PLACEHOLDER = re.compile(
+    r"\[BINARY FILE: .*\]\nSize: .*\n(?:SHA256: [0-9a-f]{64}\n)?Binary content is not merged\.\n"
+    r"|\[BINARY FILE SKIPPED\]\n"
+    r"|\[FILE SKIPPED: exceeds max_file_size .*\]\n"
+    r"|\[ERROR: .*\]\n"
+)
+_PLACEHOLDER_MAX_LINES = 4
+# Body of a file merged with dedup_files whose content equals an earlier file's
+_DUPLICATE = re.compile(r"\[DUPLICATE: same content as FILE (\d+): (.*)\]\n")
+_PLACEHOLDER_MAX_BYTES = 64 * 1024
+_DECOMPRESSORS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
+
+
+
+
+
+@dataclass(slots=True)
+class SplitterConfig:
+
+    # Merged files (or shard indexes) in the order they were written
+    inputs: List[Path] = field(default_factory=list)
+    output_dir: Path = Path(".")
+    # Encoding of the merged files; None = from the table of contents, else utf-8
+    encoding: Optional[str] = None
+
+    # Format of the merge (MergerConfig defaults); None = from the metadata header
+    file_separator: str = "-" * 40
+    header_separator: str = "=" * 60
+    line_number_format: str = "{:>4}: "
+    line_numbers: Optional[bool] = None
+    compact_file_headers: Optional[bool] = None
+
+    # Read sections via `<input>.toc.json` when it exists (see merger.load_toc())
+    use_toc: bool = True
+    # Write files in the encoding named in their header instead of the merged file's
+    restore_encoding: bool = True
+    overwrite: bool = False
+
+    # Threads writing restored files
+    write_workers: int = 4
+    read_buffer_size: int = 8 * 1024 * 1024
+    # Approximate bytes handed to writers but not yet written (header parsing mode)
+    write_ahead_bytes: int = 64 * 1024 * 1024
+
+    def __post_init__(self) -> None:
+        self.inputs = [Path(p) for p in self.inputs]
+        self.output_dir = Path(self.output_dir)
+
+        if not self.inputs:
+            raise ValueError("at least one merged file is required")
+
+        if self.write_workers < 1:
+            raise ValueError("write_workers must be at least 1")
+
+        for name in ("read_buffer_size", "write_ahead_bytes"):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"{name} must be positive")
+
+
+
+
+
+
+@dataclass(slots=True)
+class _MergeFormat:
+    """Options of one merged file, taken from its metadata header or the config."""
+
+    line_numbers: bool = False
+    compact_file_headers: bool = False
+    # Relative paths of the FILE LIST, in section order
+    file_list: List[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class _Section:
+    """A FILE section being restored in header parsing mode (target None = not restored)."""
+
+    target: Optional[Path]
+    part: int
+    parts: int
+    encoder: Any = None
+    # Body lines not yet handed to a writer
+    lines: List[str] = field(default_factory=list)
+    buffered: int = 0
+    started: bool = False
+
+
+class MergedFileSplitter:
+    """
+    Restore the files of one or more merged outputs under `output_dir`.
+
+    With a table of contents (`--toc` merges) every file is a job of its own:
+    writer threads read its byte ranges with large sequential reads and copy
+    them unchanged when nothing has to be undone. Otherwise the merged file
+    is read once, front to back, and FILE headers are recognised as it
+    streams; bodies go to the writer threads in chunks, bounded by
+    `write_ahead_bytes`. Line numbers (`add_line_numbers`) are stripped and
+    compact headers are resolved through the metadata FILE LIST; parts of
+    files split across shards are joined and duplicate stubs (`dedup_files`)
+    are replaced by the content they refer to. Binary placeholders and skip
+    markers are not restored. The merger ends every non-empty file with a
+    newline, so restored text files always end with one.
+    """
+
+    def __init__(self, config: SplitterConfig) -> None:
+        self.config = config
+
+        self.stats: Dict[str, object] = {
+            "start_time": 0.0,
+            "end_time": 0.0,
+            "files_found": 0,
+            "files_restored": 0,
+            "files_skipped_placeholder": 0,
+            "files_skipped_existing": 0,
+            "files_failed": 0,
+            "bytes_written": 0,
+        }
+        self._stats_lock = threading.Lock()
+        # Targets written by this run: later parts append to them, other runs' files are kept
+        self._created: Set[Path] = set()
+        # Compact headers without a FILE LIST: names already used (see _target())
+        self._names: Set[str] = set()
+        # Header parsing: targets by FILE index and lines numbered so far, for parts in later shards
+        self._targets: Dict[int, Path] = {}
+        self._line_nos: Dict[Path, int] = {}
+
+
+
+
+
+    def split(self) -> bool:
+        self.stats["start_time"] = time.time()
+        try:
+            inputs = self._expand_inputs(self.config.inputs)
+            tocs = self._load_tocs(inputs)
+            with ThreadPoolExecutor(max_workers=self.config.write_workers, thread_name_prefix="split-write") as pool:
+                if tocs is not None:
+                    self._split_with_toc(pool, inputs, tocs)
+                else:
+                    for merged in inputs:
+                        self._split_stream(pool, merged)
+        except Exception as e:
+            logger.error("Failed to split: %s", e)
+            return False
+
+        self.stats["end_time"] = time.time()
+        self._log_results()
+        return int(self.stats["files_failed"]) == 0
+
+    def _expand_inputs(self, inputs: List[Path]) -> List[Path]:
+        """Replace shard indexes (`MERGED FILE INDEX`) by the shards they list."""
+        expanded: List[Path] = []
+        for merged in inputs:
+            shards = self._read_shard_index(merged)
+            expanded.extend(shards if shards is not None else [merged])
+        return expanded
+
+    def _read_shard_index(self, merged: Path) -> Optional[List[Path]]:
+        with self._open_text(merged, self._encoding(None)) as f:
+            if f.readline().rstrip("\n") != "MERGED FILE INDEX":
+                return None
+            shards: List[Path] = []
+            in_list = False
+            for line in f:
+                line = line.rstrip("\n")
+                if line == "SHARDS:":
+                    in_list = True
+                elif in_list and (m := _SHARD_ENTRY.fullmatch(line)) is not None and not line.startswith("      "):
+                    shards.append(merged.with_name(m.group(1)))
+        logger.info("Shard index %s: %d shards", merged, len(shards))
+        return shards
+
+    def _load_tocs(self, inputs: List[Path]) -> Optional[List[Dict[str, Any]]]:
+        """Tables of contents of all inputs, or None if any is missing or stale."""
+        if not self.config.use_toc:
+            return None
+        tocs: List[Dict[str, Any]] = []
+        for merged in inputs:
+            try:
+                tocs.append(load_toc(merged))
+            except FileNotFoundError:
+                return None
+            except ValueError as e:
+                logger.warning("%s; parsing FILE headers instead", e)
+                return None
+        return tocs
+
+    def _encoding(self, toc: Optional[Dict[str, Any]]) -> str:
+        if self.config.encoding is not None:
+            return self.config.encoding
+        if toc is not None and toc.get("encoding"):
+            return str(toc["encoding"])
+        return "utf-8"
+
+    def _open_text(self, merged: Path, encoding: str) -> TextIO:
+        """Open a merged file for reading, decompressing `.gz`/`.bz2`/`.xz` outputs."""
+        method = COMPRESSION_SUFFIXES.get(merged.suffix.lower())
+        if method is None:
+            raw: BinaryIO = open(merged, "rb", buffering=self.config.read_buffer_size)
+        else:
+            raw = io.BufferedReader(_DECOMPRESSORS[method](merged, "rb"), buffer_size=self.config.read_buffer_size)
+        return io.TextIOWrapper(raw, encoding=encoding, errors="replace", newline="\n")
+
+    def _merge_format(self, preamble: Iterable[str]) -> _MergeFormat:
+        """Read the options and FILE LIST of a metadata header; the config overrides them."""
+        cfg = self.config
+        fmt = _MergeFormat()
+        lines = [line.rstrip("\n") for line in preamble]
+        if lines and lines[0] == "MERGED FILE REPORT":
+            in_list = False
+            for line in lines:
+                if line == "FILE LIST:":
+                    in_list = True
+                elif in_list and (m := _FILE_LIST_ENTRY.fullmatch(line)) is not None:
+                    fmt.file_list.append(m.group(1))
+                elif line.strip() == "add_line_numbers: True":
+                    fmt.line_numbers = True
+                elif line.strip() == "compact_file_headers: True":
+                    fmt.compact_file_headers = True
+        if cfg.line_numbers is not None:
+            fmt.line_numbers = cfg.line_numbers
+        if cfg.compact_file_headers is not None:
+            fmt.compact_file_headers = cfg.compact_file_headers
+        return fmt
+
+    def _target(self, rel: str, index: int, *, compact: bool = False) -> Optional[Path]:
+        """Path to restore `rel` at, or None if it would leave output_dir."""
+        parts = [p for p in rel.replace("\\", "/").split("/") if p not in ("", ".")]
+        if not parts or ".." in parts:
+            logger.warning("Not restoring %r: path leaves the output directory", rel)
+            return None
+        if compact:
+            # Only the name is known; keep same-named files apart
+            name = parts[-1]
+            if name in self._names:
+                name = f"{index:04d}_{name}"
+            self._names.add(name)
+            parts = [name]
+        return self.config.output_dir.joinpath(*parts)
+
+    def _claim(self, target: Path, part: int) -> bool:
+        """Whether `target` may be written: new files (or any with overwrite), and later parts of ours."""
+        if part > 1:
+            return target in self._created
+        if target in self._created or (target.exists() and not self.config.overwrite):
+            logger.warning("Not restoring %s: file exists", target)
+            self._bump_stat("files_skipped_existing")
+            return False
+        self._created.add(target)
+        return True
+
+    def _bump_stat(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] = int(self.stats[key]) + n
+
+
+
+
+
+    def _split_with_toc(self, pool: ThreadPoolExecutor, inputs: List[Path], tocs: List[Dict[str, Any]]) -> None:
+        """
+        Restore every file as one writer job reading its ranges from the inputs.
+
+        Parts of a file split across shards are gathered into the same job,
+        in shard order.
+        """
+        jobs: Dict[str, List[Tuple[Path, Dict[str, Any], str, _MergeFormat]]] = {}
+        for merged, toc in zip(inputs, tocs):
+            encoding = self._encoding(toc)
+            entries = toc["files"]
+            fmt = self._merge_format(self._read_preamble(merged, entries[0]["offset"] if entries else 0, encoding))
+            for entry in entries:
+                if "duplicate_of" in entry:
+                    # Restored from the ranges of the file it duplicates
+                    jobs[entry["path"]] = jobs.get(entry["duplicate_of"], [])
+                else:
+                    jobs.setdefault(entry["path"], []).append((merged, entry, encoding, fmt))
+
+        self._bump_stat("files_found", len(jobs))
+        futures: List[Future] = []
+        for rel, ranges in jobs.items():
+            if not ranges:
+                logger.warning("Not restoring %s: the file it duplicates is not in the inputs", rel)
+                self._bump_stat("files_failed")
+                continue
+            target = self._target(rel, ranges[0][1]["index"])
+            if target is None:
+                self._bump_stat("files_failed")
+            elif self._claim(target, 1):
+                futures.append(pool.submit(self._restore_ranges, target, ranges))
+
+        with ProgressReporter(total=len(futures), description="Splitting files", stream=sys.stderr) as progress:
+            for fut in futures:
+                fut.result()
+                progress.update(1)
+
+    def _read_preamble(self, merged: Path, end: int, encoding: str) -> List[str]:
+        with open(merged, "rb") as f:
+            data = f.read(end)
+        return codecs.decode(data, encoding, "replace").split("\n")
+
+    def _restore_ranges(self, target: Path, ranges: List[Tuple[Path, Dict[str, Any], str, _MergeFormat]]) -> None:
+        cfg = self.config
+        try:
+            written = 0
+            line_no = 0
+            f_out: Optional[BinaryIO] = None
+            # One encoder for all parts: a BOM is written once
+            encoder: Any = None
+            try:
+                for merged, entry, encoding, fmt in ranges:
+                    start, length = entry["content_offset"], entry["content_length"]
+                    with open(merged, "rb") as f:
+                        f.seek(entry["offset"])
+                        header = codecs.decode(f.read(start - entry["offset"]), encoding, "replace")
+                        file_encoding = self._file_encoding(header.split("\n"), encoding)
+
+                        if len(ranges) == 1 and length <= _PLACEHOLDER_MAX_BYTES:
+                            f.seek(start)
+                            if _is_placeholder(codecs.decode(f.read(length), encoding, "replace")):
+                                self._created.discard(target)
+                                self._bump_stat("files_skipped_placeholder")
+                                return
+
+                        if f_out is None:
+                            target.parent.mkdir(parents=True, exist_ok=True)
+                            f_out = open(target, "wb")
+
+                        if not fmt.line_numbers and _codec_name(file_encoding) == _codec_name(encoding):
+                            written += _copy_range(f, f_out, start, length, cfg.read_buffer_size)
+                            continue
+
+                        if encoder is None:
+                            encoder = codecs.getincrementalencoder(file_encoding)(errors="replace")
+                        for chunk in _iter_range_text(f, start, length, encoding, cfg.read_buffer_size):
+                            if fmt.line_numbers:
+                                chunk, line_no = _strip_line_numbers(chunk, cfg.line_number_format, line_no)
+                            data = encoder.encode(chunk)
+                            f_out.write(data)
+                            written += len(data)
+                if encoder is not None and f_out is not None:
+                    data = encoder.encode("", final=True)
+                    f_out.write(data)
+                    written += len(data)
+            finally:
+                if f_out is not None:
+                    f_out.close()
+        except Exception as e:
+            logger.error("Failed to restore %s: %s", target, e)
+            self._bump_stat("files_failed")
+            return
+        self._bump_stat("files_restored")
+        self._bump_stat("bytes_written", written)
+
+    def _file_encoding(self, header: Sequence[str], merged_encoding: str) -> str:
+        """Encoding to write a file in: from its header's Size line (see restore_encoding)."""
+        if self.config.restore_encoding:
+            for line in header:
+                if (m := _ENCODING_LINE.fullmatch(line.rstrip("\n"))) is not None:
+                    try:
+                        return codecs.lookup(m.group(1)).name
+                    except LookupError:
+                        break
+        return merged_encoding
+
+
+
+
+
+    def _split_stream(self, pool: ThreadPoolExecutor, merged: Path) -> None:
+        """
+        Restore the files of `merged` by parsing FILE headers while reading it.
+
+        A header is a blank line, file_separator, `FILE i/N: path`, a Size
+        line, an optional Modified line, header_separator[:40] and a blank
+        line. Lines only start a new section when they form such a header
+        with plausible numbering, so content that merely resembles one stays
+        in the body: after the first header, a section must be the next
+        file (`index + 1`) or the next part of the same file, and with a
+        metadata FILE LIST its path must be the listed one. The footer only
+        ends the split after the last expected section. Bodies go to the
+        writers in chunks of read_buffer_size.
+        """
+        cfg = self.config
+        encoding = self._encoding(None)
+        sep = cfg.file_separator + "\n"
+        hsep = cfg.header_separator[:40] + "\n"
+        footer_sep = cfg.header_separator + "\n"
+
+        fmt: Optional[_MergeFormat] = None
+        preamble: List[str] = []
+        section: Optional[_Section] = None
+        targets, line_nos = self._targets, self._line_nos
+        last_write: Dict[Path, Future] = {}
+        pending: Deque[Tuple[int, Future]] = deque()
+        in_flight = 0
+        ordinal = 0
+        last_index, last_part, last_parts, total = 0, 0, 0, None
+
+        def flush(sec: _Section, *, closing: bool = False) -> None:
+            """Hand buffered lines to a writer; the last one stays until the section is closed."""
+            nonlocal in_flight
+            assert sec.target is not None and fmt is not None
+            lines = sec.lines if closing else sec.lines[:-1]
+            sec.lines = [] if closing else sec.lines[-1:]
+            sec.buffered = sum(len(line) for line in sec.lines)
+            text = "".join(lines)
+            if fmt.line_numbers:
+                text, line_nos[sec.target] = _strip_line_numbers(text, cfg.line_number_format, line_nos[sec.target])
+            final = closing and sec.part == sec.parts
+            data = sec.encoder.encode(text, final=final)
+
+            while pending and in_flight + len(data) > cfg.write_ahead_bytes:
+                cost, done = pending.popleft()
+                in_flight -= cost
+                done.result()
+            fut = pool.submit(
+                self._write_chunks,
+                sec.target,
+                data,
+                append=sec.started or sec.part > 1,
+                after=last_write.get(sec.target),
+                final=final,
+            )
+            sec.started = True
+            last_write[sec.target] = fut
+            pending.append((len(data), fut))
+            in_flight += len(data)
+
+        def continues(m: "re.Match[str]") -> bool:
+            """A header-shaped block fits the numbering and FILE LIST; otherwise it is content."""
+            assert fmt is not None
+            index, count = int(m.group(1)), int(m.group(2))
+            part, parts = int(m.group(4) or 1), int(m.group(5) or 1)
+            if not (1 <= index <= count and 1 <= part <= parts):
+                return False
+            if total is not None:
+                if count != total:
+                    return False
+                if part > 1:
+                    if (index, part, parts) != (last_index, last_part + 1, last_parts):
+                        return False
+                elif index != last_index + 1:
+                    return False
+            if not fmt.file_list:
+                return True
+            if ordinal >= len(fmt.file_list):
+                return False
+            expected = fmt.file_list[ordinal]
+            if fmt.compact_file_headers:
+                expected = expected.rsplit("/", 1)[-1]
+            return m.group(3) == expected
+
+        def complete() -> bool:
+            """Every section this merged file announces has been read (the footer may follow)."""
+            if section is None:
+                return False
+            if fmt is not None and fmt.file_list:
+                return ordinal == len(fmt.file_list)
+            return last_index == total
+
+        def copy(target: Path, source: Optional[Path]) -> None:
+            if source is None or source not in self._created:
+                # The first copy was not restored (binary placeholder, refused path)
+                self._created.discard(target)
+                self._bump_stat("files_skipped_placeholder")
+                return
+            fut = pool.submit(self._copy_restored, source, target, after=last_write.get(source))
+            last_write[target] = fut
+            pending.append((0, fut))
+
+        def add(sec: _Section, line: str) -> None:
+            if sec.target is None:
+                return
+            sec.lines.append(line)
+            sec.buffered += len(line)
+            if sec.buffered >= cfg.read_buffer_size:
+                flush(sec)
+
+        def close(sec: _Section) -> None:
+            if sec.target is None:
+                return
+            # A non-empty body is followed by a blank line
+            if sec.lines and sec.lines[-1] == "\n":
+                sec.lines.pop()
+            if not sec.started and sec.parts == 1 and len(sec.lines) == 1:
+                m = _DUPLICATE.fullmatch(sec.lines[0])
+                if m is not None:
+                    copy(sec.target, targets.get(int(m.group(1))))
+                    return
+            if (
+                not sec.started
+                and sec.parts == 1
+                and len(sec.lines) <= _PLACEHOLDER_MAX_LINES
+                and _is_placeholder("".join(sec.lines))
+            ):
+                self._created.discard(sec.target)
+                self._bump_stat("files_skipped_placeholder")
+                return
+            flush(sec, closing=True)
+
+        with self._open_text(merged, encoding) as f:
+            lines = iter(f)
+            window: Deque[str] = deque()
+
+            def fill(n: int) -> bool:
+                while len(window) < n:
+                    nxt = next(lines, None)
+                    if nxt is None:
+                        return False
+                    window.append(nxt)
+                return True
+
+            while True:
+                if not window:
+                    line = next(lines, None)
+                    if line is None:
+                        break
+                    if line != "\n":
+                        # Headers and the footer start with a blank line
+                        if section is None:
+                            preamble.append(line)
+                        else:
+                            add(section, line)
+                        continue
+                    window.append(line)
+
+                m = None
+                if window[0] == "\n" and fill(4) and window[1] == sep and window[3].startswith("Size: "):
+                    m = _FILE_LINE.fullmatch(window[2].rstrip("\n"))
+                if m is not None:
+                    if fmt is None:
+                        fmt = self._merge_format(preamble)
+                    if not continues(m):
+                        m = None
+
+                if m is None:
+                    if complete() and window[0] == "\n" and fill(3) and window[1] == footer_sep \
+                            and window[2] == "MERGE COMPLETE\n":
+                        break
+                    line = window.popleft()
+                    if section is None:
+                        preamble.append(line)
+                    else:
+                        add(section, line)
+                    continue
+
+                if section is not None:
+                    close(section)
+                assert fmt is not None
+                header = [window.popleft() for _ in range(4)]
+                for expected in ("Modified: ", hsep, "\n"):
+                    if fill(1) and window[0].startswith(expected):
+                        header.append(window.popleft())
+                    elif expected != "Modified: ":
+                        break
+
+                index, total = int(m.group(1)), int(m.group(2))
+                part, parts = int(m.group(4) or 1), int(m.group(5) or 1)
+                rel = m.group(3)
+                if fmt.compact_file_headers and ordinal < len(fmt.file_list):
+                    rel = fmt.file_list[ordinal]
+                ordinal += 1
+                last_index, last_part, last_parts = index, part, parts
+                self._bump_stat("files_found")
+
+                target: Optional[Path]
+                if part > 1:
+                    target = targets.get(index)
+                else:
+                    compact = fmt.compact_file_headers and not fmt.file_list
+                    target = self._target(rel, index, compact=compact)
+                    if target is None:
+                        self._bump_stat("files_failed")
+                if target is not None and not self._claim(target, part):
+                    target = None
+                if target is not None:
+                    targets[index] = target
+                    if part == 1:
+                        line_nos[target] = 0
+
+                file_encoding = self._file_encoding(header, encoding)
+                section = _Section(
+                    target=target,
+                    part=part,
+                    parts=parts,
+                    encoder=codecs.getincrementalencoder(file_encoding)(errors="replace"),
+                )
+
+            if section is not None:
+                close(section)
+            elif fmt is None:
+                raise ValueError(f"No FILE headers found in {merged} (merged with --no-headers?)")
+
+        while pending:
+            _cost, fut = pending.popleft()
+            fut.result()
+
+    def _write_chunks(self, target: Path, data: bytes, *, append: bool, after: Optional[Future], final: bool) -> None:
+        """Write one chunk of a file, after the previous chunk of the same file (`after`) is written."""
+        if after is not None:
+            after.result()
+        try:
+            if not append:
+                target.parent.mkdir(parents=True, exist_ok=True)
+            with open(target, "ab" if append else "wb") as f:
+                f.write(data)
+        except Exception as e:
+            logger.error("Failed to restore %s: %s", target, e)
+            self._bump_stat("files_failed")
+            raise
+        self._bump_stat("bytes_written", len(data))
+        if final:
+            self._bump_stat("files_restored")
+
+    def _copy_restored(self, source: Path, target: Path, *, after: Optional[Future]) -> None:
+        """Restore a duplicate as a copy of `source`, once its last chunk (`after`) is written."""
+        if after is not None:
+            after.result()
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(source, target)
+        except Exception as e:
+            logger.error("Failed to restore %s: %s", target, e)
+            self._bump_stat("files_failed")
+            raise
+        self._bump_stat("bytes_written", target.stat().st_size)
+        self._bump_stat("files_restored")
+
+    def _log_results(self) -> None:
+        end = float(self.stats.get("end_time") or time.time())
+        start = float(self.stats.get("start_time") or end)
+
+        logger.info("=" * 60)
+        logger.info("SPLIT COMPLETE")
+        logger.info("=" * 60)
+        logger.info("Output directory: %s", self.config.output_dir)
+        logger.info("files_found: %d", int(self.stats["files_found"]))
+        logger.info("files_restored: %d", int(self.stats["files_restored"]))
+        logger.info("skipped_placeholder: %d", int(self.stats["files_skipped_placeholder"]))
+        logger.info("skipped_existing: %d", int(self.stats["files_skipped_existing"]))
+        logger.info("failed: %d", int(self.stats["files_failed"]))
+        logger.info("bytes_written: %s", format_size(int(self.stats["bytes_written"])))
+        logger.info("processing_time: %.2fs", end - start)
+        logger.info("=" * 60)
+
+
+
+
+
+
+def _is_placeholder(body: str) -> bool:
+    return _PLACEHOLDER.fullmatch(body) is not None
+
+
+def _strip_line_numbers(text: str, line_number_format: str, line_no: int) -> Tuple[str, int]:
+    """Remove the merger's line number prefixes from the lines of `text`, numbering from `line_no` + 1."""
+    lines = text.split("\n")
+    rest = lines.pop()
+    if rest:
+        lines.append(rest)
+    prefixes = map(line_number_format.format, range(line_no + 1, line_no + 1 + len(lines)))
+    stripped = [line[len(p):] if line.startswith(p) else line for line, p in zip(lines, prefixes)]
+    if not rest:
+        stripped.append("")
+    return "\n".join(stripped), line_no + len(lines)
+
+
+def _iter_range_text(f: BinaryIO, start: int, length: int, encoding: str, chunk_size: int) -> Iterator[str]:
+    """Decode `length` bytes of `f` from `start` in chunks that end at line boundaries."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    f.seek(start)
+    left = length
+    tail = ""
+    while left > 0:
+        data = f.read(min(chunk_size, left))
+        if not data:
+            break
+        left -= len(data)
+        text = tail + decoder.decode(data)
+        cut = text.rfind("\n") + 1
+        text, tail = text[:cut], text[cut:]
+        if text:
+            yield text
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _copy_range(src: BinaryIO, dst: BinaryIO, start: int, length: int, chunk_size: int) -> int:
+    """Copy `length` bytes of `src` from `start` to `dst`: in the kernel when possible, else in chunks."""
+    dst.flush()
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < length:
+                n = os.copy_file_range(src.fileno(), dst.fileno(), length - copied, start + copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError:
+            pass
+    if copied:
+        dst.seek(0, os.SEEK_END)
+    src.seek(start + copied)
+    while copied < length:
+        data = src.read(min(chunk_size, length - copied))
+        if not data:
+            break
+        dst.write(data)
+        copied += len(data)
+    return copied
+
+
+def parse_arguments(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Split merged files produced by file-merger back into files",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=r"""
+Examples:
+
+  file-splitter merged.txt -o restored
+
+
+  file-splitter merged.txt -o restored --workers 8 --overwrite
+
+
+  file-splitter merged.txt -o restored --no-toc --line-numbers
+
+
+  file-splitter merged.txt.gz -o restored
+""".strip(),
+    )
+
+    parser.add_argument("inputs", nargs="+", type=Path, help="Merged files or shard indexes, in merge order")
+    parser.add_argument("-o", "--output-dir", type=Path, default=Path("."), help="Directory to restore files into (default: .)")
+    parser.add_argument("--encoding", help="Encoding of the merged files (default: from .toc.json, else utf-8)")
+    parser.add_argument("--log-file", type=Path, help="Write logs to file (default: stderr)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Verbose logs")
+
+    parser.add_argument("--no-toc", action="store_false", dest="use_toc", help="Parse FILE headers even when a .toc.json exists")
+    parser.add_argument("--line-numbers", action="store_true", default=None, dest="line_numbers", help="Strip line numbers (default: from the metadata header)")
+    parser.add_argument("--no-line-numbers", action="store_false", dest="line_numbers", help="Keep content as is even if the metadata header lists line numbers")
+    parser.add_argument("--line-number-format", default="{:>4}: ", help='Line number format used by the merge (default: "{:>4}: ")')
+    parser.add_argument("--compact-file-headers", action="store_true", default=None, help="FILE headers hold names only (default: from the metadata header)")
+    parser.add_argument("--keep-encoding", action="store_false", dest="restore_encoding", help="Write files in the merged file's encoding, not the one in their header")
+    parser.add_argument("--overwrite", action="store_true", help="Overwrite existing files")
+
+    parser.add_argument("--workers", type=int, default=4, dest="write_workers", help="Threads writing files (default: 4)")
+    parser.add_argument("--read-buffer", default="8MB", help="Read/write chunk size (default: 8MB)")
+    parser.add_argument("--write-ahead", default="64MB", help="Max data parsed ahead of the writers (default: 64MB)")
+
+    return parser.parse_args(argv)
+
+
+def _configure_logging(log_file: Optional[Path], *, verbose: bool) -> None:
+    level = logging.DEBUG if verbose else logging.INFO
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, mode="w", encoding="utf-8"))
+    logging.basicConfig(level=level, handlers=handlers, force=True)
+
+
+def create_config_from_args(args: argparse.Namespace) -> SplitterConfig:
+    return SplitterConfig(
+        inputs=list(args.inputs),
+        output_dir=args.output_dir,
+        encoding=args.encoding,
+        line_number_format=args.line_number_format,
+        line_numbers=args.line_numbers,
+        compact_file_headers=args.compact_file_headers,
+        use_toc=bool(args.use_toc),
+        restore_encoding=bool(args.restore_encoding),
+        overwrite=bool(args.overwrite),
+        write_workers=args.write_workers,
+        read_buffer_size=parse_size_string(args.read_buffer),
+        write_ahead_bytes=parse_size_string(args.write_ahead),
+    )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    try:
+        args = parse_arguments(argv)
+        _configure_logging(args.log_file, verbose=bool(args.verbose))
+
+        config = create_config_from_args(args)
+        splitter = MergedFileSplitter(config)
+
+        ok = splitter.split()
+        return 0 if ok else 1
+
+    except KeyboardInterrupt:
+        print("\nOperation cancelled by user", file=sys.stderr)
+        return 130
+    except ValueError as e:
+        logger.error("Configuration error: %s", e)
+        return 1
+    except Exception as e:
+        logger.error("Fatal error: %s", e)
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
+
+
+__all__ = [
+    "SplitterConfig",
+    "MergedFileSplitter",
+    "parse_arguments",
+    "create_config_from_args",
+    "main",
+]
@@ -11,12 +11,13 @@ CLI flag style aligned with comment_extractor:
 from __future__ import annotations
 
 import argparse
-import fnmatch
 import json
 import logging
+import os
 import stat as stat_module
 import sys
 import time
+from concurrent.futures import Future
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
@@ -24,11 +25,17 @@ from typing import Any, Dict, List, Optional, Sequence
 from xml.etree import ElementTree as ET
 
 from codingutils.common_utils import (
+    DirListing,
     FilterConfig,
+    FilterMatcher,
     GitIgnoreParser,
+    ParallelScanner,
+    ScopedGitIgnoreParser,
+    WalkSnapshot,
     FileContentDetector,
     FileType,
     format_size,
+    scan_directory,
 )
 
 logger = logging.getLogger(__name__)
@@ -110,25 +117,33 @@ class NodeFilter:
       to match user expectations for "exclude subtree".
     """
 
-    def __init__(self, config: TreeConfig, gitignore: Optional[GitIgnoreParser], root: Path) -> None:
+    def __init__(
+        self,
+        config: TreeConfig,
+        gitignore: Optional[GitIgnoreParser],
+        root: Path,
+        *,
+        matcher: Optional[FilterMatcher] = None,
+    ) -> None:
         self.config = config
         self.gitignore = gitignore
         self.root = root.resolve()
+        self.matcher = matcher if matcher is not None else config.compile_matcher(dir_probe=True)
 
     def _safe_rel(self, path: Path) -> str:
+        # Children are built from the resolved root, so a lexical check suffices;
+        # only paths outside it (followed symlinks) need resolve().
+        rel = FilterMatcher.relative_posix(path, self.root)
+        if rel is not None:
+            return rel
         try:
             return path.resolve().relative_to(self.root).as_posix()
         except Exception:
             return path.as_posix()
 
     def is_hidden_path(self, path: Path) -> bool:
-
-        try:
-            rel = path.resolve().relative_to(self.root)
-            parts = rel.parts
-        except Exception:
-            parts = path.parts
-        return any(p.startswith(".") for p in parts if p)
+        rel = self._safe_rel(path)
+        return any(p.startswith(".") and p != "." for p in rel.split("/"))
 
     def should_include(self, path: Path, *, is_dir: bool) -> bool:
         cfg = self.config
@@ -138,42 +153,17 @@ class NodeFilter:
             return False
 
 
-        if self.gitignore is not None and self.gitignore.should_ignore(path):
-            return False
-
-
-        if is_dir and cfg.exclude_dirs:
-            try:
-                rel_parts = path.resolve().relative_to(self.root).parts
-            except Exception:
-                rel_parts = path.parts
-            if any(seg in cfg.exclude_dirs for seg in rel_parts):
-                return False
-
-
-        if cfg.exclude_names:
-            for pat in cfg.exclude_names:
-                if fnmatch.fnmatchcase(path.name, pat):
-                    return False
-
-
-        if cfg.exclude_patterns:
-            rel_str = self._safe_rel(path)
-            for pat in cfg.exclude_patterns:
-                if fnmatch.fnmatchcase(path.name, pat) or fnmatch.fnmatchcase(rel_str, pat):
+        if self.gitignore is not None:
+            if is_dir:
+                if self.gitignore.should_prune(path):
                     return False
+            elif self.gitignore.should_ignore(path, is_dir=False):
+                return False
 
 
-                if is_dir:
-                    probe = rel_str.rstrip("/") + "/__x__"
-                    if fnmatch.fnmatchcase(probe, pat):
-                        return False
-
-
-        if not is_dir and not fnmatch.fnmatchcase(path.name, cfg.include_pattern):
-            return False
-
-        return True
+        matcher = self.matcher
+        rel = self._safe_rel(path) if matcher.needs_rel else None
+        return not matcher.excludes(path.name, rel, is_dir=is_dir)
 
 
 
@@ -194,8 +184,56 @@ class TreeBuilder:
             "start_time": 0.0,
             "end_time": 0.0,
         }
+        # Set during build() when directories are listed concurrently (walk_workers > 1)
+        self._scanner: Optional[ParallelScanner] = None
+        # Snapshot used by the last recursive build (TreeConfig.walk_snapshot)
+        self.snapshot: Optional[WalkSnapshot] = None
+        # exclude/include rules shared by the per-root NodeFilters
+        self.matcher = config.compile_matcher(dir_probe=True)
 
     def build(self, roots: Sequence[Path]) -> TreeNode:
+        cfg = self.config
+        self.snapshot = None
+        if cfg.walk_snapshot is not None and cfg.recursive:
+            self.snapshot = WalkSnapshot.load(cfg.walk_snapshot, self._snapshot_fingerprint(roots))
+
+        if cfg.walk_workers > 1 and cfg.recursive:
+            with ParallelScanner(
+                cfg.walk_workers,
+                engine=cfg.walk_engine,
+                follow_symlinks=cfg.follow_symlinks,
+                mtime=self.snapshot is not None,
+            ) as scanner:
+                self._scanner = scanner
+                try:
+                    node = self._build(roots)
+                finally:
+                    self._scanner = None
+        else:
+            node = self._build(roots)
+
+        if self.snapshot is not None:
+            self.snapshot.save()
+        return node
+
+    def _snapshot_fingerprint(self, roots: Sequence[Path]) -> str:
+        """Fingerprint of everything that decides the filtered listings of a tree."""
+        return self.config.fingerprint(
+            "tree",
+            [str(Path(p).resolve()) for p in roots],
+            self.config.show_hidden,
+            type(self.gitignore).__name__ if self.gitignore is not None else None,
+            self.gitignore.patterns if self.gitignore is not None else None,
+        )
+
+    def _known_mtime(self, directory: Path, depth: int) -> Optional[int]:
+        """Directory mtime stored in the walk snapshot, if its record may be reused."""
+        if self.snapshot is None:
+            return None
+        rec = self.snapshot.lookup(directory, depth)
+        return rec["mtime_ns"] if rec is not None else None
+
+    def _build(self, roots: Sequence[Path]) -> TreeNode:
         self.stats["start_time"] = time.time()
 
         resolved = [Path(p).resolve() for p in roots]
@@ -225,7 +263,7 @@ class TreeBuilder:
         return node
 
     def _build_single_root(self, root: Path) -> Optional[TreeNode]:
-        nf = NodeFilter(self.config, self.gitignore, root=root)
+        nf = NodeFilter(self.config, self.gitignore, root=root, matcher=self.matcher)
 
         if root.is_file():
             if not nf.should_include(root, is_dir=False):
@@ -263,6 +301,7 @@ class TreeBuilder:
         nf: NodeFilter,
         current_depth: int,
         allow_descend: bool = True,
+        listing: Optional["Future[DirListing]"] = None,
     ) -> None:
         cfg = self.config
         if not node.is_dir:
@@ -272,67 +311,90 @@ class TreeBuilder:
         if allow_descend and cfg.max_depth is not None and current_depth >= cfg.max_depth:
             return
 
-        try:
-            entries = list(node.path.iterdir())
-        except Exception:
-            self.stats["excluded_items"] += 1
-            return
+        if listing is not None:
+            scanned = listing.result()
+        else:
+            scanned = scan_directory(
+                node.path,
+                engine=cfg.walk_engine,
+                follow_symlinks=cfg.follow_symlinks,
+                mtime=self.snapshot is not None,
+                unchanged_mtime_ns=self._known_mtime(node.path, current_depth),
+            )
 
         children: List[TreeNode] = []
-        for entry in entries:
-
-            try:
-                is_symlink = entry.is_symlink()
-            except Exception:
-                is_symlink = False
-
-            if is_symlink and not cfg.follow_symlinks:
+        if scanned.unchanged and self.snapshot is not None:
+            cached, stats = self.snapshot.reuse(node.path)
+            self.stats["excluded_items"] += stats["excluded_items"]
+            children = [self._make_node(p, is_dir=is_dir) for p, is_dir in cached]
+        else:
+            if scanned.error is not None:
                 self.stats["excluded_items"] += 1
-                continue
+                return
+            excluded_before = self.stats["excluded_items"]
+            # Symlinks that are not followed, unreadable entries
+            self.stats["excluded_items"] += scanned.skipped
 
-            real_path = entry
-            if is_symlink and cfg.follow_symlinks:
-                try:
-                    real_path = entry.resolve()
-                except Exception:
+            for real_path, is_dir, entry in scanned.children:
+                if not nf.should_include(real_path, is_dir=is_dir):
                     self.stats["excluded_items"] += 1
                     continue
+                children.append(self._make_node(real_path, is_dir=is_dir, entry=entry))
+
+            if self.snapshot is not None:
+                self.snapshot.record(
+                    scanned,
+                    current_depth,
+                    [(c.path, c.is_dir) for c in children],
+                    {"excluded_items": self.stats["excluded_items"] - excluded_before},
+                )
+
+        # With a parallel scanner, list all subdirectories before descending into the first one
+        descend = allow_descend and (cfg.max_depth is None or current_depth + 1 < cfg.max_depth)
+        pending: Dict[Path, "Future[DirListing]"] = {}
+        if descend and self._scanner is not None:
+            pending = {
+                c.path: self._scanner.submit(c.path, unchanged_mtime_ns=self._known_mtime(c.path, current_depth + 1))
+                for c in children
+                if c.is_dir
+            }
 
-            try:
-                is_dir = real_path.is_dir()
-            except Exception:
-                self.stats["excluded_items"] += 1
-                continue
-
-            if not nf.should_include(real_path, is_dir=is_dir):
-                self.stats["excluded_items"] += 1
-                continue
-
-            child = self._make_node(real_path, is_dir=is_dir)
-            children.append(child)
-
-            if is_dir:
+        kept: List[TreeNode] = []
+        for child in children:
+            if child.is_dir:
                 self.stats["directories"] += 1
                 if allow_descend:
-                    self._populate_children(child, nf=nf, current_depth=current_depth + 1, allow_descend=True)
+                    self._populate_children(
+                        child,
+                        nf=nf,
+                        current_depth=current_depth + 1,
+                        allow_descend=True,
+                        listing=pending.pop(child.path, None),
+                    )
 
                 if cfg.exclude_empty_dirs and not child.children:
-                    children.pop()
                     self.stats["directories"] -= 1
+                    continue
             else:
                 self.stats["files"] += 1
                 self.stats["total_size"] += child.size
+            kept.append(child)
 
-        node.children = children
+        node.children = kept
 
-    def _make_node(self, path: Path, *, is_dir: bool) -> TreeNode:
+    def _make_node(self, path: Path, *, is_dir: bool, entry: Optional[os.DirEntry] = None) -> TreeNode:
         cfg = self.config
         node = TreeNode(name=path.name or str(path), path=path, is_dir=is_dir)
 
-        try:
-            node.is_symlink = path.is_symlink()
-        except Exception:
+        # Children listed via os.scandir are either non-symlinks or were resolved
+        # by the caller (follow_symlinks), so `path` itself is never a symlink.
+        if entry is not None:
             node.is_symlink = False
+        else:
+            try:
+                node.is_symlink = path.is_symlink()
+            except Exception:
+                node.is_symlink = False
 
 
         need_stat = (
@@ -341,9 +403,10 @@ class TreeBuilder:
             or cfg.show_permissions
             or cfg.sort_by in {"size", "modified"}
         )
+        st: Optional[os.stat_result] = None
         if need_stat:
             try:
-                st = path.stat()
+                st = entry.stat() if entry is not None else path.stat()
                 node.size = int(st.st_size) if not is_dir else 0
                 node.last_modified = float(st.st_mtime)
                 if cfg.show_permissions:
@@ -353,16 +416,16 @@ class TreeBuilder:
 
 
         if cfg.show_file_type and not is_dir:
-            node.file_type = self._detect_file_type(path)
+            node.file_type = self._detect_file_type(path, st)
 
         return node
 
     @staticmethod
-    def _detect_file_type(path: Path) -> FileType:
+    def _detect_file_type(path: Path, st: Optional[os.stat_result] = None) -> FileType:
 
         if path.suffix.lower() in FileContentDetector.BINARY_EXTENSIONS:
             return FileType.BINARY
-        return FileContentDetector.detect_file_type(path)
+        return FileContentDetector.probe(path, st).file_type
 
     def _sort_tree(self, node: TreeNode) -> None:
         self._sort_children(node)
@@ -694,11 +757,13 @@ class ProjectTreeGenerator:
 
 
         root = Path(self.config.directories[0]).resolve() if self.config.directories else Path.cwd().resolve()
-        parser = GitIgnoreParser(root_dir=root)
-
+        parser: GitIgnoreParser
         if self.config.custom_gitignore:
+            parser = GitIgnoreParser(root_dir=root)
             parser.load_from_file(self.config.custom_gitignore)
         else:
+            # Auto-discovery also honours nested .gitignore files, read lazily during the walk
+            parser = ScopedGitIgnoreParser(root_dir=root)
             parser.load_from_file()
         return parser
 
@@ -764,6 +829,8 @@ Examples:
     parser.add_argument("-p", "--pattern", default="*", help='File pattern (e.g. "*.py")')
     parser.add_argument("-r", "--recursive", action="store_true", help="Search directories recursively")
     parser.add_argument("--max-depth", type=int, help="Maximum recursion depth (works with --recursive)")
+    parser.add_argument("--walk-workers", type=int, default=1, help="Threads listing directories concurrently (default: 1)")
+    parser.add_argument("--walk-snapshot", type=Path, help="Snapshot file for incremental re-scans of unchanged directories")
 
 
     parser.add_argument("-f", "--format", choices=["text", "json", "xml", "markdown"], default="text")
@@ -815,6 +882,8 @@ def create_config_from_args(args: argparse.Namespace) -> TreeConfig:
         include_pattern=args.pattern,
         recursive=bool(args.recursive),
         max_depth=args.max_depth,
+        walk_workers=args.walk_workers,
+        walk_snapshot=args.walk_snapshot,
         exclude_dirs=set(args.exclude_dirs or []),
         exclude_names=set(args.exclude_names or []),
         exclude_patterns=set(args.exclude_patterns or []),
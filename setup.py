@@ -31,6 +31,7 @@ setup(
         "console_scripts": [
             "comment-extractor=codingutils.comment_extractor:main",
             "file-merger=codingutils.merger:main",
+            "file-splitter=codingutils.splitter:main",
             "tree-generator=codingutils.tree_generater:main",
         ],
     },
@@ -3,6 +3,7 @@ import logging
 from pathlib import Path
 
 import codingutils.comment_extractor as ce
+from codingutils.common_utils import ContentProbe
 
 
 # -----------------------------------------------------------------------------
@@ -248,7 +249,7 @@ def test_processor_skips_binary(monkeypatch, tmp_path):
     f = tmp_path / "a.bin"
     f.write_bytes(b"\x00\x01\x02")
 
-    monkeypatch.setattr(ce.FileContentDetector, "detect_file_type", lambda _p: ce.FileType.BINARY)
+    monkeypatch.setattr(ce.FileContentDetector, "probe", lambda _p, _st=None: ContentProbe(ce.FileType.BINARY, "utf-8"))
 
     proc = ce.CommentProcessor(make_config(tmp_path))
     removed, matches = proc.process_file(f)
@@ -260,8 +261,7 @@ def test_processor_extract_only_no_write(monkeypatch, tmp_path):
     f = tmp_path / "a.py"
     f.write_text("x = 1  # hi\n", encoding="utf-8")
 
-    monkeypatch.setattr(ce.FileContentDetector, "detect_file_type", lambda _p: ce.FileType.TEXT)
-    monkeypatch.setattr(ce.FileContentDetector, "detect_encoding", lambda _p: "utf-8")
+    monkeypatch.setattr(ce.FileContentDetector, "probe", lambda _p, _st=None: ContentProbe(ce.FileType.TEXT, "utf-8"))
 
     def boom_safe_write(*args, **kwargs):
         raise AssertionError("safe_write must not be called in extract-only mode")
@@ -281,8 +281,7 @@ def test_processor_remove_writes(monkeypatch, tmp_path):
     f = tmp_path / "a.py"
     f.write_text("x = 1  # hi\n", encoding="utf-8")
 
-    monkeypatch.setattr(ce.FileContentDetector, "detect_file_type", lambda _p: ce.FileType.TEXT)
-    monkeypatch.setattr(ce.FileContentDetector, "detect_encoding", lambda _p: "utf-8")
+    monkeypatch.setattr(ce.FileContentDetector, "probe", lambda _p, _st=None: ContentProbe(ce.FileType.TEXT, "utf-8"))
 
     captured = {}
 
@@ -307,8 +306,7 @@ def test_processor_preview_mode_does_not_write(monkeypatch, tmp_path):
     f = tmp_path / "a.py"
     f.write_text("x = 1  # hi\n", encoding="utf-8")
 
-    monkeypatch.setattr(ce.FileContentDetector, "detect_file_type", lambda _p: ce.FileType.TEXT)
-    monkeypatch.setattr(ce.FileContentDetector, "detect_encoding", lambda _p: "utf-8")
+    monkeypatch.setattr(ce.FileContentDetector, "probe", lambda _p, _st=None: ContentProbe(ce.FileType.TEXT, "utf-8"))
 
     def boom_safe_write(*args, **kwargs):
         raise AssertionError("safe_write must not be called in preview mode")
@@ -327,8 +325,7 @@ def test_process_file_unicode_decode_fallback(monkeypatch, tmp_path, caplog):
     f = tmp_path / "bad.txt"
     f.write_bytes(b"\xff\xfe# comment\n")  # invalid utf-8
 
-    monkeypatch.setattr(ce.FileContentDetector, "detect_file_type", lambda _p: ce.FileType.TEXT)
-    monkeypatch.setattr(ce.FileContentDetector, "detect_encoding", lambda _p: "utf-8")
+    monkeypatch.setattr(ce.FileContentDetector, "probe", lambda _p, _st=None: ContentProbe(ce.FileType.TEXT, "utf-8"))
 
     proc = ce.CommentProcessor(make_config(tmp_path))
 
@@ -344,8 +341,7 @@ def test_processor_cache_by_mtime(monkeypatch, tmp_path):
     f = tmp_path / "a.py"
     f.write_text("x = 1  # hi\n", encoding="utf-8")
 
-    monkeypatch.setattr(ce.FileContentDetector, "detect_file_type", lambda _p: ce.FileType.TEXT)
-    monkeypatch.setattr(ce.FileContentDetector, "detect_encoding", lambda _p: "utf-8")
+    monkeypatch.setattr(ce.FileContentDetector, "probe", lambda _p, _st=None: ContentProbe(ce.FileType.TEXT, "utf-8"))
 
     created = {"n": 0}
 
@@ -434,7 +430,7 @@ def test_find_files_integration(tmp_path, monkeypatch):
     (tmp_path / "a.py").write_text("x=1 #c\n", encoding="utf-8")
     (tmp_path / "b.txt").write_text("nope\n", encoding="utf-8")
 
-    monkeypatch.setattr(ce.FileContentDetector, "detect_file_type", lambda _p: ce.FileType.TEXT)
+    monkeypatch.setattr(ce.FileContentDetector, "probe", lambda _p, _st=None: ContentProbe(ce.FileType.TEXT, "utf-8"))
 
     proc = ce.CommentProcessor(make_config(tmp_path, include_pattern="*.py", recursive=False))
     files = proc.find_files()
@@ -449,10 +445,25 @@ def test_process_files_no_files(monkeypatch, tmp_path):
     assert res["total_files"] == 0
 
 
+def test_process_files_streaming_matches_list_mode(monkeypatch, tmp_path):
+    monkeypatch.setattr(ce, "ProgressReporter", DummyProgress)
+    (tmp_path / "a.py").write_text("x = 1  # one\n", encoding="utf-8")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "b.py").write_text("# two\ny = 2\n", encoding="utf-8")
+
+    results = []
+    for stream in (False, True):
+        proc = ce.CommentProcessor(make_config(tmp_path, include_pattern="*.py", recursive=True, stream_files=stream))
+        results.append(proc.process_files())
+
+    assert results[0] == results[1]
+    assert results[1]["total_files"] == 2
+    assert [c["text"] for c in results[1]["comments"]] == ["one", "two"]
+
+
 def test_process_files_export_json_jsonl_txt(monkeypatch, tmp_path):
     monkeypatch.setattr(ce, "ProgressReporter", DummyProgress)
-    monkeypatch.setattr(ce.FileContentDetector, "detect_file_type", lambda _p: ce.FileType.TEXT)
-    monkeypatch.setattr(ce.FileContentDetector, "detect_encoding", lambda _p: "utf-8")
+    monkeypatch.setattr(ce.FileContentDetector, "probe", lambda _p, _st=None: ContentProbe(ce.FileType.TEXT, "utf-8"))
 
     (tmp_path / "a.py").write_text("x = 1  # hi\n", encoding="utf-8")
 
@@ -518,6 +529,7 @@ def test_create_walker_uses_first_dir_as_gitignore_root(monkeypatch, tmp_path):
             return True
 
     monkeypatch.setattr(ce, "GitIgnoreParser", DummyGitIgnoreParser)
+    monkeypatch.setattr(ce, "ScopedGitIgnoreParser", DummyGitIgnoreParser)
 
     _ = ce.CommentProcessor(make_config(tmp_path, use_gitignore=True))
     assert captured["root_dir"] == tmp_path.resolve()
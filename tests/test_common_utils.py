@@ -3,8 +3,15 @@ Unit tests for common_utils module.
 Tests internal structures in isolation.
 """
 
+import fnmatch
+import io
 import sys
 import os
+import shutil
+import subprocess
+import tarfile
+import time
+import zipfile
 import pytest
 from pathlib import Path
 from unittest.mock import patch
@@ -14,8 +21,16 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 try:
     from codingutils.common_utils import (
         FilterConfig,
+        FilterMatcher,
         GitIgnoreParser,
+        ScopedGitIgnoreParser,
         FileSystemWalker,
+        FileHashCache,
+        WalkSnapshot,
+        ArchiveReader,
+        find_git_worktree,
+        read_git_index,
+        ContentProbe,
         FileContentDetector,
         FileType,
         SafeFileProcessor,
@@ -84,6 +99,42 @@ class TestFilterConfig:
         with pytest.raises(ValueError, match="max_depth must be non-negative"):
             FilterConfig(max_depth=-1)
 
+    def test_compiled_matcher_matches_fnmatch(self):
+        """Compiled matcher gives the same verdicts as per-pattern fnmatch loops."""
+        config = FilterConfig(
+            exclude_dirs={"node_modules", "build"},
+            exclude_names={"*.pyc", "Makefile", "tmp[0-9]", "?.log"},
+            exclude_patterns={"docs/*", "*.min.js", "setup.cfg", "a/*/c.py"},
+            include_pattern="*.py",
+        )
+        matcher = config.compile_matcher(dir_probe=True)
+        rels = [
+            "src/main.py", "src/main.pyc", "Makefile", "tmp1", "tmpx", "x.log", "xx.log",
+            "docs/index.py", "lib/app.min.js", "setup.cfg", "a/b/c.py", "a/c.py",
+            "build", "src/build", "pkg/node_modules", "docs", "README.md",
+        ]
+        for rel in rels:
+            name = rel.rsplit("/", 1)[-1]
+            for is_dir in (False, True):
+                expected = (
+                    (is_dir and any(seg in config.exclude_dirs for seg in rel.split("/")))
+                    or any(fnmatch.fnmatchcase(name, p) for p in config.exclude_names)
+                    or any(
+                        fnmatch.fnmatchcase(name, p)
+                        or fnmatch.fnmatchcase(rel, p)
+                        or (is_dir and fnmatch.fnmatchcase(rel + "/__x__", p))
+                        for p in config.exclude_patterns
+                    )
+                    or (not is_dir and not fnmatch.fnmatchcase(name, config.include_pattern))
+                )
+                assert matcher.excludes(name, rel, is_dir=is_dir) == expected, (rel, is_dir)
+
+    def test_matcher_relative_posix_is_lexical(self, tmp_path):
+        """relative_posix() works on path strings and rejects sibling prefixes."""
+        assert FilterMatcher.relative_posix(tmp_path / "a" / "b.py", tmp_path) == "a/b.py"
+        assert FilterMatcher.relative_posix(tmp_path, tmp_path) == "."
+        assert FilterMatcher.relative_posix(Path(str(tmp_path) + "x") / "f", tmp_path) is None
+
 
 # ============================================================================
 # GitIgnoreParser Tests
@@ -238,6 +289,40 @@ class TestGitIgnoreParser:
 
         assert result1 == result2 is True
 
+    def test_cache_is_bounded_lru(self, tmp_path):
+        """Oldest decisions are evicted once cache_size is reached."""
+        parser = GitIgnoreParser(tmp_path, cache_size=2)
+        parser.add_pattern("*.pyc")
+
+        a, b, c = (tmp_path / name for name in ("a.pyc", "b.py", "c.pyc"))
+        parser.should_ignore(a, is_dir=False)
+        parser.should_ignore(b, is_dir=False)
+        parser.should_ignore(a, is_dir=False)  # a becomes most recently used
+        parser.should_ignore(c, is_dir=False)
+
+        assert list(parser._cache) == [str(a), str(c)]
+        stats = parser.cache_stats
+        assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 3, 1)
+        assert stats["size"] == stats["maxsize"] == 2
+
+    def test_directory_verdict_answers_children(self, tmp_path):
+        """Children of an ignored directory are ignored without re-matching."""
+        parser = GitIgnoreParser(tmp_path)
+        parser.add_pattern("build")
+        parser.add_pattern("!*.py")
+
+        build = tmp_path / "build"
+        assert parser.should_ignore(build, is_dir=True) is True
+
+        with patch.object(parser, "_decide_parts") as mock_decide:
+            assert parser.should_ignore(build / "setup.py", is_dir=False) is True
+            mock_decide.assert_not_called()
+        assert parser.cache_stats["hits"] == 1
+
+    def test_invalid_cache_size(self, tmp_path):
+        with pytest.raises(ValueError, match="cache_size must be non-negative"):
+            GitIgnoreParser(tmp_path, cache_size=-1)
+
     def test_path_not_under_root(self, tmp_path):
         """Test path not under root directory."""
         parser = GitIgnoreParser(tmp_path)
@@ -251,6 +336,100 @@ class TestGitIgnoreParser:
         # Это ожидаемое поведение
         assert str(outside_file) in parser._cache
 
+    @pytest.mark.parametrize("patterns", [
+        ["*.pyc", "!keep.pyc"],
+        ["build/", "!build/keep.txt"],
+        ["/src/gen/*.py", "**/cache", "docs/**/draft*"],
+        ["node_modules/", "a/b/", "[!x]?.log", "*.tar.gz"],
+        ["*", "!*.py", "!*/"],
+    ])
+    def test_compiled_matches_interpreted(self, patterns, tmp_path):
+        """Compiled matcher must agree with the pattern-by-pattern loop."""
+        rel_paths = [
+            ("a.pyc", False), ("keep.pyc", False), ("build", True),
+            ("build/keep.txt", False), ("build/x.txt", False),
+            ("src/gen/m.py", False), ("x/src/gen/m.py", False),
+            ("lib/cache", True), ("cache", False), ("docs/a/b/draft1.md", False),
+            ("pkg/node_modules/x.js", False), ("a/b", True), ("a/b/c", False),
+            ("ab.log", False), ("xb.log", False), ("d/f.tar.gz", False),
+            ("f.py", False), ("dir", True),
+        ]
+        compiled = GitIgnoreParser(tmp_path)
+        interpreted = GitIgnoreParser(tmp_path, compiled=False)
+        for pattern in patterns:
+            compiled.add_pattern(pattern)
+            interpreted.add_pattern(pattern)
+
+        for rel, is_dir in rel_paths:
+            path = tmp_path / rel
+            assert (
+                compiled.should_ignore(path, is_dir=is_dir)
+                == interpreted.should_ignore(path, is_dir=is_dir)
+            ), rel
+
+
+class TestScopedGitIgnoreParser:
+    """Test nested (per-directory) .gitignore support."""
+
+    @pytest.fixture
+    def nested_tree(self, tmp_path):
+        (tmp_path / ".gitignore").write_text("*.log\n")
+        (tmp_path / "app.log").write_text("x")
+        (tmp_path / "main.py").write_text("x")
+
+        pkg = tmp_path / "pkg"
+        pkg.mkdir()
+        (pkg / ".gitignore").write_text("sub/local.py\n!keep.log\ngen/\n")
+        (pkg / "local.py").write_text("x")
+        (pkg / "keep.log").write_text("x")
+        (pkg / "other.log").write_text("x")
+        (pkg / "sub").mkdir()
+        (pkg / "sub" / "local.py").write_text("x")
+
+        gen = pkg / "gen"
+        gen.mkdir()
+        (gen / ".gitignore").write_text("!*\n")
+        (gen / "code.py").write_text("x")
+        return tmp_path
+
+    def test_nested_patterns_are_scoped(self, nested_tree):
+        parser = ScopedGitIgnoreParser(nested_tree)
+        parser.load_from_file()
+        pkg = nested_tree / "pkg"
+
+        assert parser.should_ignore(nested_tree / "app.log") is True
+        assert parser.should_ignore(nested_tree / "main.py") is False
+        # Relative to pkg/, not to the walk root
+        assert parser.should_ignore(pkg / "sub" / "local.py") is True
+        assert parser.should_ignore(pkg / "local.py") is False
+        # Deeper negation overrides the root pattern
+        assert parser.should_ignore(pkg / "keep.log") is False
+        assert parser.should_ignore(pkg / "other.log") is True
+
+    def test_ignored_directory_is_pruned_without_reading_it(self, nested_tree):
+        parser = ScopedGitIgnoreParser(nested_tree)
+        parser.load_from_file()
+        gen = nested_tree / "pkg" / "gen"
+
+        assert parser.should_prune(gen) is True
+        # Contents of an ignored directory cannot be re-included
+        assert parser.should_ignore(gen / "code.py") is True
+        assert gen not in parser._scopes
+
+    def test_walker_uses_nested_gitignore(self, nested_tree):
+        parser = ScopedGitIgnoreParser(nested_tree)
+        parser.load_from_file()
+        walker = FileSystemWalker(FilterConfig(recursive=True), parser)
+
+        files = walker.find_files([nested_tree])
+        names = {f.relative_to(nested_tree).as_posix() for f in files}
+
+        assert names == {
+            ".gitignore", "main.py",
+            "pkg/.gitignore", "pkg/keep.log", "pkg/local.py",
+        }
+        assert (nested_tree / "pkg" / "gen") not in parser._scopes
+
 
 # ============================================================================
 # FileSystemWalker Tests
@@ -343,6 +522,20 @@ class TestFileSystemWalker:
         assert "venv" not in str(file_names)
         assert "test_main.py" not in file_names
 
+    def test_exclude_dirs_relative_to_root(self, tmp_path):
+        """exclude_dirs only applies below the walk root, not to its ancestors."""
+        root = tmp_path / "build" / "project"
+        (root / "src").mkdir(parents=True)
+        (root / "build").mkdir()
+        (root / "src" / "main.py").touch()
+        (root / "build" / "out.py").touch()
+
+        walker = FileSystemWalker(FilterConfig(exclude_dirs={"build"}, exclude_patterns={"src/skip*"}))
+        files = walker.find_files([root])
+
+        assert files == [(root / "src" / "main.py").resolve()]
+        assert walker.stats["directories_excluded"] == 1
+
     def test_find_files_max_depth(self, sample_directory):
         """Test file finding with max depth."""
         # Create nested structure
@@ -417,6 +610,257 @@ class TestFileSystemWalker:
         assert len(files) == 0
 
 
+    @pytest.mark.parametrize("recursive", [True, False])
+    def test_scandir_and_pathlib_engines_match(self, sample_directory, recursive):
+        """Test that both walk engines produce identical files and stats."""
+        (sample_directory / "src" / "deep").mkdir()
+        (sample_directory / "src" / "deep" / "nested.py").touch()
+
+        results = {}
+        for engine in ("scandir", "pathlib"):
+            config = FilterConfig(
+                include_pattern="*.py",
+                recursive=recursive,
+                exclude_dirs={"venv"},
+                walk_engine=engine,
+            )
+            walker = FileSystemWalker(config)
+            files = walker.find_files([sample_directory])
+            results[engine] = (files, dict(walker.stats))
+
+        assert results["scandir"] == results["pathlib"]
+
+    def test_get_stat_reuses_walk_entries(self, tmp_path):
+        """Test that get_stat/get_size serve data for walked files."""
+        (tmp_path / "a.txt").write_text("hello")
+
+        walker = FileSystemWalker(FilterConfig())
+        files = walker.find_files([tmp_path])
+
+        assert walker.get_size(files[0]) == 5
+        assert walker.get_stat(tmp_path / "missing.txt") is None
+
+    @pytest.mark.parametrize("engine", ["scandir", "pathlib"])
+    def test_iter_files_ordered_matches_find_files(self, sample_directory, engine):
+        """Test that ordered streaming yields the same sequence as find_files."""
+        (sample_directory / "src" / "deep").mkdir()
+        (sample_directory / "src" / "deep" / "nested.py").touch()
+        (sample_directory / "src" / "z.py").touch()
+
+        config = FilterConfig(include_pattern="*", recursive=True, walk_engine=engine)
+        walker = FileSystemWalker(config)
+
+        expected = walker.find_files([sample_directory])
+        expected_stats = dict(walker.stats)
+        streamed = list(walker.iter_files([sample_directory], ordered=True))
+
+        assert streamed == expected
+        assert walker.stats == expected_stats
+
+    def test_iter_files_is_lazy_and_dedups_roots(self, sample_directory):
+        """Test that iter_files yields before the walk ends and skips duplicates."""
+        walker = FileSystemWalker(FilterConfig(include_pattern="*.py"))
+
+        it = walker.iter_files([sample_directory, sample_directory / "src"])
+        first = next(it)
+        assert first.suffix == ".py"
+        # Walk is still in progress: not every directory has been listed yet
+        assert walker.stats["files_found"] < 7
+
+        rest = list(it)
+        assert len([first] + rest) == 3
+        assert len(set([first] + rest)) == 3
+
+    @pytest.mark.parametrize("engine", ["scandir", "pathlib"])
+    @pytest.mark.parametrize("max_depth", [None, 1])
+    def test_parallel_walk_matches_sequential(self, sample_directory, engine, max_depth):
+        """Test that the threaded walk gives the same files, order and stats."""
+        for i in range(5):
+            (sample_directory / "src" / f"pkg{i}").mkdir()
+            (sample_directory / "src" / f"pkg{i}" / "mod.py").touch()
+
+        def walk(workers, ordered):
+            config = FilterConfig(
+                recursive=True,
+                exclude_dirs={"venv"},
+                max_depth=max_depth,
+                walk_engine=engine,
+                walk_workers=workers,
+            )
+            walker = FileSystemWalker(config)
+            files = list(walker.iter_files([sample_directory], ordered=ordered))
+            return files, dict(walker.stats)
+
+        seq_files, seq_stats = walk(1, ordered=True)
+        par_files, par_stats = walk(4, ordered=True)
+        assert par_files == seq_files
+        assert par_stats == seq_stats
+
+        unordered_files, unordered_stats = walk(4, ordered=False)
+        assert sorted(unordered_files) == sorted(seq_files)
+        assert unordered_stats == seq_stats
+
+    @staticmethod
+    def _age_dirs(root, seconds=3600):
+        """Move directory mtimes into the past so snapshot records are not racy."""
+        past = time.time_ns() - seconds * 1_000_000_000
+        for d in [root, *(p for p in root.rglob("*") if p.is_dir())]:
+            os.utime(d, ns=(past, past))
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_walk_snapshot_reuses_unchanged_directories(self, sample_directory, tmp_path_factory, workers):
+        """Test that a second walk reuses listings and picks up changed directories."""
+        snapshot_file = tmp_path_factory.mktemp("snap") / "walk.json"
+        self._age_dirs(sample_directory)
+
+        def walk():
+            config = FilterConfig(
+                include_pattern="*.py",
+                exclude_dirs={"venv"},
+                walk_snapshot=snapshot_file,
+                walk_workers=workers,
+            )
+            walker = FileSystemWalker(config)
+            return walker.find_files([sample_directory]), dict(walker.stats), walker.snapshot.stats
+
+        first_files, first_stats, first_snap = walk()
+        assert first_snap["reused"] == 0 and first_snap["rescanned"] > 0
+        assert snapshot_file.exists()
+
+        files, stats, snap = walk()
+        assert (files, stats) == (first_files, first_stats)
+        assert snap == {"reused": first_snap["rescanned"], "rescanned": 0}
+
+        # Adding a file bumps the directory mtime: only that directory is listed again
+        (sample_directory / "src" / "added.py").touch()
+        files, stats, snap = walk()
+        assert sample_directory / "src" / "added.py" in files
+        assert stats["files_found"] == first_stats["files_found"] + 1
+        assert snap["rescanned"] == 1
+
+    def test_walk_snapshot_invalidated_by_filter_change(self, sample_directory, tmp_path_factory):
+        """Test that a different filter fingerprint discards the snapshot."""
+        snapshot_file = tmp_path_factory.mktemp("snap") / "walk.json"
+        self._age_dirs(sample_directory)
+
+        FileSystemWalker(FilterConfig(include_pattern="*.py", walk_snapshot=snapshot_file)).find_files([sample_directory])
+
+        walker = FileSystemWalker(FilterConfig(include_pattern="*.txt", walk_snapshot=snapshot_file))
+        files = walker.find_files([sample_directory])
+
+        assert walker.snapshot.stats["reused"] == 0
+        assert files == FileSystemWalker(FilterConfig(include_pattern="*.txt")).find_files([sample_directory])
+
+    def test_walk_snapshot_nested_gitignore_change(self, tmp_path, tmp_path_factory):
+        """Test that editing a nested .gitignore in place invalidates its subtree."""
+        snapshot_file = tmp_path_factory.mktemp("snap") / "walk.json"
+        pkg = tmp_path / "pkg"
+        (pkg / "sub").mkdir(parents=True)
+        (pkg / ".gitignore").write_text("*.log\n")
+        (pkg / "sub" / "a.log").write_text("x")
+        (pkg / "sub" / "a.py").write_text("x")
+        self._age_dirs(tmp_path)
+
+        def walk():
+            parser = ScopedGitIgnoreParser(tmp_path)
+            parser.load_from_file()
+            config = FilterConfig(walk_snapshot=snapshot_file)
+            return {f.name for f in FileSystemWalker(config, parser).find_files([tmp_path])}
+
+        assert walk() == {".gitignore", "a.py"}
+
+        (pkg / ".gitignore").write_text("*.py\n")  # in place: directory mtime unchanged
+        self._age_dirs(tmp_path)
+        assert walk() == {".gitignore", "a.log"}
+
+    def test_walk_snapshot_dirty_subtrees(self, tmp_path):
+        """Test that a dirty directory blocks reuse of itself and its subtree only."""
+        snapshot = WalkSnapshot(tmp_path / "walk.json", "fp")
+        for d in ("pkg", "pkg/sub", "pkg2", "other"):
+            snapshot._old[str(tmp_path / d)] = {"depth": d.count("/") + 1}
+        snapshot._dirty.add((tmp_path / "pkg").parts)
+
+        assert snapshot.lookup(tmp_path / "pkg", 1) is None
+        assert snapshot.lookup(tmp_path / "pkg" / "sub", 2) is None
+        assert snapshot.lookup(tmp_path / "pkg2", 1) is not None
+        assert snapshot.lookup(tmp_path / "other", 1) is not None
+
+    @pytest.fixture
+    def git_checkout(self, tmp_path):
+        """Small git checkout: tracked sources, untracked and ignored files."""
+        if shutil.which("git") is None:
+            pytest.skip("git is not installed")
+
+        (tmp_path / "src" / "pkg").mkdir(parents=True)
+        (tmp_path / "src" / "main.py").write_text("x")
+        (tmp_path / "src" / "pkg" / "mod.py").write_text("x")
+        (tmp_path / "docs").mkdir()
+        (tmp_path / "docs" / "readme.md").write_text("x")
+        (tmp_path / ".gitignore").write_text("node_modules/\n")
+        subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+        subprocess.run(["git", "-C", str(tmp_path), "add", "-A"], check=True)
+
+        (tmp_path / "src" / "new.py").write_text("x")
+        (tmp_path / "node_modules" / "lib").mkdir(parents=True)
+        (tmp_path / "node_modules" / "lib" / "index.js").write_text("x")
+        return tmp_path
+
+    @pytest.mark.parametrize("index_version", [2, 4])
+    def test_read_git_index(self, git_checkout, index_version):
+        """Test that the parsed index matches `git ls-files`."""
+        subprocess.run(
+            ["git", "-C", str(git_checkout), "update-index", "--index-version", str(index_version)],
+            check=True,
+        )
+        expected = subprocess.run(
+            ["git", "-C", str(git_checkout), "ls-files"], check=True, capture_output=True, text=True
+        ).stdout.split()
+
+        assert read_git_index(git_checkout / ".git" / "index") == expected
+
+    def test_git_index_source_lists_tracked_files(self, git_checkout):
+        """Test tracked-only discovery with filters applied on top."""
+        config = FilterConfig(file_source="git-index", include_pattern="*.py", exclude_dirs={"pkg"})
+        walker = FileSystemWalker(config)
+
+        files = walker.find_files([git_checkout])
+
+        assert files == [git_checkout / "src" / "main.py"]
+        assert walker.get_size(files[0]) == 1
+        assert walker.stats["directories_excluded"] == 1
+
+    def test_git_index_source_subdirectory_and_untracked(self, git_checkout):
+        """Test a root below the worktree and the untracked-files opt-in."""
+        parser = ScopedGitIgnoreParser(git_checkout)
+        parser.load_from_file()
+        config = FilterConfig(file_source="git-index", include_untracked=True)
+        walker = FileSystemWalker(config, parser)
+
+        src = git_checkout / "src"
+        assert walker.find_files([src]) == [src / "main.py", src / "new.py", src / "pkg" / "mod.py"]
+        ordered = list(walker.iter_files([git_checkout], ordered=True))
+        assert git_checkout / "node_modules" / "lib" / "index.js" not in ordered
+        assert ordered == walker.find_files([git_checkout])
+
+    def test_git_index_source_falls_back_outside_checkout(self, sample_directory):
+        """Test that roots outside a git checkout are walked normally."""
+        if find_git_worktree(sample_directory) is not None:
+            pytest.skip("temporary directory is inside a git checkout")
+        expected = FileSystemWalker(FilterConfig()).find_files([sample_directory])
+        walker = FileSystemWalker(FilterConfig(file_source="git-index"))
+        assert walker.find_files([sample_directory]) == expected
+
+    def test_invalid_walk_engine(self):
+        """Test walk_engine validation."""
+        with pytest.raises(ValueError, match="Unsupported walk_engine"):
+            FilterConfig(walk_engine="nope")
+
+    def test_invalid_walk_workers(self):
+        """Test walk_workers validation."""
+        with pytest.raises(ValueError, match="walk_workers must be at least 1"):
+            FilterConfig(walk_workers=0)
+
+
 # ============================================================================
 # FileContentDetector Tests
 # ============================================================================
@@ -500,6 +944,40 @@ class TestFileContentDetector:
         result = FileContentDetector.detect_encoding(test_file)
         assert result == "latin-1"  # Should fall back
 
+    def test_probe_reports_bom_and_newline(self, tmp_path):
+        """probe() returns type, encoding, BOM and newline style together."""
+        test_file = tmp_path / "test.txt"
+        test_file.write_bytes(b"\xef\xbb\xbfline1\r\nline2\r\n")
+
+        probe = FileContentDetector.probe(test_file)
+        assert probe == ContentProbe(FileType.TEXT, "utf-8", bom="utf-8", newline="\r\n")
+
+        (tmp_path / "plain.txt").write_bytes(b"no newline")
+        assert FileContentDetector.probe(tmp_path / "plain.txt").newline is None
+
+    def test_probe_opens_file_once_and_caches(self, tmp_path):
+        """Type and encoding checks share one open(); changes invalidate the cache."""
+        test_file = tmp_path / "test.py"
+        test_file.write_text("x = 1\n", encoding="utf-8")
+        FileContentDetector.clear_probe_cache()
+
+        real_open = open
+        with patch("builtins.open", side_effect=real_open) as mock_open:
+            assert FileContentDetector.detect_file_type(test_file) == FileType.TEXT
+            assert FileContentDetector.detect_encoding(test_file) == "utf-8"
+            assert FileContentDetector.detect_encoding(test_file) == "utf-8"
+        assert mock_open.call_count == 1
+
+        test_file.write_bytes(b"\xff\xfe\x00\x00")
+        st = test_file.stat()
+        os.utime(test_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        assert FileContentDetector.detect_file_type(test_file) == FileType.BINARY
+
+    def test_probe_unreadable_file(self, tmp_path):
+        """Unreadable paths give UNKNOWN/utf-8, like the separate detectors did."""
+        probe = FileContentDetector.probe(tmp_path / "missing.txt")
+        assert probe == ContentProbe(FileType.UNKNOWN, "utf-8")
+
 
 # ============================================================================
 # Utility Functions Tests
@@ -554,6 +1032,161 @@ class TestUtilityFunctions:
         assert "FILE: src/main.py" in header
 
 
+# ============================================================================
+# FileHashCache Tests
+# ============================================================================
+
+class TestFileHashCache:
+    """Test content digests cached by inode, mtime and size."""
+
+    def test_digest_reused_across_runs_and_renames(self, tmp_path):
+        """Test that unchanged files are not read again, even after a rename."""
+        a = tmp_path / "a.txt"
+        a.write_text("same\n")
+        (tmp_path / "b.txt").write_text("same\n")
+        (tmp_path / "c.txt").write_text("other\n")
+        for p in tmp_path.iterdir():
+            os.utime(p, (time.time() - 100, time.time() - 100))
+        cache_file = tmp_path / "cache" / "hashes.json"
+
+        cache = FileHashCache.load(cache_file)
+        digests = [cache.digest(tmp_path / n) for n in ("a.txt", "b.txt", "c.txt")]
+        assert digests[0] == digests[1] != digests[2]
+        assert cache.stats == {"hashed": 3, "reused": 0}
+        assert cache.save()
+
+        a.rename(tmp_path / "moved.txt")
+        cache = FileHashCache.load(cache_file)
+        with patch("codingutils.common_utils.hashlib.blake2b", side_effect=AssertionError("rehashed")):
+            assert cache.digest(tmp_path / "moved.txt") == digests[0]
+        assert cache.stats == {"hashed": 0, "reused": 1}
+
+    def test_changed_and_recent_files_are_rehashed(self, tmp_path):
+        """Test that another mtime/size misses and racy files are not stored."""
+        f = tmp_path / "f.txt"
+        f.write_text("one\n")
+        cache_file = tmp_path / "hashes.json"
+
+        cache = FileHashCache.load(cache_file)
+        first = cache.digest(f)
+        cache.save()
+        # Just written: inside the racy window, so not stored
+        assert FileHashCache.load(cache_file).digest(f) == first
+        assert "files" in cache_file.read_text() and "one" not in cache_file.read_text()
+
+        f.write_text("two\n")
+        cache = FileHashCache.load(cache_file)
+        assert cache.digest(f) != first
+        assert cache.stats["hashed"] == 1
+        assert cache.digest(tmp_path / "missing.txt") is None
+
+
+# ============================================================================
+# Archive Tests
+# ============================================================================
+
+def make_archive(path: Path, files: dict) -> Path:
+    """Write `files` (name -> bytes) as a zip or tar archive chosen by the suffix."""
+    if path.suffix == ".zip":
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            for name, data in files.items():
+                z.writestr(name, data)
+        return path
+    mode = {".gz": "w:gz", ".bz2": "w:bz2", ".xz": "w:xz"}.get(path.suffix, "w")
+    with tarfile.open(path, mode) as t:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = 1_700_000_000
+            t.addfile(info, io.BytesIO(data))
+    return path
+
+
+class TestArchiveReader:
+    """Test random access to tar/zip members without extraction."""
+
+    FILES = {
+        **{f"pkg/m{i}.txt": bytes(f"{i}:" * (1000 * i + 1), "ascii") for i in range(40)},
+        "top.txt": b"top\n",
+        "../evil.txt": b"outside\n",
+        "/abs.txt": b"absolute\n",
+    }
+
+    @pytest.mark.parametrize("name", ["a.tar", "a.tar.gz", "a.tar.bz2", "a.tar.xz", "a.zip"])
+    def test_members_read_in_any_order(self, tmp_path, name, monkeypatch):
+        """Test that members read back exactly, shuffled and after seeks."""
+        monkeypatch.setattr(ArchiveReader, "CHECKPOINT_BYTES", 256)
+        monkeypatch.setattr(ArchiveReader, "MAX_CHECKPOINTS", 4)
+        archive = make_archive(tmp_path / name, self.FILES)
+        assert ArchiveReader.is_archive(archive)
+
+        with ArchiveReader(archive) as reader:
+            assert ("evil.txt",) not in reader.members and ("..", "evil.txt") not in reader.members
+            assert reader.members[("abs.txt",)].size == len(b"absolute\n")
+            parts = sorted(reader.members, key=lambda p: p[::-1])
+            for p in parts:
+                data = self.FILES.get("/".join(p), self.FILES.get("/" + "/".join(p)))
+                member = reader.members[p]
+                assert reader.read_bytes(member) == data
+                with reader.open(member) as f:
+                    f.seek(member.size // 2)
+                    assert f.read(7) == data[member.size // 2 : member.size // 2 + 7]
+                    f.seek(1)
+                    assert f.read() == data[1:]
+                st = reader.stat(member)
+                assert st.st_size == len(data) and st.st_ino == 0
+            if name.endswith(".gz"):
+                # Spaced by archive size / MAX_CHECKPOINTS, not one per CHECKPOINT_BYTES
+                assert 1 < len(reader._checkpoints) <= 5
+
+    @pytest.mark.parametrize("name", ["a.tar.bz2", "a.tar.xz"])
+    def test_members_behind_idle_streams_are_decompressed_again(self, tmp_path, name, monkeypatch):
+        """Test that bz2/xz members before every idle stream restart from the archive start."""
+        monkeypatch.setattr(ArchiveReader, "MAX_IDLE_STREAMS", 1)
+        archive = make_archive(tmp_path / name, self.FILES)
+        with ArchiveReader(archive) as reader:
+            for p in (("pkg", "m39.txt"), ("pkg", "m1.txt"), ("pkg", "m20.txt"), ("pkg", "m2.txt")):
+                assert reader.read_bytes(reader.members[p]) == self.FILES["/".join(p)]
+            assert len(reader._idle) == 1 and not reader._checkpoints
+
+    @pytest.mark.parametrize("name", ["src.tar.gz", "src.zip"])
+    def test_walker_filters_archive_members(self, tmp_path, name):
+        """Test that filters, depth and in-archive .gitignore files apply to members."""
+        files = {
+            ".gitignore": b"*.log\n",
+            "a.py": b"a\n",
+            "debug.log": b"log\n",
+            "pkg/.gitignore": b"gen_*.py\n",
+            "pkg/b.py": b"b\n",
+            "pkg/gen_c.py": b"c\n",
+            "pkg/deep/d.py": b"d\n",
+            "node_modules/x.py": b"x\n",
+        }
+        archive = make_archive(tmp_path / name, files)
+        config = FilterConfig(
+            directories=[str(archive)], recursive=True, include_pattern="*.py", exclude_dirs={"node_modules"}
+        )
+        parser = ScopedGitIgnoreParser(root_dir=archive)
+        walker = FileSystemWalker(config, gitignore_parser=parser, archives=True)
+
+        found = walker.find_files([archive])
+        root = archive.resolve()
+        assert found == [root / "a.py", root / "pkg" / "b.py", root / "pkg" / "deep" / "d.py"]
+        with walker.open_file(root / "pkg" / "b.py") as f:
+            assert f.read() == b"b\n"
+        assert walker.get_stat(root / "a.py").st_size == 2
+        assert walker.stats["directories_excluded"] == 1
+
+        config.max_depth = 2
+        assert walker.find_files([archive]) == [root / "a.py", root / "pkg" / "b.py"]
+        assert walker.find_files([archive], recursive=False) == [root / "a.py"]
+        walker.close()
+        assert not walker.is_archive_member(root / "a.py")
+
+        # Without archives=True an archive root stays a single (binary) file
+        assert FileSystemWalker(FilterConfig(directories=[str(archive)])).find_files([archive]) == [root]
+
+
 # ============================================================================
 # Safe Operations Tests
 # ============================================================================
@@ -1,7 +1,20 @@
 import builtins
+import bz2
+import gzip
+import io
+import json
+import lzma
+import mmap
+import os
+import tarfile
+import threading
+import zipfile
 from pathlib import Path
 
+import pytest
+
 import codingutils.merger as mg
+from codingutils.common_utils import ContentProbe
 
 
 # -----------------------------------------------------------------------------
@@ -106,11 +119,14 @@ def test_parse_arguments_and_create_config(tmp_path):
         "--remove-empty-lines",
         "--deduplicate",
         "--sort-files",
+        "--read-workers", "4",
+        "--read-ahead", "1MB",
         "--max-file-size", "10KB",
         "--max-total-size", "20KB",
         "--keep-backups",
         "--backup-dir", str(tmp_path / ".baks"),
         "--overwrite-backups",
+        "--manifest", str(tmp_path / "out.manifest.json"),
         "--no-binary-placeholders",
         "--no-binary-hash",
         "--log-file", str(tmp_path / "run.log"),
@@ -131,6 +147,8 @@ def test_parse_arguments_and_create_config(tmp_path):
     assert cfg.remove_empty_lines is True
     assert cfg.deduplicate_lines is True
     assert cfg.sort_files is True
+    assert cfg.read_workers == 4
+    assert cfg.read_ahead_bytes == 1024 * 1024
     assert cfg.max_file_size == 10 * 1024
     assert cfg.max_total_size == 20 * 1024
 
@@ -139,6 +157,10 @@ def test_parse_arguments_and_create_config(tmp_path):
     assert cfg.backup_dir.name == ".baks"
     assert cfg.overwrite_backups is True
 
+    # manifest implies incremental
+    assert cfg.incremental is True
+    assert cfg.manifest_path() == tmp_path / "out.manifest.json"
+
     assert cfg.include_binary_placeholders is False
     assert cfg.hash_binary_files is False
 
@@ -200,6 +222,87 @@ def test_preview_report_mentions_skipped(tmp_path):
     assert "max_total_size" in rep
 
 
+def test_select_files_priority_packing(tmp_path):
+    big = write_text(tmp_path / "a_big.txt", "x" * 250)
+    small = [write_text(tmp_path / f"b{i}.txt", "x" * 100) for i in range(2)]
+    core = write_text(tmp_path / "src" / "core.py", "x" * 150)
+    files = [big, *small, core]
+
+    order = mg.SmartFileMerger(make_config(tmp_path, max_total_size=300))
+    order._resolve_roots()
+    assert order.select_files(files)[0] == [big]
+
+    # Equal priorities: as many files as fit
+    packed = mg.SmartFileMerger(make_config(tmp_path, max_total_size=300, budget_mode="priority"))
+    packed._resolve_roots()
+    selected, skipped = packed.select_files(files)
+    assert selected == small
+    assert [f for f, _reason in skipped] == [big, core]
+    assert packed.stats["total_selected_size"] == 200
+
+    weighted = mg.SmartFileMerger(make_config(tmp_path, max_total_size=300, budget_mode="priority",
+                                              priority_path_weights={"src/": 3.0},
+                                              priority_pattern_weights={"b1.*": 0.5}))
+    weighted._resolve_roots()
+    assert weighted.select_files(files)[0] == [small[1], core]
+
+
+def test_priority_packing_prefers_valuable_single_file(tmp_path):
+    old = write_text(tmp_path / "old.txt", "x" * 10)
+    new = write_text(tmp_path / "new.txt", "x" * 300)
+    os.utime(old, (1_000_000, 1_000_000))
+
+    cfg = make_config(tmp_path, max_total_size=300, budget_mode="priority", priority_recency_weight=4.0)
+    merger = mg.SmartFileMerger(cfg)
+    merger._resolve_roots()
+    selected, skipped = merger.select_files([old, new])
+
+    # Greedy by priority per byte would take only old.txt (1.0 < 5.0)
+    assert selected == [new]
+    assert skipped == [(old, "max_total_size")]
+
+    rep = merger.preview_report([old, new])
+    assert "budget_mode: priority" in rep
+    assert "old.txt [max_total_size]: priority 1.00 for 10.00 B, rank 1/2; budget went to new.txt" in rep
+
+
+def test_priority_packing_fills_budget_left_by_single_file(tmp_path):
+    big = write_text(tmp_path / "big.py", "x" * 9700)
+    d = write_text(tmp_path / "d.py", "x" * 200)
+    tiny = write_text(tmp_path / "tiny.py", "x" * 100)
+    init = write_text(tmp_path / "__init__.py", "")
+
+    cfg = make_config(
+        tmp_path,
+        max_total_size=9800,
+        budget_mode="priority",
+        priority_pattern_weights={"big.py": 100, "d.py": 2},
+    )
+    merger = mg.SmartFileMerger(cfg)
+    merger._resolve_roots()
+    selected, skipped = merger.select_files([big, d, tiny, init])
+
+    # Greedy alone takes __init__.py, d.py and tiny.py (priority 4); big.py beats that,
+    # and the 100 B it leaves still hold tiny.py and the empty file
+    assert selected == [big, tiny, init]
+    assert skipped == [(d, "max_total_size")]
+    assert merger._skip_details[d].endswith("budget went to big.py (priority 101.00), the rest to files of higher priority per byte")
+
+
+def test_priority_budget_config(tmp_path):
+    with pytest.raises(ValueError):
+        make_config(tmp_path, budget_mode="best")
+
+    args = mg.parse_arguments(["--budget-mode", "priority", "--priority-path", "src/=2",
+                               "--priority-pattern", "*.md=-1", "--priority-recency", "0.5"])
+    cfg = mg.create_config_from_args(args)
+    assert cfg.priority_path_weights == {"src": 2.0}
+    assert cfg.priority_pattern_weights == {"*.md": -1.0}
+    assert cfg.priority_recency_weight == 0.5
+    with pytest.raises(ValueError):
+        mg.parse_weight_string("nokey")
+
+
 # =============================================================================
 # merge: transforms + headers
 # =============================================================================
@@ -272,6 +375,873 @@ def test_compact_file_headers_omits_relpath_and_modified(monkeypatch, tmp_path):
     assert "Modified:" not in content
 
 
+def test_stream_files_output_matches_list_mode(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+
+    src = tmp_path / "src"
+    write_text(src / "b.txt", "B\n")
+    write_text(src / "a.txt", "A\n\nA\n")
+    write_text(src / "sub" / "c.txt", "C\n")
+    write_text(src / "big.txt", "x" * 100)
+
+    outputs = []
+    for stream in (False, True):
+        out = tmp_path / f"merged_{stream}.txt"
+        cfg = make_config(
+            src,
+            output_file=out,
+            include_metadata=False,
+            include_headers=False,
+            remove_empty_lines=True,
+            max_file_size=50,
+            stream_files=stream,
+        )
+        merger = mg.SmartFileMerger(cfg)
+        assert merger.can_stream() is stream
+        assert merger.merge() is True
+        outputs.append((out.read_text(encoding="utf-8"), merger.stats["files_selected"], merger.stats["files_found"]))
+
+    assert outputs[0] == outputs[1]
+    assert outputs[1][1:] == (3, 4)
+
+
+def per_line_reference(path: Path, cfg: mg.MergerConfig, encoding: str = "utf-8") -> str:
+    """The original line-by-line transform of _iter_text_lines()."""
+    seen = set() if cfg.deduplicate_lines else None
+    line_no = 0
+    out = []
+    with open(path, "r", encoding=encoding, newline="") as f:
+        for raw in f:
+            line = raw.rstrip("\n")
+            if cfg.remove_empty_lines and not line.strip():
+                continue
+            if seen is not None:
+                if line in seen:
+                    continue
+                seen.add(line)
+            line_no += 1
+            out.append((cfg.line_number_format.format(line_no) if cfg.add_line_numbers else "") + line + "\n")
+    return "".join(out)
+
+
+@pytest.mark.parametrize("chunk", [3, 7, 64, 4 * 1024 * 1024])
+def test_block_transform_matches_per_line_path(monkeypatch, tmp_path, chunk):
+    monkeypatch.setattr(mg, "_TRANSFORM_CHUNK", chunk)
+    monkeypatch.setattr(mg, "_PREFIX_CACHE_SIZE", 5)
+    texts = {
+        "mixed.txt": "a\r\nb\rc\n\n  \n\t\r\na\r\nb\r\né ü ж\nlast",
+        "dups.txt": "x\nx\ny\n\n\nx\ny\nz\nz",
+        "cr_end.txt": "one\rtwo\r",
+        "blank.txt": "\n\n \n",
+        "plain.txt": "".join(f"line {i}\n" for i in range(40)),
+        "empty.txt": "",
+    }
+    for name, text in texts.items():
+        write_bytes(tmp_path / name, text.encode("utf-8"))
+
+    for flags in range(8):
+        cfg = make_config(tmp_path, add_line_numbers=bool(flags & 1), remove_empty_lines=bool(flags & 2),
+                          deduplicate_lines=bool(flags & 4), line_number_format="{:>2}| ")
+        merger = mg.SmartFileMerger(cfg)
+        for name in texts:
+            blocks = list(merger._iter_text_blocks(tmp_path / name, encoding="utf-8"))
+            assert all(blocks)
+            assert "".join(blocks) == per_line_reference(tmp_path / name, cfg), (name, flags)
+
+
+@pytest.mark.parametrize("digest", ["digest64", "digest128"])
+@pytest.mark.parametrize("collisions", ["trust", "length"])
+def test_digest_line_dedup_matches_exact(monkeypatch, tmp_path, digest, collisions):
+    monkeypatch.setattr(mg, "_TRANSFORM_CHUNK", 64)
+    # Enough distinct lines to grow the table several times
+    text = "".join(f"row {i % 700}\n" for i in range(3000)) + "é\n\n é\n"
+    write_text(tmp_path / "big.txt", text)
+
+    for remove_empty in (False, True):
+        cfg = make_config(tmp_path, remove_empty_lines=remove_empty, dedup_lines_digest=digest,
+                          dedup_lines_collisions=collisions)
+        assert cfg.deduplicate_lines is True
+        blocks = mg.SmartFileMerger(cfg)._iter_text_blocks(tmp_path / "big.txt", encoding="utf-8")
+        assert "".join(blocks) == per_line_reference(tmp_path / "big.txt", cfg)
+
+
+def test_line_digest_set_collision_policy(monkeypatch):
+    # Every line gets the same 64-bit digest
+    monkeypatch.setattr(mg, "hash", lambda line: 0, raising=False)
+
+    trusting = mg.LineDigestSet(64)
+    assert trusting.filter_new(["a", "bb", "a", "c"]) == ["a"]
+
+    by_length = mg.LineDigestSet(64, collisions="length", capacity=2)
+    assert by_length.filter_new(["a", "bb", "a", "c", "ccc", "bb"]) == ["a", "bb", "ccc"]
+    assert len(by_length) == 3
+    assert by_length.nbytes == 8 * (8 + 4)
+
+    # 128-bit digests do not use hash()
+    assert mg.LineDigestSet(128).filter_new(["a", "bb", "a", "c"]) == ["a", "bb", "c"]
+    with pytest.raises(ValueError):
+        mg.LineDigestSet(32)
+
+
+@pytest.mark.parametrize("digest", ["exact", "digest64"])
+@pytest.mark.parametrize("workers", [1, 4])
+def test_dedup_lines_global_scope(monkeypatch, tmp_path, digest, workers):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    write_text(src / "a.txt", "import os\nimport sys\nx = 1\n")
+    write_text(src / "b.txt", "import sys\nimport os\ny = 2\ny = 2\n")
+    write_text(src / "c.txt", "import os\n")
+
+    out = tmp_path / "merged.txt"
+    cfg = make_config(src, output_file=out, sort_files=True, include_metadata=False, include_headers=False,
+                      add_line_numbers=True, dedup_lines_scope="global", dedup_lines_digest=digest,
+                      read_workers=workers)
+    assert cfg.deduplicate_lines is True
+    assert mg.SmartFileMerger(cfg).merge() is True
+    assert out.read_text(encoding="utf-8") == "   1: import os\n   2: import sys\n   3: x = 1\n\n   1: y = 2\n\n"
+
+    # Sharded: later shards drop lines seen in earlier ones
+    cfg = make_config(src, output_file=out, sort_files=True, include_metadata=False, include_headers=False,
+                      dedup_lines_scope="global", read_workers=workers, shard_max_files=1)
+    assert mg.SmartFileMerger(cfg).merge() is True
+    assert cfg.shard_path(2).read_text(encoding="utf-8") == "y = 2\n\n"
+    assert cfg.shard_path(3).read_text(encoding="utf-8") == ""
+
+
+def test_dedup_lines_config_validation(tmp_path):
+    with pytest.raises(ValueError):
+        make_config(tmp_path, dedup_lines_digest="crc32")
+    with pytest.raises(ValueError):
+        make_config(tmp_path, dedup_lines_collisions="verify")
+    with pytest.raises(ValueError):
+        make_config(tmp_path, dedup_lines_scope="repo")
+    with pytest.raises(ValueError):
+        make_config(tmp_path, dedup_lines_scope="global", incremental=True)
+
+
+@pytest.mark.parametrize("suffix", [".tar.gz", ".tar.xz", ".zip"])
+@pytest.mark.parametrize("options", [{}, {"read_workers": 3, "add_line_numbers": True},
+                                     {"shard_max_bytes": 300, "shard_split_files": True}])
+def test_archive_input_merges_like_its_directory(monkeypatch, tmp_path, suffix, options):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    write_text(src / ".gitignore", "*.log\n")
+    write_text(src / "a.py", "import os\n\nprint(os.name)\n")
+    write_bytes(src / "pkg" / "crlf.txt", b"x\r\ny\rz")
+    write_text(src / "pkg" / "big.txt", "".join(f"row {i}\n" for i in range(200)))
+    write_text(src / "pkg" / "debug.log", "ignored\n")
+    write_bytes(src / "pkg" / "latin.txt", b"caf\xe9\n")
+    write_bytes(src / "logo.bin", b"\x00\x01" * 50)
+
+    archive = tmp_path / f"src{suffix}"
+    if suffix == ".zip":
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as z:
+            for p in sorted(src.rglob("*")):
+                z.write(p, p.relative_to(src).as_posix())
+    else:
+        with tarfile.open(archive, "w:" + suffix.rsplit(".", 1)[1]) as t:
+            t.add(src, arcname=".")
+
+    outputs = []
+    for kind, root in (("dir", src), ("archive", archive)):
+        cfg = make_config(root, output_file=tmp_path / kind / "out.txt", sort_files=True, include_metadata=False,
+                          compact_file_headers=True, use_gitignore=True, **options)
+        assert mg.SmartFileMerger(cfg).merge() is True
+        outputs.append(b"".join(p.read_bytes() for p in sorted((tmp_path / kind).glob("out*.txt"))))
+    assert outputs[0] == outputs[1]
+    assert b"ignored" not in outputs[1] and b"row 199" in outputs[1]
+
+
+def test_read_workers_output_matches_sequential(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+
+    src = tmp_path / "src"
+    for i in range(30):
+        write_text(src / f"d{i % 4}" / f"f{i:02}.txt", "".join(f"line {j}\n" for j in range(i * 7)))
+    write_bytes(src / "latin.txt", b"caf\xe9\n")
+    write_bytes(src / "blob.bin", b"\x00\x01\x02")
+    write_text(src / "broken.txt", "never read\n")
+
+    real_header = mg.SmartFileMerger._file_header
+
+    def flaky_header(self, file_path, index, total):
+        if file_path.name == "broken.txt":
+            raise RuntimeError("boom")
+        return real_header(self, file_path, index, total)
+
+    monkeypatch.setattr(mg.SmartFileMerger, "_file_header", flaky_header)
+
+    outputs = []
+    for workers in (1, 4):
+        out = tmp_path / f"merged_{workers}.txt"
+        cfg = make_config(
+            src,
+            output_file=out,
+            include_metadata=False,
+            add_line_numbers=True,
+            sort_files=True,
+            read_workers=workers,
+            read_ahead_bytes=200,
+        )
+        merger = mg.SmartFileMerger(cfg)
+        assert merger.merge() is True
+        stats = {k: merger.stats[k] for k in ("files_processed", "files_failed", "files_skipped_binary")}
+        outputs.append((out.read_bytes(), stats))
+
+    assert outputs[0] == outputs[1]
+    assert b"[ERROR processing broken.txt: boom]" in outputs[1][0]
+    assert outputs[1][1] == {"files_processed": 32, "files_failed": 1, "files_skipped_binary": 1}
+
+
+def make_passthrough_tree(src: Path) -> None:
+    write_text(src / "lf.txt", "a\nb\n")
+    write_bytes(src / "crlf.txt", b"a\r\nb\r\n")
+    write_bytes(src / "lone_cr.txt", b"a\rb\n")
+    write_text(src / "no_eol.txt", "tail")
+    write_text(src / "empty.txt", "")
+    write_bytes(src / "utf8.txt", "привет\n".encode("utf-8"))
+    write_bytes(src / "bom.txt", b"\xef\xbb\xbfbom\n")
+    write_bytes(src / "latin.txt", b"caf\xe9\n")
+    write_bytes(src / "late_bad.txt", b"x" * 9000 + b"\xff\n")
+    write_bytes(src / "blob.bin", b"\x00\x01")
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_zero_copy_output_matches_line_path(monkeypatch, tmp_path, workers):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    make_passthrough_tree(src)
+
+    copied = []
+    real_copy = mg._copy_file_bytes
+    monkeypatch.setattr(mg, "_copy_file_bytes", lambda s, d, data: (copied.append(len(data)), real_copy(s, d, data)))
+
+    outputs = []
+    for zero_copy in (False, True):
+        out = tmp_path / f"merged_{zero_copy}.txt"
+        cfg = make_config(src, output_file=out, include_metadata=False, sort_files=True,
+                          zero_copy=zero_copy, read_workers=workers)
+        assert mg.SmartFileMerger(cfg).merge() is True
+        outputs.append(out.read_bytes())
+
+    assert outputs[0] == outputs[1]
+    # lf, crlf, no_eol, utf8, bom go through the kernel copy, also with reader threads
+    assert sorted(copied) == [4, 4, 6, 7, 13]
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_zero_copy_decodes_in_blocks(monkeypatch, tmp_path, compression):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    monkeypatch.setattr(mg, "_TRANSFORM_CHUNK", 7)
+    src = tmp_path / "src"
+    make_passthrough_tree(src)
+    write_text(src / "wide.txt", "привет, мир\n" * 50)
+
+    blocks = []
+    real_iter = mg._iter_decoded
+    monkeypatch.setattr(mg, "_iter_decoded", lambda data, enc: (blocks.append(t) or t for t in real_iter(data, enc)))
+
+    outputs = []
+    for zero_copy in (False, True):
+        sink = io.BytesIO()
+        cfg = make_config(
+            src, output_stream=sink, include_metadata=False, sort_files=True, zero_copy=zero_copy, compression=compression
+        )
+        assert mg.SmartFileMerger(cfg).merge() is True
+        data = sink.getvalue()
+        outputs.append(gzip.decompress(data) if compression == "gzip" else data)
+
+    assert outputs[0] == outputs[1]
+    assert blocks and max(len(b) for b in blocks) <= 7
+
+
+def test_read_workers_keep_rendered_bytes_within_budget(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    write_text(src / "big.txt", "".join(f"row {i}\n" for i in range(2000)))
+    for i in range(20):
+        write_text(src / f"small{i:02d}.txt", f"small {i}\n" * 10)
+    budget = 2000
+    assert (src / "big.txt").stat().st_size > budget
+
+    buffered = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+    real_render = mg.SmartFileMerger._render_file_section
+    real_write = mg.SmartFileMerger._write_file_section
+
+    def render(self, file_path, index, total):
+        section = real_render(self, file_path, index, total)
+        with lock:
+            buffered["now"] += len(section.body)
+            buffered["peak"] = max(buffered["peak"], buffered["now"])
+        return section
+
+    def write(self, out, file_path, index, total, rendered=None, **kw):
+        if rendered is not None:
+            with lock:
+                buffered["now"] -= len(rendered.body)
+        return real_write(self, out, file_path, index, total, rendered, **kw)
+
+    monkeypatch.setattr(mg.SmartFileMerger, "_render_file_section", render)
+    monkeypatch.setattr(mg.SmartFileMerger, "_write_file_section", write)
+
+    outputs = []
+    for workers in (1, 4):
+        out = tmp_path / f"merged_{workers}.txt"
+        cfg = make_config(src, output_file=out, include_metadata=False, sort_files=True, remove_empty_lines=True,
+                          read_workers=workers, read_ahead_bytes=budget)
+        assert mg.SmartFileMerger(cfg).merge() is True
+        outputs.append(out.read_bytes())
+
+    assert outputs[0] == outputs[1]
+    # The big file is streamed by the writer; rendered sections never exceed the budget
+    assert 0 < buffered["peak"] <= budget
+
+
+def test_copy_file_bytes_falls_back_to_mmap(monkeypatch, tmp_path):
+    src = write_bytes(tmp_path / "src.txt", b"0123456789" * 1000)
+    dst = tmp_path / "dst.txt"
+
+    def unsupported(*args, **kwargs):
+        raise OSError("not supported")
+
+    monkeypatch.setattr(os, "copy_file_range", unsupported, raising=False)
+    monkeypatch.setattr(os, "sendfile", unsupported, raising=False)
+
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        d.write(b">")
+        d.flush()
+        with mmap.mmap(s.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            mg._copy_file_bytes(s.fileno(), d.fileno(), data)
+
+    assert dst.read_bytes() == b">" + src.read_bytes()
+
+
+def test_merge_stats_each_file_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    write_text(src / "a.txt", "a\n")
+    write_text(src / "sub" / "b.txt", "b\n")
+    write_bytes(src / "c.bin", b"\x00\x01")
+
+    calls = []
+    real_stat = Path.stat
+
+    def counting_stat(self, *args, **kwargs):
+        if src in self.parents:
+            calls.append(self.name)
+        return real_stat(self, *args, **kwargs)
+
+    monkeypatch.setattr(Path, "stat", counting_stat)
+
+    cfg = make_config(src, output_file=tmp_path / "merged.txt", max_total_size=10_000)
+    merger = mg.SmartFileMerger(cfg)
+    assert merger.merge() is True
+    merger.preview_report(merger.find_files())
+
+    # Everything comes from the walk's directory entries
+    assert calls == []
+
+
+def age_files(root: Path, seconds: float = 100.0) -> None:
+    """Move mtimes out of the racy window of an incremental merge."""
+    stamp = os.stat(root).st_mtime - seconds
+    for p in root.rglob("*"):
+        if p.is_file():
+            os.utime(p, (stamp, stamp))
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_incremental_merge_matches_full_merge(monkeypatch, tmp_path, workers):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    make_passthrough_tree(src)
+    age_files(src)
+
+    rendered = []
+    real_body = mg.SmartFileMerger._write_file_body
+
+    def counting_body(self, out, file_path, piece=None):
+        rendered.append(file_path.name)
+        return real_body(self, out, file_path, piece)
+
+    monkeypatch.setattr(mg.SmartFileMerger, "_write_file_body", counting_body)
+
+    out = tmp_path / "merged.txt"
+    cfg = make_config(src, output_file=out, include_metadata=False, sort_files=True,
+                      incremental=True, read_workers=workers)
+    assert mg.SmartFileMerger(cfg).merge() is True
+    assert (tmp_path / "merged.txt.manifest.json").exists()
+    assert len(rendered) == 10
+
+    write_text(src / "lf.txt", "changed\n")
+    write_text(src / "added.txt", "new\n")
+    rendered.clear()
+    merger = mg.SmartFileMerger(cfg)
+    assert merger.merge() is True
+    assert sorted(rendered) == ["added.txt", "lf.txt"]
+
+    full = tmp_path / "full.txt"
+    full_merger = mg.SmartFileMerger(make_config(src, output_file=full, include_metadata=False,
+                                                 sort_files=True, read_workers=workers))
+    assert full_merger.merge() is True
+    assert out.read_bytes() == full.read_bytes()
+    for key in ("files_processed", "files_skipped_binary", "files_failed"):
+        assert merger.stats[key] == full_merger.stats[key]
+
+
+def test_incremental_merge_rereads_corrupted_sections(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    write_text(src / "a.txt", "alpha\n")
+    write_text(src / "b.txt", "beta\n")
+    age_files(src)
+
+    out = tmp_path / "merged.txt"
+    cfg = make_config(src, output_file=out, include_metadata=False, incremental=True)
+    assert mg.SmartFileMerger(cfg).merge() is True
+    expected = out.read_bytes()
+
+    # Same size and mtime, different bytes: only the CRC can tell
+    st = out.stat()
+    out.write_bytes(expected.replace(b"alpha", b"ALPHA"))
+    os.utime(out, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    assert mg.SmartFileMerger(cfg).merge() is True
+    assert out.read_bytes() == expected
+
+
+def read_shards(out: Path) -> list:
+    return [p.read_text(encoding="utf-8") for p in sorted(out.parent.glob(out.stem + ".part*" + out.suffix))]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_sharded_output_concatenates_to_full_merge(monkeypatch, tmp_path, workers):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    for i in range(7):
+        write_text(src / f"f{i}.txt", "".join(f"line {j}\n" for j in range(i * 3)))
+
+    full = tmp_path / "full.txt"
+    assert mg.SmartFileMerger(make_config(src, output_file=full, include_metadata=False, sort_files=True)).merge()
+
+    out = tmp_path / "out" / "merged.txt"
+    cfg = make_config(src, output_file=out, include_metadata=False, sort_files=True,
+                      shard_max_files=3, read_workers=workers)
+    merger = mg.SmartFileMerger(cfg)
+    assert merger.merge() is True
+
+    shards = read_shards(out)
+    assert len(shards) == 3
+    assert "".join(shards) == full.read_text(encoding="utf-8")
+    assert merger.stats["files_processed"] == 7
+
+    index = out.read_text(encoding="utf-8")
+    assert "Shards: 3" in index
+    assert "merged.part003.txt (1 files" in index
+
+    # Shards of the previous run are not inputs; extra old shards are removed
+    cfg = make_config(src, output_file=out, include_metadata=True, sort_files=True, shard_max_files=4)
+    assert mg.SmartFileMerger(cfg).find_files() == sorted(src.iterdir())
+    assert mg.SmartFileMerger(cfg).merge() is True
+    shards = read_shards(out)
+    assert len(shards) == 2
+    assert all("Shard: " in text and "MERGE COMPLETE" in text for text in shards)
+
+
+def test_sharded_output_splits_large_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    write_text(src / "a.txt", "short\n")
+    write_text(src / "b.txt", "".join(f"row {j}\n" for j in range(25)))
+    write_bytes(src / "c.bin", b"\x00" * 500)
+
+    full = tmp_path / "full.txt"
+    base = dict(include_metadata=False, include_headers=False, add_line_numbers=True, sort_files=True)
+    assert mg.SmartFileMerger(make_config(src, output_file=full, **base)).merge()
+
+    out = tmp_path / "merged.txt"
+    merger = mg.SmartFileMerger(make_config(src, output_file=out, shard_max_lines=10, shard_split_files=True, **base))
+    assert merger.merge() is True
+
+    shards = read_shards(out)
+    # c.bin + a.txt, then b.txt cut into 10 + 10 + 5 rows with continuing line numbers
+    assert len(shards) == 4
+    assert shards[2].startswith("  11: row 10\n")
+    # Pieces are separate sections, each followed by a blank line
+    assert "".join(shards).replace("\n\n", "\n") == full.read_text(encoding="utf-8").replace("\n\n", "\n")
+    assert merger.stats["files_processed"] == 3
+
+    with_headers = mg.SmartFileMerger(make_config(src, output_file=out, include_metadata=False, sort_files=True,
+                                                  shard_max_lines=10, shard_split_files=True))
+    assert with_headers.merge() is True
+    assert "FILE 3/3: b.txt (part 2/3)" in read_shards(out)[2]
+
+
+def test_shard_config_validation(tmp_path):
+    with pytest.raises(ValueError):
+        make_config(tmp_path, shard_max_files=0)
+    with pytest.raises(ValueError):
+        make_config(tmp_path, shard_max_files=2, shard_split_files=True)
+    with pytest.raises(ValueError):
+        make_config(tmp_path, shard_max_bytes=100, incremental=True)
+
+    cfg = mg.create_config_from_args(mg.parse_arguments(["--shard-size", "1KB", "--shard-lines", "5", "--split-files"]))
+    assert (cfg.shard_max_bytes, cfg.shard_max_files, cfg.shard_max_lines) == (1024, None, 5)
+    assert cfg.shard_split_files is True
+    assert cfg.shard_path(2).name == "merged_output.part002.txt"
+
+
+@pytest.mark.parametrize("suffix, opener", [(".gz", gzip.open), (".bz2", bz2.open), (".xz", lzma.open)])
+def test_compressed_output_matches_plain(monkeypatch, tmp_path, suffix, opener):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    make_passthrough_tree(src)
+
+    plain = tmp_path / "merged.txt"
+    assert mg.SmartFileMerger(make_config(src, output_file=plain, include_metadata=False, sort_files=True)).merge()
+
+    out = tmp_path / f"merged.txt{suffix}"
+    cfg = make_config(src, output_file=out, include_metadata=False, sort_files=True, read_workers=2)
+    assert mg.SmartFileMerger(cfg).merge() is True
+    with opener(out, "rb") as f:
+        assert f.read() == plain.read_bytes()
+    assert not out.with_name(out.name + ".tmp").exists()
+
+
+def test_compressed_output_failure_keeps_previous_output(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    write_text(tmp_path / "src" / "a.txt", "a\n")
+    out = tmp_path / "merged.out"
+    out.write_bytes(b"previous")
+
+    class FailingCompressor:
+        def write(self, data):
+            raise OSError("disk full")
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(mg._CompressedWriter, "_open_compressor", staticmethod(lambda *a: FailingCompressor()))
+    cfg = make_config(tmp_path / "src", output_file=out, compression="gzip", keep_backups=True)
+    assert cfg.shard_path(1).name == "merged.part001.out"
+    assert mg.SmartFileMerger(cfg).merge() is False
+    assert out.read_bytes() == b"previous"
+    assert not out.with_name(out.name + ".tmp").exists()
+
+
+def test_compression_config(tmp_path):
+    cfg = make_config(tmp_path, output_file=tmp_path / "bundle.txt.xz")
+    assert cfg.output_compression() == "xz"
+    assert cfg.shard_path(3).name == "bundle.part003.txt.xz"
+    assert make_config(tmp_path, output_file=tmp_path / "b.gz", compression="none").output_compression() is None
+    with pytest.raises(ValueError):
+        make_config(tmp_path, compression="zip")
+    with pytest.raises(ValueError):
+        make_config(tmp_path, output_file=tmp_path / "b.gz", incremental=True)
+
+    args = mg.parse_arguments(["-o", str(tmp_path / "x.txt"), "--compress", "bz2", "--compress-level", "3"])
+    cfg = mg.create_config_from_args(args)
+    assert (cfg.output_compression(), cfg.compression_level) == ("bz2", 3)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_stream_output_matches_file(monkeypatch, tmp_path, workers, compression):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    make_passthrough_tree(src)
+
+    plain = tmp_path / "merged.txt"
+    assert mg.SmartFileMerger(make_config(src, output_file=plain, include_metadata=False, sort_files=True)).merge()
+
+    sink = io.BytesIO()
+    cfg = make_config(
+        src, output_stream=sink, include_metadata=False, sort_files=True, read_workers=workers, compression=compression
+    )
+    merger = mg.SmartFileMerger(cfg)
+    assert merger.merge() is True
+    data = sink.getvalue()
+    assert (gzip.decompress(data) if compression == "gzip" else data) == plain.read_bytes()
+    assert merger.stats["output_size"] == len(data)
+    assert not sink.closed
+    assert not (src / "merged.txt").exists() and not (src / "merged.txt.tmp").exists()
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_stream_output_stops_on_broken_pipe(monkeypatch, tmp_path, workers):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    monkeypatch.setattr(mg, "_STREAM_CHUNK", 4096)
+    src = tmp_path / "src"
+    for i in range(40):
+        write_text(src / f"f{i:02d}.txt", f"line {i}\n" * 500)
+
+    class ClosingPipe(io.RawIOBase):
+        def __init__(self):
+            super().__init__()
+            self.received = 0
+
+        def writable(self):
+            return True
+
+        def write(self, b):
+            if self.received >= 10000:
+                raise BrokenPipeError(32, "Broken pipe")
+            self.received += len(b)
+            return len(b)
+
+    pipe = ClosingPipe()
+    merger = mg.SmartFileMerger(make_config(src, output_stream=pipe, sort_files=True, read_workers=workers))
+    assert merger.merge() is False
+    assert merger.stats["output_closed"] is True
+    assert int(merger.stats["files_processed"]) < 40
+    assert not pipe.closed
+
+
+def test_stream_output_config_and_main(monkeypatch, tmp_path, capsysbinary):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    cfg = make_config(tmp_path, output_file=Path("-"))
+    assert cfg.writes_to_stream() and cfg.output_compression() is None
+    assert cfg.output_label() == "<stdout>"
+    for overrides in ({"toc": True}, {"incremental": True}, {"shard_max_files": 2}, {"keep_backups": True}):
+        with pytest.raises(ValueError):
+            make_config(tmp_path, output_file=Path("-"), **overrides)
+
+    write_text(tmp_path / "src" / "a.py", "print(1)\n")
+    rc = mg.main([str(tmp_path / "src"), "-p", "*.py", "-o", "-", "--no-metadata", "--no-headers"])
+    assert rc == 0
+    captured = capsysbinary.readouterr()
+    assert captured.out == b"print(1)\n\n"
+    assert not (tmp_path / "src" / "-").exists()
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_targets_match_separate_merges_from_one_walk(monkeypatch, tmp_path, workers):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    write_text(src / "a.py", "import os\n")
+    write_text(src / "pkg" / "b.py", "x = 1\n\n")
+    write_text(src / "README.md", "# readme\n")
+    write_text(src / "docs" / "a.md", "doc\n")
+    write_text(src / "conf.yaml", "k: v\n")
+    write_bytes(src / "blob.bin", b"\x00\x01")
+    options = dict(include_metadata=False, sort_files=True, read_workers=workers, dedup_files=True)
+    targets = [("*.py", src / "out" / "py.txt"), ("*.md", src / "out" / "md.txt"), ("a.*", tmp_path / "a.txt.gz")]
+
+    walks = []
+    real_find = mg.FileSystemWalker.find_files
+    monkeypatch.setattr(mg.FileSystemWalker, "find_files", lambda self, *a, **kw: (walks.append(1), real_find(self, *a, **kw))[1])
+    merger = mg.SmartFileMerger(make_config(src, targets=targets, **options))
+    assert merger.merge() is True
+    assert len(walks) == 1
+
+    for pattern, output in targets:
+        single = tmp_path / "single" / output.name
+        assert mg.SmartFileMerger(make_config(src, include_pattern=pattern, output_file=single, **options)).merge()
+        if output.suffix == ".gz":
+            assert gzip.decompress(output.read_bytes()) == gzip.decompress(single.read_bytes())
+        else:
+            assert output.read_bytes() == single.read_bytes()
+    # Outputs of one target are never merged into another
+    is_own = merger._own_outputs()
+    assert all(is_own(output.resolve()) for _pattern, output in targets)
+    assert not is_own((src / "a.py").resolve())
+    assert merger.target_stats[str(src / "out" / "py.txt")]["files_processed"] == 2
+    assert merger.stats["files_processed"] == 2 + 2 + 2
+
+
+def test_targets_config_and_cli(monkeypatch, tmp_path):
+    cfg = make_config(tmp_path, targets=[("*.py", "py.txt"), ("*.md", "-")])
+    assert [(c.include_pattern, c.output_file, c.targets) for c in cfg.target_configs()] == [
+        ("*.py", Path("py.txt"), []),
+        ("*.md", Path("-"), []),
+    ]
+    for overrides in (
+        {"targets": [("*.py", "a.txt"), ("*.md", "a.txt")]},
+        {"targets": [("*.md", "-")], "toc": True},
+        {"targets": [("*.md", "a.txt")], "manifest_file": tmp_path / "m.json"},
+        {"targets": [("*.md", "a.txt")], "output_stream": io.BytesIO()},
+    ):
+        with pytest.raises(ValueError):
+            make_config(tmp_path, **overrides)
+
+    assert mg.parse_target_string(" *.py = out/py.txt ") == ("*.py", Path("out/py.txt"))
+    with pytest.raises(ValueError):
+        mg.parse_target_string("*.py")
+
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    write_text(tmp_path / "src" / "a.py", "print(1)\n")
+    write_text(tmp_path / "src" / "b.md", "text\n")
+    out = tmp_path / "out"
+    rc = mg.main([str(tmp_path / "src"), "--no-metadata", "--no-headers", "-t", f"*.py={out / 'py.txt'}", "-t", f"*.md={out / 'md.txt'}"])
+    assert rc == 0
+    assert (out / "py.txt").read_text(encoding="utf-8") == "print(1)\n\n"
+    assert (out / "md.txt").read_text(encoding="utf-8") == "text\n\n"
+    assert not (tmp_path / "merged_output.txt").exists()
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_toc_offsets_and_extract_file(monkeypatch, tmp_path, workers):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    # Line ranges are counted in blocks that straddle sections
+    monkeypatch.setattr(mg, "_COMPRESS_CHUNK", 7)
+    src = tmp_path / "src"
+    make_passthrough_tree(src)
+    write_text(src / "sub" / "numbered.txt", "one\n\ntwo\n")
+
+    out = tmp_path / "merged.txt"
+    cfg = make_config(src, output_file=out, sort_files=True, toc=True, read_workers=workers)
+    assert mg.SmartFileMerger(cfg).merge() is True
+
+    toc = mg.load_toc(out)
+    assert toc["output"] == "merged.txt"
+    assert len(toc["files"]) == 11
+    data = out.read_bytes()
+    lines = out.read_text(encoding="utf-8").split("\n")
+    for entry in toc["files"]:
+        content = data[entry["content_offset"] : entry["content_offset"] + entry["content_length"]].decode("utf-8")
+        assert mg.extract_file(out, entry["path"], toc=toc) == content
+        assert data[entry["offset"] : entry["content_offset"]].decode("utf-8").startswith(f"\n{cfg.file_separator}\nFILE ")
+        covered = lines[entry["first_line"] - 1 : entry["last_line"]]
+        assert "".join(line + "\n" for line in covered) == content.replace("\r\n", "\n")
+
+    assert mg.extract_file(out, "sub/numbered.txt") == "one\n\ntwo\n"
+    assert mg.extract_file(out, "lone_cr.txt") == "a\r\nb\n"
+    with pytest.raises(KeyError):
+        mg.extract_file(out, "missing.txt")
+
+    # The table of contents is not merged on the next run; a changed output makes it stale
+    assert mg.toc_path(out) not in mg.SmartFileMerger(cfg).find_files()
+    out.write_bytes(data + b"x")
+    with pytest.raises(ValueError):
+        mg.load_toc(out)
+
+
+def test_toc_for_shards(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    write_text(src / "a.txt", "alpha\n")
+    write_text(src / "b.txt", "".join(f"row {j}\n" for j in range(9)))
+
+    out = tmp_path / "merged.txt"
+    cfg = make_config(src, output_file=out, sort_files=True, toc=True, shard_max_lines=5, shard_split_files=True)
+    assert mg.SmartFileMerger(cfg).merge() is True
+
+    parts = [cfg.shard_path(k) for k in (1, 2, 3)]
+    assert [mg.load_toc(p)["files"][-1]["path"] for p in parts] == ["a.txt", "b.txt", "b.txt"]
+    assert mg.load_toc(parts[2])["files"][0]["part"] == [2, 2]
+    assert mg.extract_file(parts[1], "b.txt") + mg.extract_file(parts[2], "b.txt") == "".join(
+        f"row {j}\n" for j in range(9)
+    )
+    assert not mg.toc_path(out).exists()
+
+    with pytest.raises(ValueError):
+        make_config(src, output_file=tmp_path / "merged.txt.gz", toc=True)
+
+
+def test_dedup_files_in_shards_refer_within_the_shard(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    for name in ("f1", "f2", "f3", "f4"):
+        write_text(src / "a" / f"{name}.py", f"{name} = 1\n")
+    write_text(src / "b" / "dup.py", "shared = 1\n")
+    write_text(src / "c" / "dup.py", "shared = 1\n")
+    write_text(src / "d" / "dup.py", "shared = 1\n")
+    files = ["a/f1.py", "b/dup.py", "a/f2.py", "a/f3.py", "c/dup.py", "d/dup.py", "a/f4.py"]
+
+    out = tmp_path / "merged.txt"
+    cfg = make_config(src, output_file=out, toc=True, dedup_files=True, shard_max_files=3)
+    merger = mg.SmartFileMerger(cfg)
+    merger._resolve_roots()
+    merger._walker.find_files = lambda roots, recursive=True: [src / f for f in files]
+    assert merger.merge() is True
+
+    # b/dup.py is in part001; part002 writes c/dup.py in full and d/dup.py refers to it
+    part2 = mg.load_toc(cfg.shard_path(2))["files"]
+    assert [(e["path"], e.get("duplicate_of")) for e in part2] == [
+        ("a/f3.py", None),
+        ("c/dup.py", None),
+        ("d/dup.py", "c/dup.py"),
+    ]
+    for k, rel in ((2, "d/dup.py"), (2, "c/dup.py"), (3, "a/f4.py")):
+        assert mg.extract_file(cfg.shard_path(k), rel) == (src / rel).read_text(encoding="utf-8")
+    assert merger.stats["files_deduplicated"] == 1
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_dedup_files_writes_each_content_once(monkeypatch, tmp_path, workers):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    write_text(src / "a.txt", "shared body\n")
+    write_text(src / "vendor" / "a.txt", "shared body\n")
+    write_text(src / "vendor" / "b.txt", "other body\n")
+    write_text(src / "z.txt", "shared body\n")
+    write_text(src / "empty1.txt", "")
+    write_text(src / "empty2.txt", "")
+    age_files(src)
+
+    out = tmp_path / "merged.txt"
+    cache = tmp_path / "hashes.json"
+    cfg = make_config(src, output_file=out, sort_files=True, toc=True, hash_cache_file=cache, read_workers=workers)
+    assert cfg.dedup_files is True
+    merger = mg.SmartFileMerger(cfg)
+    assert merger.merge() is True
+
+    text = out.read_text(encoding="utf-8")
+    assert text.count("shared body") == 1
+    assert "[DUPLICATE: same content as FILE 1: a.txt]" in text
+    assert text.count("[DUPLICATE:") == 2
+    assert "dedup_files: True (2 duplicates)" in text
+    assert merger.stats["files_deduplicated"] == 2
+    assert merger.stats["files_processed"] == 6
+    assert mg.extract_file(out, "vendor/a.txt") == "shared body\n"
+
+    # Only same-size files are hashed; digests are reused on the next run
+    assert sorted(len(rec) for rec in json.loads(cache.read_text())["files"].values()) == [3, 3, 3]
+    monkeypatch.setattr(mg.FileHashCache, "digest", lambda self, p, st=None: pytest.fail("rehashed"))
+    monkeypatch.setattr(mg.FileHashCache, "load", classmethod(lambda cls, path, chunk_size=0: CachedOnly(path)))
+    assert mg.SmartFileMerger(cfg).merge() is True
+    assert out.read_text(encoding="utf-8").split("MERGE COMPLETE")[0].count("[DUPLICATE:") == 2
+
+
+class CachedOnly:
+    """FileHashCache stand-in that only answers from the cache file."""
+
+    def __init__(self, path):
+        self.files = json.loads(Path(path).read_text())["files"]
+        self.stats = {"hashed": 0, "reused": 0}
+
+    def digest(self, path, st=None, *, opener=None):
+        st = st or path.stat()
+        rec = self.files[f"{st.st_dev}:{st.st_ino}"]
+        assert rec[:2] == [st.st_mtime_ns, st.st_size]
+        self.stats["reused"] += 1
+        return rec[2]
+
+    def save(self):
+        return True
+
+
+def test_invalid_read_workers(tmp_path):
+    with pytest.raises(ValueError, match="read_workers must be at least 1"):
+        make_config(tmp_path, read_workers=0)
+
+
+def test_stream_files_falls_back_when_headers_enabled(tmp_path):
+    cfg = make_config(tmp_path, stream_files=True, include_metadata=False, include_headers=True)
+    assert mg.SmartFileMerger(cfg).can_stream() is False
+
+
+def test_stream_files_no_files_returns_false(tmp_path):
+    (tmp_path / "empty").mkdir()
+    out = tmp_path / "merged.txt"
+    cfg = make_config(
+        tmp_path / "empty", output_file=out, include_metadata=False, include_headers=False, stream_files=True
+    )
+    assert mg.SmartFileMerger(cfg).merge() is False
+    assert not out.exists()
+
+
 # =============================================================================
 # binary behavior
 # =============================================================================
@@ -338,7 +1308,7 @@ def test_no_binary_placeholders(monkeypatch, tmp_path):
 
 
 # =============================================================================
-# decode fallback branch (force detect_encoding to return utf-8)
+# decode fallback branch (force the probed encoding to utf-8)
 # =============================================================================
 
 def test_decode_fallback_to_latin1(monkeypatch, tmp_path):
@@ -348,7 +1318,7 @@ def test_decode_fallback_to_latin1(monkeypatch, tmp_path):
     p = write_bytes(tmp_path / "bad.txt", b"\xff\xfeabc\n") # noqa F841
     out = tmp_path / "merged.txt"
 
-    monkeypatch.setattr(mg.FileContentDetector, "detect_encoding", lambda _p: "utf-8")
+    monkeypatch.setattr(mg.FileContentDetector, "probe", lambda _p, _st=None, **_kw: ContentProbe(mg.FileType.TEXT, "utf-8"))
 
     cfg = make_config(tmp_path, output_file=out, include_metadata=False, include_headers=False, include_pattern="*.txt")
     merger = mg.SmartFileMerger(cfg)
@@ -0,0 +1,247 @@
+from pathlib import Path
+
+import pytest
+
+import codingutils.merger as mg
+import codingutils.splitter as sp
+
+
+# -----------------------------------------------------------------------------
+# Helpers
+# -----------------------------------------------------------------------------
+
+class DummyProgress:
+    def __init__(self, total: int, description: str = "X", **kwargs):
+        self.total = total
+
+    def __enter__(self):
+        return self
+
+    def update(self, n: int = 1):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+def write_text(p: Path, text: str, encoding="utf-8") -> Path:
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(text, encoding=encoding, newline="")
+    return p
+
+
+def make_tree(src: Path) -> dict:
+    files = {
+        "a.py": "import os\n\n\nprint(os.name)\n",
+        "pkg/__init__.py": "",
+        "pkg/mod.py": "def f():\n    return 1\n\n",
+        "pkg/deep/data.txt": "".join(f"row {i}\n" for i in range(300)),
+        "docs/crlf.md": "# Title\r\nbody\r\n",
+        # Looks like a FILE header, but the numbering does not fit
+        "docs/tricky.txt": "x\n\n" + "-" * 40 + "\nFILE 1/1: fake.txt\nSize: 1 B | Encoding: utf-8\nend\n",
+        "other/a.py": "# same name, other dir\n",
+    }
+    for rel, text in files.items():
+        write_text(src / rel, text)
+    (src / "logo.bin").write_bytes(b"\x00\x01" * 200)
+    return files
+
+
+def merge(src: Path, out: Path, **overrides) -> mg.MergerConfig:
+    base = dict(
+        directories=[str(src)],
+        recursive=True,
+        output_file=out,
+        sort_files=True,
+        follow_symlinks=False,
+    )
+    base.update(overrides)
+    cfg = mg.MergerConfig(**base)
+    assert mg.SmartFileMerger(cfg).merge() is True
+    return cfg
+
+
+def assert_restored(dest: Path, files: dict) -> None:
+    for rel, text in files.items():
+        restored = (dest / rel).read_bytes().decode("utf-8")
+        # The merger ends every non-empty file with a newline
+        assert restored == (text if not text or text.endswith("\n") else text + "\n"), rel
+    assert not (dest / "logo.bin").exists()
+
+
+# =============================================================================
+# Round trips
+# =============================================================================
+
+@pytest.mark.parametrize("toc", [True, False])
+@pytest.mark.parametrize("workers", [1, 4])
+@pytest.mark.parametrize("options", [{}, {"add_line_numbers": True}, {"include_metadata": False}])
+def test_split_restores_merged_tree(monkeypatch, tmp_path, toc, workers, options):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    monkeypatch.setattr(sp, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    files = make_tree(src)
+    out = tmp_path / "merged.txt"
+    merge(src, out, toc=toc, **options)
+
+    dest = tmp_path / "restored"
+    cfg = sp.SplitterConfig(inputs=[out], output_dir=dest, write_workers=workers, read_buffer_size=256)
+    splitter = sp.MergedFileSplitter(cfg)
+    assert splitter.split() is True
+
+    assert_restored(dest, files)
+    assert splitter.stats["files_restored"] == len(files)
+    assert splitter.stats["files_skipped_placeholder"] == 1
+
+
+def test_split_compact_headers_and_line_numbers_without_toc(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    files = make_tree(src)
+    out = tmp_path / "merged.txt"
+    merge(src, out, compact_file_headers=True, add_line_numbers=True)
+
+    # Paths come from the metadata FILE LIST
+    dest = tmp_path / "restored"
+    assert sp.MergedFileSplitter(sp.SplitterConfig(inputs=[out], output_dir=dest)).split() is True
+    assert_restored(dest, files)
+
+    # Without metadata only names are known; same names are kept apart
+    merge(src, out, compact_file_headers=True, add_line_numbers=True, include_metadata=False)
+    flat = tmp_path / "flat"
+    cfg = sp.SplitterConfig(inputs=[out], output_dir=flat, line_numbers=True, compact_file_headers=True)
+    assert sp.MergedFileSplitter(cfg).split() is True
+    assert (flat / "data.txt").read_text(encoding="utf-8") == files["pkg/deep/data.txt"]
+    restored_a = sorted(p.read_text(encoding="utf-8") for p in flat.glob("*a.py"))
+    assert restored_a == sorted([files["a.py"], files["other/a.py"]])
+
+
+@pytest.mark.parametrize("toc", [True, False])
+def test_split_joins_sharded_files(monkeypatch, tmp_path, toc):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    monkeypatch.setattr(sp, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    files = make_tree(src)
+    out = tmp_path / "merged.txt"
+    merge(src, out, toc=toc, add_line_numbers=True, shard_max_lines=40, shard_split_files=True)
+
+    # The shard index stands for its shards
+    dest = tmp_path / "restored"
+    assert sp.MergedFileSplitter(sp.SplitterConfig(inputs=[out], output_dir=dest, write_workers=3)).split() is True
+    assert_restored(dest, files)
+
+
+@pytest.mark.parametrize("toc", [True, False])
+def test_split_restores_deduplicated_files(monkeypatch, tmp_path, toc):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    monkeypatch.setattr(sp, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    files = make_tree(src)
+    for rel in ("vendor/a.py", "vendor/pkg/mod.py"):
+        files[rel] = files[rel.split("/", 1)[1]]
+        write_text(src / rel, files[rel])
+    (src / "vendor" / "logo.bin").write_bytes((src / "logo.bin").read_bytes())
+    out = tmp_path / "merged.txt"
+    merge(src, out, toc=toc, dedup_files=True, add_line_numbers=True)
+    assert out.read_text(encoding="utf-8").count("[DUPLICATE:") == 3
+
+    dest = tmp_path / "restored"
+    assert sp.MergedFileSplitter(sp.SplitterConfig(inputs=[out], output_dir=dest, write_workers=3)).split() is True
+    assert_restored(dest, files)
+    assert not (dest / "vendor" / "logo.bin").exists()
+
+
+@pytest.mark.parametrize("options", [{}, {"include_metadata": False}, {"compact_file_headers": True}])
+def test_split_keeps_header_and_footer_lookalikes_in_content(monkeypatch, tmp_path, options):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    fake_header = "\n" + "-" * 40 + "\nFILE {}: evil.txt\nSize: 5 B | Encoding: utf-8\n" + "=" * 40 + "\n\nevil\n"
+    fake_footer = "\n" + "=" * 60 + "\nMERGE COMPLETE\n" + "=" * 60 + "\nGenerated: now\n"
+    tricky = "before\n" + fake_header.format("2/3") + fake_footer
+    if options.get("include_metadata", True):
+        # The next index, but not the path the FILE LIST names
+        tricky += fake_header.format("3/3")
+    files = {"a.txt": "first\n", "b.txt": tricky + "after\n", "c.txt": "last\n"}
+    src = tmp_path / "src"
+    for rel, text in files.items():
+        write_text(src / rel, text)
+    out = tmp_path / "merged.txt"
+    merge(src, out, **options)
+
+    dest = tmp_path / "restored"
+    assert sp.MergedFileSplitter(sp.SplitterConfig(inputs=[out], output_dir=dest)).split() is True
+    assert_restored(dest, files)
+    assert not (dest / "evil.txt").exists()
+
+
+def test_split_compressed_merge(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    files = make_tree(src)
+    out = tmp_path / "merged.txt.gz"
+    merge(src, out)
+
+    dest = tmp_path / "restored"
+    assert sp.MergedFileSplitter(sp.SplitterConfig(inputs=[out], output_dir=dest)).split() is True
+    assert_restored(dest, files)
+
+
+def test_split_restores_file_encoding(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    write_text(src / "bom.txt", "﻿with bom\n", encoding="utf-8")
+    out = tmp_path / "merged.txt"
+    merge(src, out, toc=True)
+
+    dest = tmp_path / "restored"
+    assert sp.MergedFileSplitter(sp.SplitterConfig(inputs=[out], output_dir=dest)).split() is True
+    assert (dest / "bom.txt").read_bytes() == (src / "bom.txt").read_bytes()
+
+
+# =============================================================================
+# Safety / errors
+# =============================================================================
+
+def test_split_keeps_existing_files_and_refuses_escaping_paths(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    merged = write_text(
+        tmp_path / "merged.txt",
+        "\n" + "-" * 40 + "\nFILE 1/2: ../evil.txt\nSize: 4 B | Encoding: utf-8\n" + "=" * 40 + "\n\nbad\n\n"
+        + "\n" + "-" * 40 + "\nFILE 2/2: keep.txt\nSize: 4 B | Encoding: utf-8\n" + "=" * 40 + "\n\nnew\n\n",
+    )
+    dest = tmp_path / "restored"
+    write_text(dest / "keep.txt", "old\n")
+
+    splitter = sp.MergedFileSplitter(sp.SplitterConfig(inputs=[merged], output_dir=dest))
+    assert splitter.split() is False
+    assert not (tmp_path / "evil.txt").exists()
+    assert (dest / "keep.txt").read_text(encoding="utf-8") == "old\n"
+    assert splitter.stats["files_skipped_existing"] == 1
+
+    cfg = sp.SplitterConfig(inputs=[merged], output_dir=dest, overwrite=True)
+    sp.MergedFileSplitter(cfg).split()
+    assert (dest / "keep.txt").read_text(encoding="utf-8") == "new\n"
+
+
+def test_split_without_headers_fails(tmp_path):
+    merged = write_text(tmp_path / "merged.txt", "just\ncontent\n")
+    assert sp.MergedFileSplitter(sp.SplitterConfig(inputs=[merged], output_dir=tmp_path / "r")).split() is False
+
+
+def test_splitter_config_validation(tmp_path):
+    with pytest.raises(ValueError):
+        sp.SplitterConfig(inputs=[])
+    with pytest.raises(ValueError):
+        sp.SplitterConfig(inputs=[tmp_path / "m.txt"], write_workers=0)
+
+
+def test_splitter_main(monkeypatch, tmp_path):
+    monkeypatch.setattr(mg, "ProgressReporter", DummyProgress)
+    src = tmp_path / "src"
+    files = make_tree(src)
+    out = tmp_path / "merged.txt"
+    merge(src, out, add_line_numbers=True)
+
+    dest = tmp_path / "restored"
+    assert sp.main([str(out), "-o", str(dest), "--no-toc", "--workers", "2", "--read-buffer", "1KB"]) == 0
+    assert_restored(dest, files)
+    assert sp.main([str(tmp_path / "missing.txt"), "-o", str(dest)]) == 1
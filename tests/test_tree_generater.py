@@ -241,6 +241,54 @@ def test_metadata_permissions_mtime_filetype(tmp_path):
     assert_ascii_only(out)
 
 
+def test_scandir_and_pathlib_engines_render_same_tree(tmp_path):
+    root = make_sample_tree(tmp_path)
+
+    outputs = []
+    for engine in ("scandir", "pathlib"):
+        cfg = make_config(root, show_size=True, show_hidden=True, include_statistics=True, walk_engine=engine)
+        builder = tg.TreeBuilder(cfg, gitignore=None)
+        node = builder.build([root])
+        outputs.append((tg.JsonRenderer(cfg)._node(node), builder.stats["files"], builder.stats["total_size"]))
+
+    assert outputs[0] == outputs[1]
+
+
+def test_parallel_scanner_renders_same_tree(tmp_path):
+    root = make_sample_tree(tmp_path)
+
+    for max_depth in (None, 1):
+        outputs = []
+        for workers in (1, 4):
+            cfg = make_config(root, show_size=True, max_depth=max_depth, include_statistics=True, walk_workers=workers)
+            builder = tg.TreeBuilder(cfg, gitignore=None)
+            node = builder.build([root])
+            stats = {k: v for k, v in builder.stats.items() if k not in {"start_time", "end_time"}}
+            outputs.append((tg.JsonRenderer(cfg)._node(node), stats))
+
+        assert outputs[0] == outputs[1]
+
+
+def test_walk_snapshot_reuses_listings(tmp_path):
+    root = make_sample_tree(tmp_path / "proj")
+    snapshot_file = tmp_path / "tree-snapshot.json"
+    past = os.stat(root).st_mtime_ns - 3600 * 10**9
+    for d in [root, *(p for p in root.rglob("*") if p.is_dir())]:
+        os.utime(d, ns=(past, past))
+
+    results = []
+    for _ in range(2):
+        cfg = make_config(root, show_size=True, show_hidden=True, include_statistics=True, walk_snapshot=snapshot_file)
+        builder = tg.TreeBuilder(cfg, gitignore=None)
+        node = builder.build([root])
+        stats = {k: v for k, v in builder.stats.items() if k not in {"start_time", "end_time"}}
+        results.append((tg.JsonRenderer(cfg)._node(node), stats, dict(builder.snapshot.stats)))
+
+    assert results[0][:2] == results[1][:2]
+    assert results[0][2]["reused"] == 0
+    assert results[1][2] == {"reused": results[0][2]["rescanned"], "rescanned": 0}
+
+
 # =============================================================================
 # Gitignore integration
 # =============================================================================